@@ -0,0 +1,83 @@
+""" Time the sweep-line overlap join on synthetic frac schedules, checking it
+    against a naive pairwise comparison on a subset.
+
+    usage: python scripts/bench_overlaps.py [nrows] [max_distance]
+"""
+import os
+import sys
+from timeit import default_timer as timer
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir, "src", "fracx"))
+
+from analysis.intervals import ordinals  # noqa
+from analysis.overlaps import overlapping_pairs  # noqa
+from analysis.proximity import haversine  # noqa
+
+
+def synthetic_frame(n: int, seed: int = 0) -> pd.DataFrame:
+    """ Schedules spread over roughly the extent of the Delaware and Midland
+        basins, each lasting up to 40 days within a two year window """
+    rs = np.random.RandomState(seed)
+    shllat = rs.uniform(30.5, 33.0, n)
+    shllon = rs.uniform(-104.5, -101.0, n)
+    start = pd.to_datetime("2020-01-01") + pd.to_timedelta(
+        rs.randint(0, 730, n), unit="D"
+    )
+    return pd.DataFrame(
+        {
+            "api14": [f"42{i:012d}" for i in range(n)],
+            "shllat": shllat,
+            "shllon": shllon,
+            "bhllat": shllat + rs.uniform(-0.03, 0.03, n),
+            "bhllon": shllon + rs.uniform(-0.03, 0.03, n),
+            "frac_start_date": start,
+            "frac_end_date": start + pd.to_timedelta(rs.randint(1, 40, n), unit="D"),
+        }
+    )
+
+
+def naive_pairs(frame: pd.DataFrame, max_distance: float) -> int:
+    """ O(n^2) comparison of every pair, one row at a time """
+    starts = ordinals(frame.frac_start_date)
+    ends = ordinals(frame.frac_end_date)
+    lats, lons = frame.shllat.values, frame.shllon.values
+    count = 0
+    for i in range(len(frame)):
+        j = np.arange(i + 1, len(frame))
+        concurrent = (starts[j] <= ends[i]) & (starts[i] <= ends[j])
+        near = haversine(lats[i], lons[i], lats[j], lons[j]) <= max_distance
+        count += int((concurrent & near).sum())
+    return count
+
+
+def timed(fn, *args, **kwargs):
+    ts = timer()
+    result = fn(*args, **kwargs)
+    return result, timer() - ts
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    max_distance = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    subset = min(n, 10000)
+
+    frame = synthetic_frame(n)
+    sample = frame.iloc[:subset]
+
+    sweep_sample, sweep_sample_time = timed(overlapping_pairs, sample, max_distance)
+    naive_sample, naive_sample_time = timed(naive_pairs, sample, max_distance)
+    assert len(sweep_sample) == naive_sample, (len(sweep_sample), naive_sample)
+
+    pairs, sweep_time = timed(overlapping_pairs, frame, max_distance)
+    laterals, lateral_time = timed(
+        overlapping_pairs, frame, max_distance, method="lateral"
+    )
+
+    print(f"{'distance:':>18} {max_distance} mi")
+    print(f"{f'naive ({subset}):':>18} {naive_sample_time:.2f}s")
+    print(f"{f'sweep ({subset}):':>18} {sweep_sample_time:.2f}s ({naive_sample} pairs)")
+    print(f"{f'sweep ({n}):':>18} {sweep_time:.2f}s ({len(pairs)} pairs)")
+    print(f"{f'laterals ({n}):':>18} {lateral_time:.2f}s ({len(laterals)} pairs)")
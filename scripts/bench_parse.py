@@ -0,0 +1,155 @@
+""" Time the extraction and transformation of a synthetic export on 1, 2, 4, ...
+    parse workers, to check that it scales on this host before raising
+    FRACX_PARSE_WORKERS.
+
+    usage: python scripts/bench_parse.py [nrows] [max_workers]
+"""
+import io
+import os
+import random
+import sys
+import zipfile
+from timeit import default_timer as timer
+
+import xlrd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir, "src", "fracx"))
+
+from api.models import FracSchedule  # noqa
+from api.records import record_type_for  # noqa
+from collector import compiler  # noqa
+from collector.filehandler import BytesFileHandler  # noqa
+from collector.transformer import Transformer  # noqa
+
+HEADER = [
+    "Region",
+    "Operator",
+    "Well Name",
+    "Well API",
+    "Frac Start Date",
+    "Frac End Date",
+    "Surface Lat",
+    "Surface Long",
+    "Bottomhole Lat",
+    "Bottomhole Long",
+    "TVD",
+    "Target Formation",
+]
+
+SHEET_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/'
+        'vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/'
+        'vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/'
+        'vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        "</Types>"
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/'
+        'relationships"><Relationship Id="rId1" Target="xl/workbook.xml"'
+        ' Type="http://schemas.openxmlformats.org/officeDocument/2006/'
+        'relationships/officeDocument"/></Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+        ' xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/'
+        'relationships"><sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/>'
+        "</sheets></workbook>"
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/'
+        'relationships"><Relationship Id="rId1" Target="worksheets/sheet1.xml"'
+        ' Type="http://schemas.openxmlformats.org/officeDocument/2006/'
+        'relationships/worksheet"/></Relationships>'
+    ),
+}
+
+
+def cell(value) -> str:
+    if isinstance(value, str):
+        return f'<c t="inlineStr"><is><t>{value}</t></is></c>'
+    return f"<c><v>{value}</v></c>"
+
+
+def synthetic_xlsx(n: int) -> bytes:
+    """ Single sheet workbook shaped like the export, dates as excel serials """
+    random.seed(0)
+    rows = [HEADER]
+    for idx in range(n):
+        start = 43831 + random.randint(0, 365)
+        rows.append(
+            [
+                "PMI",
+                f"Operator {idx % 50}",
+                f"Example {idx}H",
+                f"42{idx:012d}",
+                start,
+                start + random.randint(1, 40),
+                31 + random.random(),
+                -102 + random.random(),
+                31 + random.random(),
+                -102 + random.random(),
+                random.randint(5000, 12000),
+                "Wolfcamp B",
+            ]
+        )
+    data = "".join(f"<row>{''.join(cell(v) for v in row)}</row>" for row in rows)
+    sheet = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        f"<sheetData>{data}</sheetData></worksheet>"
+    )
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as z:
+        for name, part in SHEET_PARTS.items():
+            z.writestr(name, part)
+        z.writestr("xl/worksheets/sheet1.xml", sheet)
+    return buffer.getvalue()
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+    endpoint = compiler.load().load_endpoints()["frac_schedules"]
+    tf = Transformer(
+        aliases=endpoint.alias_map,
+        exclude=endpoint.exclude,
+        record_type=record_type_for(FracSchedule),
+    )
+    dates = endpoint.mappings.get("dates")
+    content = synthetic_xlsx(n)
+
+    # the sheet is always parsed in the calling process, so this bounds the speedup
+    ts = timer()
+    xlrd.open_workbook(file_contents=content)
+    parse = timer() - ts
+
+    print(f"{'rows:':>10} {n}")
+    print(f"{'cpus:':>10} {os.cpu_count()}")
+    print(f"{'parse:':>10} {parse:.2f}s (serial)")
+    baseline = None
+    workers = 1
+    while workers <= max_workers:
+        ts = timer()
+        count = sum(
+            1
+            for _ in BytesFileHandler.xlsx_parallel(
+                content, date_columns=dates, transform=tf.transform, workers=workers
+            )
+        )
+        elapsed = timer() - ts
+        assert count == n
+        baseline = baseline or elapsed
+        print(
+            f"{workers:>6} workers: {elapsed:6.2f}s"
+            f" ({n / elapsed:,.0f} rows/s, {baseline / elapsed:.2f}x)"
+        )
+        workers *= 2
@@ -0,0 +1,65 @@
+""" Compare the memory held by transformed frac schedule rows as plain dicts
+    versus compact records.
+
+    usage: python scripts/bench_records.py [nrows]
+"""
+import os
+import random
+import sys
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir, "src", "fracx"))
+
+from api.models import FracSchedule  # noqa
+from api.records import record_type_for  # noqa
+from collector import compiler  # noqa
+from collector.transformer import Transformer  # noqa
+
+
+def synthetic_rows(n: int):
+    """ Raw rows shaped like the PDS export after header normalization """
+    start = datetime(2020, 1, 1)
+    for idx in range(n):
+        frac_start = start + timedelta(days=random.randint(0, 365))
+        yield {
+            "region": "PMI",
+            "operator": f"Operator {idx % 50}",
+            "well_name": f"Example {idx}H",
+            "well_api": f"42{idx:012d}",
+            "frac_start_date": frac_start,
+            "frac_end_date": frac_start + timedelta(days=random.randint(1, 40)),
+            "surface_lat": 31 + random.random(),
+            "surface_long": -102 + random.random(),
+            "bottomhole_lat": 31 + random.random(),
+            "bottomhole_long": -102 + random.random(),
+            "tvd": random.randint(5000, 12000),
+            "target_formation": "Wolfcamp B",
+            "comments": "",
+        }
+
+
+def measure(tf: Transformer, n: int) -> int:
+    random.seed(0)
+    tracemalloc.start()
+    rows = [tf.transform(row) for row in synthetic_rows(n)]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del rows
+    return current
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    endpoint = compiler.load().load_endpoints()["frac_schedules"]
+    params = {"aliases": endpoint.alias_map, "exclude": endpoint.exclude}
+
+    as_dicts = measure(Transformer(**params), n)
+    as_records = measure(
+        Transformer(**params, record_type=record_type_for(FracSchedule)), n
+    )
+
+    print(f"{'rows:':>10} {n}")
+    print(f"{'dicts:':>10} {as_dicts / 2**20:.1f} MiB")
+    print(f"{'records:':>10} {as_records / 2**20:.1f} MiB")
+    print(f"{'saved:':>10} {1 - as_records / as_dicts:.0%}")
@@ -27,6 +27,10 @@ def create_app(script_info=None):
     # set up extensions
     db.init_app(app)
 
+    from api.views import blueprint
+
+    app.register_blueprint(blueprint)
+
     # shell context for flask cli
     @app.shell_context_processor
     def ctx():
@@ -0,0 +1,7 @@
+# flake8: noqa
+from analysis.intervals import IntervalIndex
+from analysis.overlaps import overlapping_pairs
+from analysis.proximity import ProximityIndex
+from analysis.sticks import lateral_distances
+from analysis.snapshot import ScheduleSnapshot, SnapshotCache
+from analysis.watchlist import WatchlistIndex
@@ -0,0 +1,152 @@
+from typing import List, Optional, Tuple, Union
+from datetime import date
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+DateLike = Union[date, str, pd.Timestamp]
+
+
+def to_ordinal(value: DateLike) -> int:
+    return pd.Timestamp(value).toordinal()
+
+
+def ordinals(values: pd.Series) -> np.ndarray:
+    """ Proleptic ordinals of a date column, with -1 for missing dates """
+    days = pd.to_datetime(values).to_numpy(dtype="datetime64[D]")
+    return np.where(np.isnat(days), -1, days.astype(np.int64) + _EPOCH_ORDINAL)
+
+
+def from_ordinals(values: np.ndarray) -> pd.Series:
+    """ Dates from proleptic ordinals; the inverse of ordinals() """
+    days = np.asarray(values, dtype=np.int64) - _EPOCH_ORDINAL
+    return pd.Series(days.astype("datetime64[D]")).dt.date
+
+
+class IntervalIndex(object):
+    """ Static centered interval tree over closed [start, end] day intervals.
+
+        Each node holds the intervals containing its center twice: sorted by
+        start and sorted by descending end. Intervals entirely before the center
+        go to the left child, those entirely after it to the right. An overlap
+        query visits O(log n) nodes, bisecting each, and slices out the k
+        matching ids, so it runs in O(log n + k).
+
+        Ids are positions in the arrays the index was built from. Intervals with a
+        missing start (negative ordinal) are not indexed; a missing end is
+        treated as a single day.
+    """
+
+    def __init__(self, starts: np.ndarray, ends: np.ndarray):
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        ends = np.where(ends < 0, starts, np.maximum(starts, ends))
+        self.size = len(starts)
+        self.starts = starts
+        self.ends = ends
+
+        self._centers: List[int] = []
+        self._children: List[List[int]] = []
+        self._spans: List[Tuple[int, int]] = []
+        by_start: List[np.ndarray] = []
+        by_end: List[np.ndarray] = []
+
+        ids = np.flatnonzero(starts >= 0)
+        stack = [(ids, -1, 0)] if len(ids) else []
+        offset = 0
+        while stack:
+            ids, parent, side = stack.pop()
+            node = len(self._centers)
+            if parent >= 0:
+                self._children[parent][side] = node
+
+            s, e = starts[ids], ends[ids]
+            # the median endpoint is itself an endpoint, so every node is non-empty
+            endpoints = np.concatenate([s, e])
+            mid = len(endpoints) // 2
+            center = int(np.partition(endpoints, mid)[mid])
+            here = (s <= center) & (e >= center)
+
+            node_ids = ids[here]
+            by_start.append(node_ids[np.argsort(s[here], kind="stable")])
+            by_end.append(node_ids[np.argsort(-e[here], kind="stable")])
+            self._centers.append(center)
+            self._children.append([-1, -1])
+            self._spans.append((offset, offset + len(node_ids)))
+            offset += len(node_ids)
+
+            left, right = ids[e < center], ids[s > center]
+            if len(left):
+                stack.append((left, node, 0))
+            if len(right):
+                stack.append((right, node, 1))
+
+        empty = np.empty(0, dtype=np.int64)
+        self._by_start = np.concatenate(by_start) if by_start else empty
+        self._by_end = np.concatenate(by_end) if by_end else empty
+        self._start_keys = self.starts[self._by_start]
+        self._end_keys = -self.ends[self._by_end]  # ascending for searchsorted
+
+    def __repr__(self):
+        return f"IntervalIndex: {len(self._by_start)} intervals, {len(self)} nodes"
+
+    def __len__(self):
+        return len(self._centers)
+
+    @classmethod
+    def from_frame(
+        cls,
+        frame: pd.DataFrame,
+        start_column: str = "frac_start_date",
+        end_column: str = "frac_end_date",
+    ) -> "IntervalIndex":
+        return cls(ordinals(frame[start_column]), ordinals(frame[end_column]))
+
+    def overlapping(
+        self, start: Optional[DateLike] = None, end: Optional[DateLike] = None
+    ) -> np.ndarray:
+        """ Sorted ids of the intervals overlapping [start, end]. Either bound may
+            be omitted to leave that side of the window open. """
+        lo = to_ordinal(start) if start is not None else np.iinfo(np.int64).min
+        hi = to_ordinal(end) if end is not None else np.iinfo(np.int64).max
+        if lo > hi or not self._centers:
+            return np.empty(0, dtype=np.int64)
+
+        found = []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            center = self._centers[node]
+            first, last = self._spans[node]
+            left, right = self._children[node]
+
+            if hi < center:  # only intervals starting on or before hi
+                k = np.searchsorted(self._start_keys[first:last], hi, side="right")
+                found.append(self._by_start[first : first + k])
+                nxt = (left,)
+            elif lo > center:  # only intervals ending on or after lo
+                k = np.searchsorted(self._end_keys[first:last], -lo, side="right")
+                found.append(self._by_end[first : first + k])
+                nxt = (right,)
+            else:  # the window contains the center: every interval here overlaps
+                found.append(self._by_start[first:last])
+                nxt = (left, right)
+
+            stack.extend(child for child in nxt if child >= 0)
+
+        return np.sort(np.concatenate(found)) if found else np.empty(0, np.int64)
+
+    def active_on(self, day: DateLike) -> np.ndarray:
+        return self.overlapping(day, day)
+
+    def mask(
+        self, start: Optional[DateLike] = None, end: Optional[DateLike] = None
+    ) -> np.ndarray:
+        mask = np.zeros(self.size, dtype=bool)
+        mask[self.overlapping(start, end)] = True
+        return mask
@@ -0,0 +1,186 @@
+from typing import Dict, List, Set, Tuple
+import heapq
+import logging
+import math
+
+import numpy as np
+import pandas as pd
+
+from analysis.intervals import from_ordinals, ordinals
+from analysis.proximity import haversine
+from analysis.sticks import Sticks, project, segment_distance
+from config import get_active_config
+
+logger = logging.getLogger(__name__)
+
+conf = get_active_config()
+
+METHODS = ("shl", "lateral")
+
+PAIR_COLUMNS = [
+    "a",
+    "b",
+    "distance",
+    "overlap_start",
+    "overlap_end",
+    "overlap_days",
+]
+
+
+def overlapping_pairs(
+    frame: pd.DataFrame,
+    max_distance: float = 1.0,
+    method: str = "shl",
+    cell_miles: float = None,
+    max_lateral: float = None,
+) -> pd.DataFrame:
+    """ Pairs of schedules that are active at the same time and within
+        max_distance miles of each other.
+
+        Schedules are swept in order of frac_start_date. The active set holds the
+        schedules that have started but not yet ended, bucketed by the grid cell
+        of their location, with a heap on frac_end_date to evict them.
+        Each schedule is only compared with the active schedules in the cells
+        around it, giving O(n log n + k) for k candidate pairs rather than the
+        O(n^2) of a self join.
+
+        method="shl" measures between surface locations (haversine miles);
+        method="lateral" measures between SHL-BHL sticks, bucketed by their
+        midpoints and searched out to max_distance plus the longest lateral so
+        no pair is missed. Laterals longer than max_lateral miles (usually bad
+        locations) would widen that search for every schedule, so they are
+        left out of the grid instead and compared with every active schedule.
+
+        Returns row positions a and b (a started first, or at the same time),
+        the distance, and the shared date range.
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}")
+
+    frame = frame.reset_index(drop=True)
+    starts = ordinals(frame["frac_start_date"])
+    ends = ordinals(frame["frac_end_date"])
+    ends = np.where(ends < 0, starts, np.maximum(starts, ends))
+
+    lats = frame["shllat"].to_numpy(dtype=float)
+    lons = frame["shllon"].to_numpy(dtype=float)
+    valid = (starts >= 0) & ~(np.isnan(lats) | np.isnan(lons))
+    lat0 = float(lats[valid].mean()) if valid.any() else 0.0
+
+    if method == "lateral":
+        # bucket sticks by their midpoints: two sticks within max_distance have
+        # midpoints within max_distance plus half of each of their lengths
+        sticks = Sticks(frame, lat0)
+        x, y = (sticks.x0 + sticks.x1) / 2, (sticks.y0 + sticks.y1) / 2
+        max_lateral = max_lateral or conf.ANALYSIS_MAX_LATERAL_MILES
+        outlier = valid & (sticks.lengths > max_lateral)
+        if outlier.any():
+            logger.warning(
+                f"overlapping_pairs: {outlier.sum()} laterals are longer than"
+                f" {max_lateral} miles and are compared with every active schedule"
+            )
+        inlier = valid & ~outlier
+        longest = float(np.nanmax(sticks.lengths[inlier])) if inlier.any() else 0.0
+        search = max_distance + longest
+    else:
+        # great circle distances: the projection overstates east-west spans
+        # poleward of lat0, so widen the search to match
+        x, y = project(lats, lons, lat0)
+        max_abs_lat = float(np.abs(lats[valid]).max()) if valid.any() else 0.0
+        stretch = math.cos(math.radians(lat0)) / math.cos(math.radians(max_abs_lat))
+        search = max_distance * max(stretch, 1.0)
+        outlier = np.zeros(len(frame), dtype=bool)
+
+    cell_miles = float(cell_miles or max(search, conf.ANALYSIS_CELL_MILES))
+    cx = np.floor(x / cell_miles).astype(np.int64)
+    cy = np.floor(y / cell_miles).astype(np.int64)
+    reach = int(math.ceil(search / cell_miles))
+
+    span = range(-reach, reach + 1)
+    offsets = [(dx, dy) for dx in span for dy in span]
+    buckets: Dict[Tuple[int, int], Set[int]] = {}
+    outliers: Set[int] = set()  # active schedules kept out of the grid
+    heap: List[Tuple[int, int]] = []
+    found_a: List[np.ndarray] = []
+    found_b: List[np.ndarray] = []
+    found_d: List[np.ndarray] = []
+
+    order = np.flatnonzero(valid)
+    order = order[np.argsort(starts[order], kind="stable")]
+    for i in order:
+        start = starts[i]
+        while heap and heap[0][0] < start:  # ended before this one began
+            _, j = heapq.heappop(heap)
+            if outlier[j]:
+                outliers.discard(j)
+            else:
+                buckets[(cx[j], cy[j])].discard(j)
+
+        cell_x, cell_y = cx[i], cy[i]
+        candidates: List[int] = list(outliers)
+        if outlier[i]:
+            for bucket in buckets.values():
+                candidates.extend(bucket)
+        else:
+            for dx, dy in offsets:
+                bucket = buckets.get((cell_x + dx, cell_y + dy))
+                if bucket:
+                    candidates.extend(bucket)
+
+        if candidates:
+            b = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            if method == "lateral":
+                distance = segment_distance(
+                    sticks.x0[i],
+                    sticks.y0[i],
+                    sticks.x1[i],
+                    sticks.y1[i],
+                    sticks.x0[b],
+                    sticks.y0[b],
+                    sticks.x1[b],
+                    sticks.y1[b],
+                )
+            else:
+                distance = haversine(lats[i], lons[i], lats[b], lons[b])
+            near = distance <= max_distance
+            if near.any():
+                found_a.append(b[near])
+                found_b.append(np.full(near.sum(), i, dtype=np.int64))
+                found_d.append(distance[near])
+
+        if outlier[i]:
+            outliers.add(i)
+        else:
+            buckets.setdefault((cell_x, cell_y), set()).add(i)
+        heapq.heappush(heap, (ends[i], i))
+
+    if not found_a:
+        return pd.DataFrame(columns=PAIR_COLUMNS)
+
+    a = np.concatenate(found_a)
+    b = np.concatenate(found_b)
+    # b started on or after a, and a had not ended when b started
+    first = starts[b]
+    last = np.minimum(ends[a], ends[b])
+    result = pd.DataFrame(
+        {
+            "a": a,
+            "b": b,
+            "distance": np.concatenate(found_d),
+            "overlap_start": from_ordinals(first),
+            "overlap_end": from_ordinals(last),
+            "overlap_days": last - first + 1,
+        },
+        columns=PAIR_COLUMNS,
+    )
+    logger.debug(f"overlapping_pairs: {len(result)} pairs of {len(order)} schedules")
+    return result.sort_values(["overlap_start", "a", "b"]).reset_index(drop=True)
+
+
+def attach_pairs(result: pd.DataFrame, frame: pd.DataFrame) -> pd.DataFrame:
+    """ Join both schedules of each pair onto results, prefixed a_ and b_ """
+    frame = frame.reset_index(drop=True)
+    a = frame.iloc[result.a.to_numpy()].reset_index(drop=True).add_prefix("a_")
+    b = frame.iloc[result.b.to_numpy()].reset_index(drop=True).add_prefix("b_")
+    columns = [c for c in PAIR_COLUMNS if c not in ("a", "b")]
+    return pd.concat([result[columns].reset_index(drop=True), a, b], axis=1)
@@ -0,0 +1,288 @@
+from typing import Optional, Sequence, Tuple, Union
+from datetime import date
+import logging
+
+import numpy as np
+import pandas as pd
+
+from analysis.intervals import IntervalIndex
+from config import get_active_config
+
+logger = logging.getLogger(__name__)
+
+conf = get_active_config()
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE = EARTH_RADIUS_MILES * np.pi / 180
+
+# cell coordinates are packed into a single int64 key: (ix + OFFSET) << 32 | iy
+_KEY_OFFSET = 2 ** 30
+_KEY_SHIFT = np.int64(32)
+
+ArrayLike = Union[Sequence[float], np.ndarray, pd.Series]
+
+
+def load_schedules(start: date = None, end: date = None) -> pd.DataFrame:
+    """ Frac schedules with a surface location that are active within the given
+        date window, excluding removed schedules. Requires an application
+        context. """
+    from api.models import FracSchedule
+    from fracx import db
+
+    model = FracSchedule
+    query = db.session.query(*model.__table__.columns).filter(
+        model.shllat.isnot(None),
+        model.shllon.isnot(None),
+        model.removed_at.is_(None),
+    )
+    if start:
+        query = query.filter(model.frac_end_date >= start)
+    if end:
+        query = query.filter(model.frac_start_date <= end)
+
+    frame = pd.read_sql(query.statement, db.session.bind)
+    logger.info(f"Loaded {len(frame)} frac schedules")
+    return frame
+
+
+def haversine(
+    lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray
+) -> np.ndarray:
+    """ Great circle distance in miles between paired arrays of coordinates """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class ProximityIndex(object):
+    """ Uniform grid over the surface and bottom hole locations of a set of frac
+        schedules, answering batched radius and k-nearest queries in miles.
+
+        Coordinates are projected to an equirectangular plane (in miles) centered
+        on the mean latitude of the schedules, which is accurate well within the
+        cell size over a basin sized extent. Candidate points are gathered from
+        the grid and then measured with the haversine formula, so reported
+        distances are exact. A schedule matches a query location if either its
+        SHL or BHL is within range; its distance is the nearer of the two.
+    """
+
+    def __init__(self, frame: pd.DataFrame, cell_miles: float = None):
+        self.frame = frame.reset_index(drop=True)
+        self.cell_miles = float(cell_miles or conf.ANALYSIS_CELL_MILES)
+
+        shl = self.frame[["shllat", "shllon"]].to_numpy(dtype=float)
+        bhl = self.frame[["bhllat", "bhllon"]].to_numpy(dtype=float)
+        rows = np.arange(len(self.frame))
+        points = np.concatenate([shl, bhl])
+        owners = np.concatenate([rows, rows])
+        valid = ~np.isnan(points).any(axis=1)
+        points, owners = points[valid], owners[valid]
+
+        self.lat0 = float(points[:, 0].mean()) if len(points) else 0.0
+        self.max_abs_lat = float(np.abs(points[:, 0]).max()) if len(points) else 0.0
+        self.lon_scale = MILES_PER_DEGREE * np.cos(np.radians(self.lat0))
+
+        keys = self._keys(*self._cells(points[:, 0], points[:, 1]))
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.lats = points[order, 0]
+        self.lons = points[order, 1]
+        self.owners = owners[order]
+
+        dated = {"frac_start_date", "frac_end_date"} <= set(self.frame.columns)
+        self.intervals = IntervalIndex.from_frame(self.frame) if dated else None
+
+    def __repr__(self):
+        return (
+            f"ProximityIndex: {len(self.frame)} schedules, {len(self.keys)} points"
+            f" ({self.cell_miles} mi cells)"
+        )
+
+    def __len__(self):
+        return len(self.frame)
+
+    @classmethod
+    def from_db(
+        cls, start: date = None, end: date = None, cell_miles: float = None
+    ) -> "ProximityIndex":
+        """ Index the schedules active within the given date window. Requires an
+            application context. """
+        return cls(load_schedules(start, end), cell_miles=cell_miles)
+
+    def _cells(self, lats: np.ndarray, lons: np.ndarray) -> Tuple[np.ndarray, ...]:
+        x = lons * self.lon_scale / self.cell_miles
+        y = lats * MILES_PER_DEGREE / self.cell_miles
+        return np.floor(x).astype(np.int64), np.floor(y).astype(np.int64)
+
+    @staticmethod
+    def _keys(ix: np.ndarray, iy: np.ndarray) -> np.ndarray:
+        return ((ix + _KEY_OFFSET) << _KEY_SHIFT) | (iy + _KEY_OFFSET)
+
+    def _active(
+        self, start: Optional[date], end: Optional[date]
+    ) -> Optional[np.ndarray]:
+        """ Mask of schedules overlapping the date window, or None for no filter """
+        if (start is None and end is None) or self.intervals is None:
+            return None
+        return self.intervals.mask(start, end)
+
+    def _candidates(
+        self, lats: np.ndarray, lons: np.ndarray, radius: float
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """ (query, point) index pairs for all points in the grid cells that can
+            contain a point within radius of each query location """
+        ix, iy = self._cells(lats, lons)
+
+        # east-west distances are scaled at lat0, which overstates them poleward
+        # of it. widen the search so no point within radius is missed.
+        finite = np.abs(lats[np.isfinite(lats)])
+        max_abs_lat = max(self.max_abs_lat, float(finite.max(initial=0)))
+        stretch = np.cos(np.radians(self.lat0)) / np.cos(np.radians(max_abs_lat))
+        reach = int(np.ceil(radius * max(stretch, 1.0) / self.cell_miles))
+        queries = np.arange(len(lats))
+
+        qidx, pidx = [], []
+        for dx in range(-reach, reach + 1):
+            for dy in range(-reach, reach + 1):
+                keys = self._keys(ix + dx, iy + dy)
+                left = np.searchsorted(self.keys, keys, side="left")
+                right = np.searchsorted(self.keys, keys, side="right")
+                counts = right - left
+                total = counts.sum()
+                if not total:
+                    continue
+                # expand each [left, right) span into individual point indices
+                offsets = np.repeat(np.cumsum(counts) - counts, counts)
+                qidx.append(np.repeat(queries, counts))
+                pidx.append(np.repeat(left, counts) + np.arange(total) - offsets)
+
+        if not qidx:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty
+        return np.concatenate(qidx), np.concatenate(pidx)
+
+    def _matches(
+        self,
+        lats: np.ndarray,
+        lons: np.ndarray,
+        radius: float,
+        active: Optional[np.ndarray],
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """ Distinct (query, schedule, distance) within radius, nearest point only """
+        qidx, pidx = self._candidates(lats, lons, radius)
+        owners = self.owners[pidx]
+        if active is not None:
+            keep = active[owners]
+            qidx, pidx, owners = qidx[keep], pidx[keep], owners[keep]
+
+        dist = haversine(lats[qidx], lons[qidx], self.lats[pidx], self.lons[pidx])
+        keep = dist <= radius
+        qidx, owners, dist = qidx[keep], owners[keep], dist[keep]
+
+        # the SHL and BHL of a schedule can both match: keep the nearer one
+        pair = qidx * len(self.frame) + owners
+        order = np.lexsort((dist, pair))
+        _, first = np.unique(pair[order], return_index=True)
+        pick = order[first]
+        return qidx[pick], owners[pick], dist[pick]
+
+    def _result(
+        self, qidx: np.ndarray, owners: np.ndarray, dist: np.ndarray
+    ) -> pd.DataFrame:
+        order = np.lexsort((dist, qidx))
+        qidx, owners, dist = qidx[order], owners[order], dist[order]
+        result = self.frame.iloc[owners].reset_index(drop=True)
+        result.insert(0, "distance", dist)
+        result.insert(0, "query", qidx)
+        return result
+
+    def within(
+        self,
+        lats: ArrayLike,
+        lons: ArrayLike,
+        radius: float,
+        start: date = None,
+        end: date = None,
+    ) -> pd.DataFrame:
+        """ All schedules within radius miles of each query location, optionally
+            limited to schedules active in the date window.
+
+            Returns one row per (query, schedule) match with the query's position
+            in the input and the distance in miles, ordered by query then
+            distance.
+        """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        qidx, owners, dist = self._matches(lats, lons, radius, self._active(start, end))
+        return self._result(qidx, owners, dist)
+
+    def nearest(
+        self,
+        lats: ArrayLike,
+        lons: ArrayLike,
+        k: int = 1,
+        start: date = None,
+        end: date = None,
+        max_radius: float = None,
+        step: float = None,
+    ) -> pd.DataFrame:
+        """ The k nearest schedules to each query location. Queries with fewer
+            than k hits are searched again with the radius grown by step miles
+            (a grid cell by default), up to max_radius miles. Growing in steps
+            rather than doubling keeps the last search from matching up to four
+            times the area it needed to. """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        active = self._active(start, end)
+        max_radius = max_radius or conf.ANALYSIS_NEAREST_MAX_MILES
+        step = step or self.cell_miles
+
+        found = []
+        pending = np.arange(len(lats))
+        radius = step
+        while len(pending):
+            radius = min(radius, max_radius)
+            qidx, owners, dist = self._matches(
+                lats[pending], lons[pending], radius, active
+            )
+            counts = np.bincount(qidx, minlength=len(pending))
+            done = (counts >= k) | (radius >= max_radius)
+            keep = done[qidx]
+            found.append((pending[qidx[keep]], owners[keep], dist[keep]))
+            pending = pending[~done]
+            radius += step
+
+        if found:
+            qidx, owners, dist = (np.concatenate(x) for x in zip(*found))
+        else:
+            qidx = owners = np.empty(0, dtype=np.int64)
+            dist = np.empty(0, dtype=float)
+
+        # rank within each query and keep the first k
+        order = np.lexsort((dist, qidx))
+        qidx, owners, dist = qidx[order], owners[order], dist[order]
+        starts = np.searchsorted(qidx, qidx, side="left")
+        keep = np.arange(len(qidx)) - starts < k
+        return self._result(qidx[keep], owners[keep], dist[keep])
+
+
+def query_points(frame: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """ Latitude and longitude arrays from a frame of query locations, accepting
+        lat/lon or latitude/longitude column names """
+    columns = {c.lower(): c for c in frame.columns}
+    for lat, lon in (("lat", "lon"), ("latitude", "longitude"), ("shllat", "shllon")):
+        if lat in columns and lon in columns:
+            return (
+                frame[columns[lat]].to_numpy(dtype=float),
+                frame[columns[lon]].to_numpy(dtype=float),
+            )
+    raise KeyError("query locations require lat/lon or latitude/longitude columns")
+
+
+def attach_queries(result: pd.DataFrame, queries: pd.DataFrame) -> pd.DataFrame:
+    """ Join the originating query rows (prefixed with well_) onto results """
+    wells = queries.reset_index(drop=True).add_prefix("well_")
+    return wells.join(result.set_index("query"), how="inner").reset_index(drop=True)
@@ -0,0 +1,89 @@
+from typing import Callable, Optional
+from datetime import date
+import logging
+import threading
+
+import pandas as pd
+
+from analysis.intervals import IntervalIndex
+from analysis.proximity import ArrayLike, ProximityIndex, load_schedules
+from api.cache import GenerationClock
+from config import get_active_config
+
+logger = logging.getLogger(__name__)
+
+conf = get_active_config()
+
+
+class ScheduleSnapshot(object):
+    """ In-memory temporal and spatial indexes over the frac schedules as of an
+        ingest generation """
+
+    def __init__(self, frame: pd.DataFrame, generation: Optional[int] = None):
+        self.generation = generation
+        self.proximity = ProximityIndex(frame)
+        self.frame = self.proximity.frame
+        self.intervals = self.proximity.intervals
+        if self.intervals is None:  # raises for frames without schedule dates
+            self.intervals = IntervalIndex.from_frame(self.frame)
+
+    def __repr__(self):
+        rows = len(self.frame)
+        return f"ScheduleSnapshot: generation {self.generation}, {rows} rows"
+
+    def active(self, start: date = None, end: date = None) -> pd.DataFrame:
+        """ Schedules active at any point in [start, end] """
+        return self.frame.iloc[self.intervals.overlapping(start, end)]
+
+    def active_near(
+        self,
+        lats: ArrayLike,
+        lons: ArrayLike,
+        radius: float,
+        start: date = None,
+        end: date = None,
+    ) -> pd.DataFrame:
+        """ Schedules active in [start, end] within radius miles of each location """
+        return self.proximity.within(lats, lons, radius, start=start, end=end)
+
+
+class SnapshotCache(object):
+    """ Holds the current ScheduleSnapshot, rebuilding it when the ingest
+        generation moves on. The generation itself is only re-read every
+        ttl seconds. """
+
+    def __init__(
+        self,
+        load: Callable[[], pd.DataFrame] = load_schedules,
+        generation: Callable[[], Optional[int]] = None,
+        ttl: float = None,
+    ):
+        if generation is None:
+            from api.models import FracSchedule, IngestGeneration
+
+            generation = GenerationClock(
+                lambda: IngestGeneration.current(FracSchedule.__tablename__),
+                ttl=ttl if ttl is not None else conf.API_GENERATION_TTL,
+            )
+        self.load = load
+        self.generation = generation
+        self._snapshot: Optional[ScheduleSnapshot] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> ScheduleSnapshot:
+        generation = self.generation()
+        with self._lock:
+            snapshot = self._snapshot
+            # an unknown generation (lookup failed) keeps serving what we have
+            stale = snapshot is None or (
+                generation is not None and generation != snapshot.generation
+            )
+            if stale:
+                snapshot = ScheduleSnapshot(self.load(), generation=generation)
+                logger.info(f"Refreshed {snapshot}")
+                self._snapshot = snapshot
+            return snapshot
+
+    def clear(self):
+        with self._lock:
+            self._snapshot = None
@@ -0,0 +1,303 @@
+from typing import Tuple
+import logging
+
+import numpy as np
+import pandas as pd
+
+from analysis.proximity import MILES_PER_DEGREE
+from config import get_active_config
+
+logger = logging.getLogger(__name__)
+
+conf = get_active_config()
+
+_KEY_OFFSET = 2 ** 30
+_KEY_SHIFT = np.int64(32)
+
+RESULT_COLUMNS = ["schedule", "wellbore", "distance", "overlap"]
+
+
+class Sticks(object):
+    """ Straight line approximations of laterals, from the surface location to
+        the bottom hole location, in a planar projection measured in miles. A
+        missing bottom hole location gives a degenerate (vertical) stick. """
+
+    def __init__(self, frame: pd.DataFrame, lat0: float):
+        shllat = frame["shllat"].to_numpy(dtype=float)
+        shllon = frame["shllon"].to_numpy(dtype=float)
+        bhllat = frame["bhllat"].to_numpy(dtype=float)
+        bhllon = frame["bhllon"].to_numpy(dtype=float)
+        missing = np.isnan(bhllat) | np.isnan(bhllon)
+        bhllat = np.where(missing, shllat, bhllat)
+        bhllon = np.where(missing, shllon, bhllon)
+
+        self.lat0 = lat0
+        self.x0, self.y0 = project(shllat, shllon, lat0)
+        self.x1, self.y1 = project(bhllat, bhllon, lat0)
+        self.valid = ~(np.isnan(self.x0) | np.isnan(self.y0))
+
+        self.xmin = np.fmin(self.x0, self.x1)
+        self.xmax = np.fmax(self.x0, self.x1)
+        self.ymin = np.fmin(self.y0, self.y1)
+        self.ymax = np.fmax(self.y0, self.y1)
+
+    def __len__(self):
+        return len(self.x0)
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.hypot(self.x1 - self.x0, self.y1 - self.y0)
+
+
+def project(
+    lats: np.ndarray, lons: np.ndarray, lat0: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """ Equirectangular projection to miles, true to scale along lat0 """
+    scale = MILES_PER_DEGREE * np.cos(np.radians(lat0))
+    return lons * scale, lats * MILES_PER_DEGREE
+
+
+def point_segment_distance(px, py, ax, ay, bx, by) -> np.ndarray:
+    """ Distance from points P to segments AB, elementwise """
+    dx, dy = bx - ax, by - ay
+    length2 = dx * dx + dy * dy
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = np.divide((px - ax) * dx + (py - ay) * dy, length2)
+    t = np.clip(np.where(length2 > 0, t, 0.0), 0.0, 1.0)
+    return np.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def _orientation(ax, ay, bx, by, cx, cy) -> np.ndarray:
+    return np.sign((bx - ax) * (cy - ay) - (by - ay) * (cx - ax))
+
+
+def segment_distance(ax, ay, bx, by, cx, cy, dx, dy) -> np.ndarray:
+    """ Minimum distance between segments AB and CD, elementwise. Zero where
+        they cross, otherwise the least of the four endpoint to segment
+        distances. Touching and collinear overlaps are covered by the endpoint
+        distances being zero. """
+    # C and D on strictly opposite sides of AB, and A and B of CD
+    straddles_ab = (
+        _orientation(ax, ay, bx, by, cx, cy) * _orientation(ax, ay, bx, by, dx, dy)
+    ) < 0
+    straddles_cd = (
+        _orientation(cx, cy, dx, dy, ax, ay) * _orientation(cx, cy, dx, dy, bx, by)
+    ) < 0
+    crosses = straddles_ab & straddles_cd
+    distance = np.minimum.reduce(
+        [
+            point_segment_distance(ax, ay, cx, cy, dx, dy),
+            point_segment_distance(bx, by, cx, cy, dx, dy),
+            point_segment_distance(cx, cy, ax, ay, bx, by),
+            point_segment_distance(dx, dy, ax, ay, bx, by),
+        ]
+    )
+    return np.where(crosses, 0.0, distance)
+
+
+def overlap_ratio(ax, ay, bx, by, cx, cy, dx, dy) -> np.ndarray:
+    """ Fraction of segment AB alongside segment CD: the length of CD's
+        projection onto AB, clipped to AB, over the length of AB. Zero for
+        degenerate AB. """
+    ux, uy = bx - ax, by - ay
+    length2 = ux * ux + uy * uy
+    with np.errstate(invalid="ignore", divide="ignore"):
+        tc = np.divide((cx - ax) * ux + (cy - ay) * uy, length2)
+        td = np.divide((dx - ax) * ux + (dy - ay) * uy, length2)
+    lo = np.clip(np.fmin(tc, td), 0.0, 1.0)
+    hi = np.clip(np.fmax(tc, td), 0.0, 1.0)
+    return np.where(length2 > 0, hi - lo, 0.0)
+
+
+class StickIndex(object):
+    """ Grid of cells over the bounding boxes of a set of sticks. A stick is
+        registered in every cell its bounding box touches, so a search only
+        measures pairs whose padded bounding boxes share a cell.
+
+        Sticks longer than max_lateral miles (usually a placeholder bottom hole
+        location) would cover a vast number of cells, so they are kept out of
+        the grid, on either side of a search, and paired with every stick on
+        the other side instead. """
+
+    def __init__(
+        self, sticks: Sticks, cell_miles: float = None, max_lateral: float = None
+    ):
+        self.sticks = sticks
+        self.cell_miles = float(cell_miles or conf.ANALYSIS_CELL_MILES)
+        self.max_lateral = float(max_lateral or conf.ANALYSIS_MAX_LATERAL_MILES)
+
+        long = self._long(sticks)
+        self.outliers = np.flatnonzero(long)
+        ids = np.flatnonzero(sticks.valid & ~long)
+        keys, owners = self._cover(
+            ids,
+            sticks.xmin[ids],
+            sticks.ymin[ids],
+            sticks.xmax[ids],
+            sticks.ymax[ids],
+        )
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.owners = owners[order]
+
+    def __repr__(self):
+        cells = len(np.unique(self.keys))
+        return f"StickIndex: {len(self.sticks)} sticks in {cells} cells"
+
+    def _long(self, sticks: Sticks) -> np.ndarray:
+        """ Valid sticks longer than max_lateral, with a warning if there are any """
+        with np.errstate(invalid="ignore"):
+            long = sticks.valid & (sticks.lengths > self.max_lateral)
+        if long.any():
+            logger.warning(
+                f"{long.sum()} laterals are longer than {self.max_lateral} miles"
+                f" and are compared with every lateral instead of through the grid"
+            )
+        return long
+
+    def _cell(self, value: np.ndarray) -> np.ndarray:
+        return np.floor(value / self.cell_miles).astype(np.int64)
+
+    def _cover(self, ids, xmin, ymin, xmax, ymax) -> Tuple[np.ndarray, np.ndarray]:
+        """ (cell key, id) for every cell overlapped by each bounding box """
+        ix0, iy0 = self._cell(xmin), self._cell(ymin)
+        nx = self._cell(xmax) - ix0 + 1
+        ny = self._cell(ymax) - iy0 + 1
+        counts = nx * ny
+        total = int(counts.sum())
+        if not total:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty
+
+        owner = np.repeat(np.arange(len(ids)), counts)
+        # position of each cell within its box, in row major order
+        k = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        ix = ix0[owner] + k // ny[owner]
+        iy = iy0[owner] + k % ny[owner]
+        keys = ((ix + _KEY_OFFSET) << _KEY_SHIFT) | (iy + _KEY_OFFSET)
+        return keys, ids[owner]
+
+    def candidates(
+        self, sticks: Sticks, max_distance: float
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """ Distinct (query stick, indexed stick) pairs whose bounding boxes come
+            within max_distance of each other """
+        long = self._long(sticks)
+        ids = np.flatnonzero(sticks.valid & ~long)
+        keys, queries = self._cover(
+            ids,
+            sticks.xmin[ids] - max_distance,
+            sticks.ymin[ids] - max_distance,
+            sticks.xmax[ids] + max_distance,
+            sticks.ymax[ids] + max_distance,
+        )
+        left = np.searchsorted(self.keys, keys, side="left")
+        right = np.searchsorted(self.keys, keys, side="right")
+        counts = right - left
+        total = int(counts.sum())
+        offsets = np.repeat(np.cumsum(counts) - counts, counts)
+        qidx = np.repeat(queries, counts)
+        tidx = self.owners[np.repeat(left, counts) + np.arange(total) - offsets]
+
+        # sticks kept out of the grid are paired with every stick on the other side
+        long_ids = np.flatnonzero(long)
+        indexed = np.flatnonzero(self.sticks.valid)
+        qidx = np.concatenate(
+            [
+                qidx,
+                np.repeat(long_ids, len(indexed)),
+                np.repeat(ids, len(self.outliers)),
+            ]
+        )
+        tidx = np.concatenate(
+            [tidx, np.tile(indexed, len(long_ids)), np.tile(self.outliers, len(ids))]
+        )
+
+        # a pair sharing several cells is measured once
+        pairs = np.unique(qidx * len(self.sticks) + tidx)
+        qidx, tidx = pairs // len(self.sticks), pairs % len(self.sticks)
+
+        # exact padded bounding box test before measuring
+        t = self.sticks
+        near = (
+            (sticks.xmin[qidx] - max_distance <= t.xmax[tidx])
+            & (sticks.xmax[qidx] + max_distance >= t.xmin[tidx])
+            & (sticks.ymin[qidx] - max_distance <= t.ymax[tidx])
+            & (sticks.ymax[qidx] + max_distance >= t.ymin[tidx])
+        )
+        return qidx[near], tidx[near]
+
+
+def lateral_distances(
+    schedules: pd.DataFrame,
+    wellbores: pd.DataFrame,
+    max_distance: float = 1.0,
+    cell_miles: float = None,
+    max_lateral: float = None,
+) -> pd.DataFrame:
+    """ Minimum lateral to lateral distance (miles) between scheduled sticks and
+        wellbores, for every pair within max_distance.
+
+        Both frames need shllat, shllon, bhllat and bhllon columns. Returns the
+        row positions of each pair in the two frames, the distance, and the
+        overlap: the fraction of the scheduled lateral that runs alongside the
+        wellbore. Distances are planar, which is accurate to well under 0.1%
+        at these lengths. Laterals longer than max_lateral miles are measured
+        against every lateral on the other side rather than through the grid.
+    """
+    lats = np.concatenate(
+        [
+            schedules["shllat"].to_numpy(dtype=float),
+            wellbores["shllat"].to_numpy(dtype=float),
+        ]
+    )
+    lat0 = float(np.nanmean(lats)) if np.isfinite(lats).any() else 0.0
+
+    s = Sticks(schedules, lat0)
+    w = Sticks(wellbores, lat0)
+    index = StickIndex(w, cell_miles=cell_miles, max_lateral=max_lateral)
+    qidx, tidx = index.candidates(s, max_distance)
+
+    args = (
+        s.x0[qidx],
+        s.y0[qidx],
+        s.x1[qidx],
+        s.y1[qidx],
+        w.x0[tidx],
+        w.y0[tidx],
+        w.x1[tidx],
+        w.y1[tidx],
+    )
+    distance = segment_distance(*args)
+    keep = distance <= max_distance
+    overlap = overlap_ratio(*(a[keep] for a in args))
+
+    logger.debug(
+        f"lateral_distances: {len(qidx)} candidate pairs of"
+        f" {len(s) * len(w)}, {keep.sum()} within {max_distance} mi"
+    )
+    result = pd.DataFrame(
+        {
+            "schedule": qidx[keep],
+            "wellbore": tidx[keep],
+            "distance": distance[keep],
+            "overlap": overlap,
+        },
+        columns=RESULT_COLUMNS,
+    )
+    return result.sort_values(["schedule", "distance"]).reset_index(drop=True)
+
+
+def attach_pairs(
+    result: pd.DataFrame, schedules: pd.DataFrame, wellbores: pd.DataFrame
+) -> pd.DataFrame:
+    """ Join the schedule and (well_ prefixed) wellbore rows onto results """
+    left = schedules.iloc[result.schedule.to_numpy()].reset_index(drop=True)
+    right = (
+        wellbores.iloc[result.wellbore.to_numpy()]
+        .reset_index(drop=True)
+        .add_prefix("well_")
+    )
+    return pd.concat(
+        [result[["distance", "overlap"]].reset_index(drop=True), left, right], axis=1
+    )
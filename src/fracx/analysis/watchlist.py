@@ -0,0 +1,206 @@
+from typing import Dict, List, Optional, Tuple, Union
+from datetime import datetime
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func
+
+from analysis.proximity import ProximityIndex
+from config import get_active_config
+
+logger = logging.getLogger(__name__)
+
+conf = get_active_config()
+
+ALERT_COLUMNS = [
+    "watch_id",
+    "api14",
+    "frac_start_date",
+    "frac_end_date",
+    "operator",
+    "wellname",
+    "distance",
+    "reason",
+]
+
+
+def as_utc(value) -> pd.Timestamp:
+    """ Timezone aware timestamp, assuming utc for naive values """
+    ts = pd.Timestamp(value)
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+
+class WatchlistIndex(object):
+    """ Spatial index over the watched locations, so a batch of changed frac
+        schedules can be checked against the whole watchlist at once. Each watch
+        has its own radius; candidates are gathered at the largest radius and
+        then trimmed. """
+
+    def __init__(self, frame: pd.DataFrame):
+        self.frame = frame.reset_index(drop=True)
+        points = pd.DataFrame(
+            {
+                "watch_id": self.frame["id"].to_numpy(),
+                "radius": self.frame["radius"].to_numpy(dtype=float),
+                "shllat": self.frame["lat"].to_numpy(dtype=float),
+                "shllon": self.frame["lon"].to_numpy(dtype=float),
+                "bhllat": np.nan,
+                "bhllon": np.nan,
+            }
+        )
+        self.index = ProximityIndex(points)
+        self.max_radius = float(points.radius.max()) if len(points) else 0.0
+
+    def __repr__(self):
+        return f"WatchlistIndex: {len(self.frame)} locations"
+
+    def __len__(self):
+        return len(self.frame)
+
+    def evaluate(
+        self, changes: pd.DataFrame, since: Union[datetime, str] = None
+    ) -> pd.DataFrame:
+        """ Alerts for the changed schedules whose SHL or BHL falls within range
+            of a watched location. A schedule created at or after since is
+            reported as new, otherwise as changed. If the schedules carry
+            located_at, one that was neither created nor moved since is left
+            out: its dates are part of its key, so only a change of location
+            can bring it into (or move it within) range of a watch. """
+        if since is not None and "located_at" in changes and not changes.empty:
+            moved = pd.to_datetime(changes.located_at, utc=True) >= as_utc(since)
+            if "created_at" in changes:
+                moved |= pd.to_datetime(changes.created_at, utc=True) >= as_utc(since)
+            changes = changes[moved.to_numpy()]
+
+        if changes.empty or not len(self):
+            return pd.DataFrame(columns=ALERT_COLUMNS)
+
+        changes = changes.reset_index(drop=True)
+        rows = np.arange(len(changes))
+        shl = changes[["shllat", "shllon"]].to_numpy(dtype=float)
+        bhl = changes[["bhllat", "bhllon"]].to_numpy(dtype=float)
+        lats, lons = np.concatenate([shl, bhl]).T
+        owners = np.concatenate([rows, rows])
+        valid = ~(np.isnan(lats) | np.isnan(lons))
+        lats, lons, owners = lats[valid], lons[valid], owners[valid]
+
+        hits = self.index.within(lats, lons, self.max_radius)
+        hits = hits[hits.distance <= hits.radius]
+        hits = hits.assign(row=owners[hits["query"].to_numpy()])
+        # nearer of SHL and BHL for each (watch, schedule)
+        hits = hits.sort_values("distance").drop_duplicates(["watch_id", "row"])
+
+        matched = changes.iloc[hits.row.to_numpy()].reset_index(drop=True)
+        alerts = pd.DataFrame(
+            {
+                "watch_id": hits.watch_id.to_numpy(),
+                "distance": hits.distance.to_numpy(),
+            }
+        )
+        for column in ALERT_COLUMNS:
+            if column in matched:
+                alerts[column] = matched[column].to_numpy()
+            elif column not in alerts:
+                alerts[column] = None
+
+        is_new = np.zeros(len(alerts), dtype=bool)
+        if since is not None and "created_at" in matched:
+            created = pd.to_datetime(matched.created_at, utc=True)
+            is_new = (created >= as_utc(since)).to_numpy()
+        alerts["reason"] = np.where(is_new, "new", "changed")
+        return alerts[ALERT_COLUMNS].sort_values(["watch_id", "distance"])
+
+
+class WatchlistCache(object):
+    """ Keeps the WatchlistIndex between ingests, rebuilding it only when the
+        watchlist table itself has changed """
+
+    def __init__(self):
+        self._signature: Optional[Tuple] = None
+        self._index: Optional[WatchlistIndex] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> WatchlistIndex:
+        from api.models import Watchlist
+
+        signature = tuple(
+            Watchlist.s.query(
+                func.count(Watchlist.id),
+                func.max(Watchlist.id),
+                func.max(Watchlist.updated_at),
+            ).one()
+        )
+        with self._lock:
+            if self._index is None or signature != self._signature:
+                frame = pd.read_sql(
+                    Watchlist.s.query(*Watchlist.__table__.columns).statement,
+                    Watchlist.s.bind,
+                )
+                self._index = WatchlistIndex(frame)
+                self._signature = signature
+                logger.info(f"Loaded {self._index}")
+            return self._index
+
+    def clear(self):
+        with self._lock:
+            self._index = None
+            self._signature = None
+
+
+watchlist_cache = WatchlistCache()
+
+
+def _native(value):
+    """ Plain python value for a numpy scalar, so the db driver can adapt it """
+    if pd.isnull(value):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def write_alerts(alerts: pd.DataFrame) -> int:
+    """ Upsert alerts, one per watched location and schedule """
+    from api.models import Alert
+
+    if alerts.empty:
+        return 0
+
+    records: List[Dict] = [
+        {k: _native(v) for k, v in row.items()}
+        for row in alerts.to_dict(orient="records")
+    ]
+    if "pymssql" in conf.DATABASE_DRIVER:
+        Alert.bulk_merge(records)
+    else:
+        Alert.core_insert(records, update_on_conflict=True)
+    return len(records)
+
+
+def check(since: Union[datetime, str]) -> pd.DataFrame:
+    """ Evaluate the schedules changed at or after since (database time) against
+        the watchlist and record any alerts. Work is proportional to the number
+        of changed rows. Requires an application context. """
+    from api.models import FracSchedule
+
+    since = as_utc(since).to_pydatetime()
+    changes = pd.DataFrame(FracSchedule.changed_since(since))
+    if changes.empty:
+        logger.info("Watchlist: no changed schedules to evaluate")
+        return pd.DataFrame(columns=ALERT_COLUMNS)
+
+    index = watchlist_cache.get()
+    alerts = index.evaluate(changes, since=since)
+    write_alerts(alerts)
+
+    logger.info(
+        f"Watchlist: {len(alerts)} alerts from {len(changes)} changed schedules"
+    )
+    for alert in alerts.itertuples():
+        logger.info(
+            f"Watchlist alert ({alert.reason}): {alert.api14} is"
+            f" {alert.distance:.2f} mi from watch {alert.watch_id}"
+        )
+    return alerts
@@ -0,0 +1,98 @@
+from typing import Callable, Hashable, Optional, Union
+from collections import OrderedDict
+from timeit import default_timer as timer
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache(object):
+    """ Thread safe, in-process LRU of serialized response bodies. Keys are
+        expected to include the ingest generation, so entries never need to be
+        invalidated: a new generation simply stops hitting the old ones.
+    """
+
+    def __init__(self, max_entries: int = 256, max_body_bytes: int = 2 ** 20):
+        self.max_entries = max_entries
+        self.max_body_bytes = max_body_bytes
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return f"ResponseCache: {len(self)}/{self.max_entries} entries"
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return body
+
+    def set(self, key: Hashable, body: Union[str, bytes]) -> bool:
+        """ Store a body, returning False if it is too large to cache """
+        if isinstance(body, str):
+            body = body.encode()
+        if len(body) > self.max_body_bytes:
+            return False
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class GenerationClock(object):
+    """ Caches the result of a generation lookup for a short time so that repeat
+        requests do not each cost a database round trip """
+
+    def __init__(self, fetch: Callable[[], int], ttl: float = 5.0):
+        self.fetch = fetch
+        self.ttl = ttl
+        self._value: Optional[int] = None
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self) -> Optional[int]:
+        with self._lock:
+            if self._value is None or timer() - self._fetched_at >= self.ttl:
+                self._fetch()
+            return self._value
+
+    def refresh(self) -> Optional[int]:
+        """ Look the generation up now, regardless of the ttl """
+        with self._lock:
+            self._fetch()
+            return self._value
+
+    def _fetch(self):
+        try:
+            self._value = self.fetch()
+            self._fetched_at = timer()
+        except Exception as e:
+            logger.warning(f"Unable to read ingest generation -- {e}")
+            self._value = None
+
+    def reset(self):
+        with self._lock:
+            self._value = None
+
+
+def make_etag(generation: int, key: Hashable) -> str:
+    """ Strong validator for a response, derived from the ingest generation and
+        the normalized query that produced it """
+    return hashlib.sha1(repr((generation, key)).encode()).hexdigest()
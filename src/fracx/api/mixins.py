@@ -2,20 +2,59 @@
 
 
 import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
 from enum import Enum
 from timeit import default_timer as timer
-from typing import Dict, List
-
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+from sqlalchemy import (
+    Date,
+    Table,
+    and_,
+    bindparam,
+    case,
+    column,
+    inspect,
+    null,
+    or_,
+    select,
+    text,
+    tuple_,
+)
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.dialects.postgresql.dml import Insert
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.sql import func
+from sqlalchemy.util import LRUCache
 
 import metrics
 import util
+from api.records import as_dicts
+from config import get_active_config
 from util.deco import classproperty
 from fracx import db
 
 
+# bookkeeping columns that do not count as a change to a record
+AUDIT_COLUMNS = ("created_at", "updated_at", "located_at")
+
+# set when a row disappears from the source, cleared when a write brings it back
+TOMBSTONE_COLUMN = "removed_at"
+
+# set when a row is inserted and whenever a write changes one of its locations
+LOCATION_STAMP = "located_at"
+LOCATION_COLUMNS = ("shllat", "shllon", "bhllat", "bhllon")
+
+# upsert statements by (model, table, conflict mode, columns, excluded columns), and
+# their compiled forms, so the steady state write path does not recompile them.
+# both are bounded since a shadow table or an odd column set adds new entries.
+STATEMENT_CACHE_SIZE = 500
+_statements: Dict[Tuple, Insert] = LRUCache(STATEMENT_CACHE_SIZE)
+_compiled_cache: Dict = LRUCache(STATEMENT_CACHE_SIZE)
+
+
 class Operation(Enum):
     INSERT = "insert"
     UPDATE = "update"
@@ -34,23 +73,112 @@ class TimestampMixin(object):
 
 logger = logging.getLogger(__name__)
 
+conf = get_active_config()
+
+
+class LoadContext(object):
+    """ Runs one file ingest as a single unit of work.
+
+        Every write made on this thread while the context is open shares one
+        session transaction. Each batch runs in its own savepoint, so a failed
+        batch is rolled back (and retried in pieces) without aborting the rest
+        of the load. The transaction is committed once on exit, or rolled back
+        entirely if the load raises, so a half-processed file never leaves
+        partial state behind. A resumable load may also commit at checkpoints;
+        it then only rolls back to the last one.
+
+        Postgres flushes its WAL once per commit that wrote something, so fsyncs
+        counts those commits. Savepoint releases do not flush.
+    """
+
+    _local = threading.local()
+
+    def __init__(self, session=None, name: str = "load"):
+        self.session = session or db.session
+        self.name = name
+        self.commits = 0
+        self.fsyncs = 0
+        self.savepoints = 0
+        self.rollbacks = 0
+        self.writes = 0
+
+    def __repr__(self):
+        return (
+            f"LoadContext({self.name}): {self.savepoints} savepoints"
+            f" ({self.rollbacks} rolled back), {self.commits} commits,"
+            f" {self.fsyncs} fsyncs"
+        )
+
+    @classmethod
+    def current(cls):
+        """ The load context open on this thread, if any """
+        return getattr(cls._local, "context", None)
+
+    def __enter__(self):
+        if self.current() is not None:
+            raise RuntimeError("A load context is already open on this thread")
+        self._local.context = self
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._local.context = None
+        if exc_type is None:
+            self._commit()
+        else:
+            self.session.rollback()
+        self.post_metrics(failed=exc_type is not None)
+        return False
+
+    def _commit(self):
+        self.session.commit()
+        self.commits += 1
+        self.fsyncs += 1 if self.writes else 0
+        self.writes = 0
+
+    def checkpoint(self):
+        """ Commit everything written so far and carry on in a new transaction """
+        self._commit()
+        logger.debug(f"{self} -- checkpoint")
+
+    @contextmanager
+    def savepoint(self):
+        """ Run a batch in a savepoint, yielding the connection to write with """
+        nested = self.session.begin_nested()
+        self.savepoints += 1
+        try:
+            yield self.session.connection()
+            self.session.flush()
+        except Exception:
+            nested.rollback()
+            self.rollbacks += 1
+            raise
+        nested.commit()
+        self.writes += 1
+
+    def post_metrics(self, failed: bool = False):
+        measurements = {
+            "load_commits": self.commits,
+            "load_fsyncs": self.fsyncs,
+            "load_savepoints": self.savepoints,
+            "load_rollbacks": self.rollbacks,
+        }
+        tags = {"load": self.name}
+        for key, value in measurements.items():
+            metrics.post(key, value, tags=tags)
+
+        status = "rolled back" if failed else "committed"
+        logger.info(f"{self} -- {status}", extra={**measurements, **tags})
+
 
 class CoreMixin(object):
     """Base class for sqlalchemy ORM tables containing mostly utility functions for
        accessing table properties and managing insert, update, and upsert operations.
     """
 
-    pks = None
-
     @classproperty
     def s(self):
         return db.session
 
-    @classproperty
-    def pks(cls) -> List[tuple]:  # noqa
-        query = cls.s.query().with_entities(*cls.primary_key_columns())
-        return query.all()
-
     @classmethod
     def primary_key_columns(cls) -> List:
         """Returns a list of sqlalchemy column objects for this table's primary keys.
@@ -72,6 +200,135 @@ class CoreMixin(object):
 
         return list(cls.__table__.primary_key.columns.keys())
 
+    @classmethod
+    def row_key(cls, row: Dict) -> tuple:
+        """Returns the primary key of a row, normalized to the values the database
+        returns (e.g. a datetime parsed for a date column becomes a date).
+
+        Arguments:
+            row {Dict} -- a row of this table, as a mapping
+
+        Returns:
+            tuple -- primary key values, in primary key column order
+        """
+        values = []
+        for c in cls.__table__.primary_key.columns:
+            value = row.get(c.name)
+            if isinstance(value, datetime) and isinstance(c.type, Date):
+                value = value.date()
+            values.append(value)
+        return tuple(values)
+
+    @classmethod
+    def iter_pks(cls, batch_size: int = None) -> Iterator[tuple]:
+        """Stream this table's primary keys from a server side cursor, holding at
+        most batch_size of them in memory at a time.
+
+        Keyword Arguments:
+            batch_size {int} -- rows fetched per round trip
+                (default: {conf.API_STREAM_BATCH_SIZE})
+
+        Yields:
+            tuple -- primary key values, in primary key column order
+        """
+        query = (
+            cls.s.query(*cls.primary_key_columns())
+            .execution_options(stream_results=True)
+            .yield_per(batch_size or conf.API_STREAM_BATCH_SIZE)
+        )
+        for row in query:
+            yield tuple(row)
+
+    @classmethod
+    def exists_statement(cls, dialect: str, n: int = None):
+        """Statement selecting the primary keys of this table that are among a batch
+        of keys.
+
+        On postgres, the batch is bound as one array per key column and joined to
+        the table through unnest, so the statement is the same for any number of
+        keys. Elsewhere it matches n keys, bound as key_{i}_{j} (mssql has no row
+        value IN, so each key is compared column by column).
+        """
+        table = cls.__table__
+        names = cls.primary_key_names()
+        pks = cls.primary_key_columns()
+        if dialect == "postgresql":
+            key = ("exists", cls, dialect)
+            if key not in _statements:
+                keys = (
+                    select([column(name) for name in names])
+                    .select_from(
+                        text(
+                            "unnest({}) as keys ({})".format(
+                                ", ".join(f":{name}" for name in names),
+                                ", ".join(names),
+                            )
+                        ).bindparams(
+                            *[
+                                bindparam(c.name, type_=postgresql.ARRAY(c.type))
+                                for c in pks
+                            ]
+                        )
+                    )
+                    .alias("keys")
+                )
+                match = and_(*[c == keys.c[c.name] for c in pks])
+                _statements[key] = select(pks).select_from(table.join(keys, match))
+            return _statements[key]
+
+        params = [
+            [bindparam(f"key_{i}_{j}") for j in range(len(pks))] for i in range(n)
+        ]
+        if dialect == "mssql":
+            criteria = or_(
+                *[and_(*[c == p for c, p in zip(pks, key)]) for key in params]
+            )
+        else:
+            criteria = tuple_(*pks).in_([tuple_(*key) for key in params])
+        return select(pks).where(criteria)
+
+    @classmethod
+    def exists_many(cls, keys: Iterable[tuple], batch_size: int = None) -> Set[tuple]:
+        """Check which of the given primary keys exist in this table, a batch at a
+        time, with one query per batch. Memory use is proportional to the batch,
+        not the table.
+
+        Arguments:
+            keys {Iterable[tuple]} -- primary key values, in primary key column
+                order
+
+        Keyword Arguments:
+            batch_size {int} -- keys checked per query
+                (default: {conf.COLLECTOR_WRITE_SIZE})
+
+        Returns:
+            set -- the keys that exist, as stored in the table
+        """
+        conn = cls.s.connection()
+        dialect = conn.dialect.name
+        names = cls.primary_key_names()
+        batch_size = batch_size or conf.COLLECTOR_WRITE_SIZE
+        if dialect == "mssql":
+            # stay under the 2100 parameter limit of a request
+            batch_size = min(batch_size, 2000 // len(names))
+
+        found: Set[tuple] = set()
+        for batch in util.chunks(keys, batch_size):
+            if dialect == "postgresql":
+                stmt = cls.exists_statement(dialect)
+                params = {
+                    name: [key[j] for key in batch] for j, name in enumerate(names)
+                }
+            else:
+                stmt = cls.exists_statement(dialect, len(batch))
+                params = {
+                    f"key_{i}_{j}": value
+                    for i, key in enumerate(batch)
+                    for j, value in enumerate(key)
+                }
+            found.update(tuple(row) for row in conn.execute(stmt, params))
+        return found
+
     @classmethod
     def persist_objects(cls, objects: List[db.Model]):
         cls.s.add_all(objects)
@@ -82,8 +339,12 @@ class CoreMixin(object):
 
     @classmethod
     def persist(cls) -> None:
-        """Propagate changes in session to database.
+        """Propagate changes in session to database. Inside a load context the
+        changes are only flushed; the context commits them once at the end.
         """
+        if LoadContext.current() is not None:
+            cls.s.flush()
+            return
         try:
             cls.s.flush()
             cls.s.commit()
@@ -91,6 +352,95 @@ class CoreMixin(object):
             logger.info(e)
             cls.s.rollback()
 
+    @classmethod
+    def upsert_statement(
+        cls,
+        columns: Tuple[str, ...],
+        update_on_conflict: bool = True,
+        ignore_on_conflict: bool = False,
+        exclude_cols: Tuple[str, ...] = (),
+        table: Table = None,
+    ) -> Insert:
+        """ Insert statement for rows of the given columns, built once per model,
+            conflict mode and column set. It carries no values: executed with a
+            list of rows it runs as a single executemany, and with a shared
+            compiled_cache it is only compiled once per connection pool.
+
+            On conflict, only the columns present in the rows (and updated_at)
+            are updated, and only when one of them has changed. located_at is
+            only moved when a location column changed. table targets a copy of
+            this model's table (e.g. a shadow table) instead. """
+        if ignore_on_conflict:
+            mode = "ignore"
+        elif update_on_conflict:
+            mode = "update"
+        else:
+            mode = "insert"
+        table = cls.__table__ if table is None else table
+        key = (cls, table, mode, tuple(columns), tuple(exclude_cols))
+        stmt = _statements.get(key)
+        if stmt is not None:
+            return stmt
+
+        stmt = Insert(table)
+        if mode == "update":
+            pks = set(table.primary_key.columns.keys())
+            compare_cols = [
+                k
+                for k in columns
+                if k in table.c
+                and k not in pks
+                and k not in exclude_cols
+                and k not in AUDIT_COLUMNS
+            ]
+            update_cols = compare_cols + [k for k in ("updated_at",) if k in table.c]
+            set_ = {k: getattr(stmt.excluded, k) for k in update_cols}
+            # rows whose values are unchanged are left alone, so updated_at only
+            # moves (and derived data is only rebuilt) when something changed.
+            changed = []
+            if compare_cols:
+                changed.append(
+                    tuple_(*[table.c[k] for k in compare_cols]).is_distinct_from(
+                        tuple_(*[getattr(stmt.excluded, k) for k in compare_cols])
+                    )
+                )
+            moved = [k for k in LOCATION_COLUMNS if k in compare_cols]
+            if LOCATION_STAMP in table.c and moved:
+                set_[LOCATION_STAMP] = case(
+                    [
+                        (
+                            tuple_(*[table.c[k] for k in moved]).is_distinct_from(
+                                tuple_(*[getattr(stmt.excluded, k) for k in moved])
+                            ),
+                            func.now(),
+                        )
+                    ],
+                    else_=table.c[LOCATION_STAMP],
+                )
+            if TOMBSTONE_COLUMN in table.c and TOMBSTONE_COLUMN not in columns:
+                set_[TOMBSTONE_COLUMN] = null()
+                changed.append(table.c[TOMBSTONE_COLUMN].isnot(None))
+
+            if changed:
+                stmt = stmt.on_conflict_do_update(
+                    constraint=table.primary_key, set_=set_, where=or_(*changed),
+                )
+            else:
+                mode = "ignore"
+        if mode == "ignore":
+            stmt = stmt.on_conflict_do_nothing(constraint=table.primary_key)
+
+        _statements[key] = stmt
+        return stmt
+
+    @staticmethod
+    def group_by_columns(rows: List[Dict]) -> Dict[Tuple[str, ...], List[Dict]]:
+        """ Rows grouped by the set of columns they have, in order of appearance """
+        groups: Dict[Tuple[str, ...], List[Dict]] = {}
+        for row in rows:
+            groups.setdefault(tuple(sorted(row)), []).append(row)
+        return groups
+
     @classmethod
     def core_insert(
         cls,
@@ -100,86 +450,114 @@ class CoreMixin(object):
         update_on_conflict: bool = True,
         ignore_on_conflict: bool = False,
     ):
-        op_name = "core_insert"
+        if ignore_on_conflict:
+            op_name = "core_insert_ignore_on_conflict"
+        elif update_on_conflict:
+            op_name = "core_insert_update_on_conflict"
+        else:
+            op_name = "core_insert"
+        context = LoadContext.current()
+        if context is None:
+            # one transaction for the call, rather than two commits per batch
+            with LoadContext(cls.s, name=cls.__table__.name):
+                return cls.core_insert(
+                    records,
+                    size=size,
+                    exclude_cols=exclude_cols,
+                    update_on_conflict=update_on_conflict,
+                    ignore_on_conflict=ignore_on_conflict,
+                )
+
         affected: int = 0
         size = size or len(records)
-        exclude_cols = exclude_cols or []
-        for chunk in util.chunks(records, size):
+        exclude_cols = tuple(exclude_cols or [])
+        for batch in util.batches(records, size):
             ts = timer()
-            chunk = list(chunk)
-            stmt = Insert(cls).values(chunk)
-
-            # update these columns when a conflict is encountered
-            if ignore_on_conflict:
-                final_stmt = stmt.on_conflict_do_nothing(
-                    constraint=cls.__table__.primary_key
-                )
-                op_name = op_name + "_ignore_on_conflict"
-            elif update_on_conflict:
-                on_conflict_update_cols = [
-                    c.name
-                    for c in cls.__table__.c
-                    if c not in list(cls.__table__.primary_key.columns)
-                    and c.name not in exclude_cols
-                ]
-                op_name = op_name + "_update_on_conflict"
-
-                # append 'on conflict' clause to insert statement
-                final_stmt = stmt.on_conflict_do_update(
-                    constraint=cls.__table__.primary_key,
-                    set_={
-                        k: getattr(stmt.excluded, k) for k in on_conflict_update_cols
-                    },
-                )
-
-            else:
-                final_stmt = stmt
             try:
-                cls.s.bind.engine.execute(final_stmt)
-                cls.persist()
+                with context.savepoint() as conn:
+                    conn = conn.execution_options(compiled_cache=_compiled_cache)
+                    groups = cls.group_by_columns(as_dicts(batch.items))
+                    for columns, rows in groups.items():
+                        stmt = cls.upsert_statement(
+                            columns,
+                            update_on_conflict=update_on_conflict,
+                            ignore_on_conflict=ignore_on_conflict,
+                            exclude_cols=exclude_cols,
+                        )
+                        conn.execute(stmt, rows)
+                    cls.after_write(conn, batch.items)
                 exc_time = round(timer() - ts, 2)
-                n = len(chunk)
-                cls.post_op_metrics(Operation.INSERT, op_name, n, exc_time)
-                affected += len(records)
+                cls.post_op_metrics(
+                    Operation.INSERT, op_name, batch.size, exc_time, batch.index
+                )
+                affected += batch.size
 
             except IntegrityError as ie:
                 logger.warning(ie)
 
                 # fragment and reprocess
-                if len(records) > 1:
-                    first_half = records[: len(records) // 2]
-                    second_half = records[len(records) // 2 :]
-                    cls.core_insert(
-                        records=first_half,
-                        size=len(first_half) // 4,
-                        update_on_conflict=update_on_conflict,
-                        ignore_on_conflict=ignore_on_conflict,
-                    )
-                    cls.core_insert(
-                        records=second_half,
-                        size=len(second_half) // 4,
-                        update_on_conflict=update_on_conflict,
-                        ignore_on_conflict=ignore_on_conflict,
-                    )
+                items = batch.items
+                if len(items) > 1:
+                    for half in (items[: len(items) // 2], items[len(items) // 2 :]):
+                        affected += cls.core_insert(
+                            records=half,
+                            size=max(len(half) // 4, 1),
+                            exclude_cols=list(exclude_cols),
+                            update_on_conflict=update_on_conflict,
+                            ignore_on_conflict=ignore_on_conflict,
+                        )
             except Exception as e:
                 logger.error(e)
 
         return affected
 
+    @classmethod
+    def insert_new(cls, records: List[Dict]) -> bool:
+        """Insert rows that are believed not to exist yet with a plain INSERT,
+        which needs no conflict handling (or, on mssql, no per row merge).
+
+        If any of them does exist (or violates another constraint), nothing is
+        written and False is returned, so the caller can fall back to an upsert.
+        """
+        context = LoadContext.current()
+        if context is None:
+            with LoadContext(cls.s, name=cls.__table__.name):
+                return cls.insert_new(records)
+
+        ts = timer()
+        try:
+            with context.savepoint() as conn:
+                conn = conn.execution_options(compiled_cache=_compiled_cache)
+                groups = cls.group_by_columns(as_dicts(records))
+                for columns, rows in groups.items():
+                    stmt = cls.upsert_statement(
+                        columns, update_on_conflict=False, ignore_on_conflict=False
+                    )
+                    conn.execute(stmt, rows)
+                cls.after_write(conn, records)
+        except IntegrityError as ie:
+            logger.warning(f"{cls.__table__.name}.insert_new: {ie}")
+            return False
+
+        exc_time = round(timer() - ts, 2)
+        cls.post_op_metrics(Operation.INSERT, "insert_new", len(records), exc_time)
+        return True
+
     @classmethod
     def bulk_insert(cls, records: List[Dict], size: int = None):
 
         affected: int = 0
         size = size or len(records)
 
-        for chunk in util.chunks(records, size):
+        for batch in util.batches(records, size):
 
-            cls.s.bulk_insert_mappings(cls, chunk)
+            cls.s.bulk_insert_mappings(cls, as_dicts(batch.items))
             cls.persist()
             logger.info(
-                f"{cls.__table__.name}.bulk_insert: inserted {len(records)} records"
+                f"{cls.__table__.name}.bulk_insert: inserted {batch.size} records"
+                f" (batch {batch.index})"
             )
-            affected += len(records)
+            affected += batch.size
         return affected
 
     @classmethod
@@ -188,48 +566,102 @@ class CoreMixin(object):
         affected: int = 0
         size = size or len(records)
 
-        for chunk in util.chunks(records, size):
-            cls.s.bulk_update_mappings(cls, chunk)
+        for batch in util.batches(records, size):
+            cls.s.bulk_update_mappings(cls, as_dicts(batch.items))
             cls.persist()
             logger.info(
-                f"{cls.__table__.name}.bulk_update: updated {len(records)} records"
+                f"{cls.__table__.name}.bulk_update: updated {batch.size} records"
+                f" (batch {batch.index})"
             )
-            affected += len(records)
+            affected += batch.size
         return affected
 
     @classmethod
     def bulk_merge(cls, records: List[Dict], size: int = None):
+        context = LoadContext.current()
+        if context is None:
+            with LoadContext(cls.s, name=cls.__table__.name):
+                return cls.bulk_merge(records, size=size)
+
         affected: int = 0
         size = size or len(records)
 
-        for chunk in util.chunks(records, size):
+        for batch in util.batches(records, size):
             ts = timer()
-            chunk = list(chunk)
-            cls.s.add_all([cls.s.merge(cls(**row)) for row in chunk])
-            cls.persist()
+            with context.savepoint():
+                objects = [cls(**cls.revive(row)) for row in batch.items]
+                merged = [cls.s.merge(obj) for obj in objects]
+                cls.stamp_locations(merged)
+                cls.s.add_all(merged)
+                cls.s.flush()
+                cls.after_write(cls.s, batch.items)
             exc_time = round(timer() - ts, 2)
-            n = len(chunk)
-            cls.post_op_metrics(Operation.MERGE, "bulk_merge", n, exc_time)
-            affected += len(records)
+            cls.post_op_metrics(
+                Operation.MERGE, "bulk_merge", batch.size, exc_time, batch.index
+            )
+            affected += batch.size
 
         return affected
 
+    @classmethod
+    def stamp_locations(cls, objects: List):
+        """ Move located_at on merged rows whose location columns changed, as
+            the upsert statement does """
+        if LOCATION_STAMP not in cls.__table__.c:
+            return
+        for obj in objects:
+            state = inspect(obj)
+            if state.persistent and any(
+                state.attrs[k].history.has_changes()
+                for k in LOCATION_COLUMNS
+                if k in state.attrs
+            ):
+                setattr(obj, LOCATION_STAMP, func.now())
+
+    @classmethod
+    def revive(cls, row: Dict) -> Dict:
+        """ The row, clearing its tombstone if the table has one """
+        if TOMBSTONE_COLUMN in cls.__table__.c and TOMBSTONE_COLUMN not in row:
+            return {**row, TOMBSTONE_COLUMN: None}
+        return row
+
+    @classmethod
+    def after_write(cls, conn, rows: List[Dict]):
+        """ Hook for maintaining derived data. Called with the connection (or
+            session) of each written batch, before its transaction commits. """
+        pass
+
+    @classmethod
+    def after_swap(cls, conn):
+        """ Hook for rebuilding derived data after a TableSwap has put a freshly
+            loaded table in place, before its transaction commits. """
+        pass
+
     @classmethod
     def post_op_metrics(
-        cls, method_type: Operation, method: str, n: int, exc_time: float
+        cls,
+        method_type: Operation,
+        method: str,
+        n: int,
+        exc_time: float,
+        batch_index: int = None,
     ):
         op_name = method_type.name.lower()
         tags = {"tablename": cls.__table__.name, "method": method}
         measurements = {
             f"{op_name}s": n,
             f"{op_name}_time": exc_time,
-            f"{op_name}s_per_second": n / exc_time or 1,
+            f"{op_name}s_per_second": n / (exc_time or 1),
         }
 
         for key, value in measurements.items():
             metrics.post(key, value, tags=tags)
 
+        # the batch index is unbounded, so it is logged but never used as a tag
+        extra = {**measurements, **tags}
+        if batch_index is not None:
+            extra["batch"] = batch_index
         logger.info(
             f"{cls.__table__.name}.{method}: {op_name}ed {n} records ({exc_time}s)",
-            extra=measurements,
+            extra=extra,
         )
@@ -1,5 +1,7 @@
+from typing import Iterable, List
 import logging
 
+from sqlalchemy import bindparam, text
 from sqlalchemy.sql import func
 
 from api.mixins import CoreMixin
@@ -28,6 +30,320 @@ class FracSchedule(CoreMixin, db.Model):
     shllon = db.Column(db.Float())
     bhllat = db.Column(db.Float())
     bhllon = db.Column(db.Float())
+    shl_geohash = db.Column(db.String(12))
+    bhl_geohash = db.Column(db.String(12))
+    removed_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    created_at = db.Column(
+        db.DateTime(timezone=True), default=func.now(), nullable=False
+    )
+    updated_at = db.Column(
+        db.DateTime(timezone=True), default=func.now(), nullable=False
+    )
+    located_at = db.Column(
+        db.DateTime(timezone=True), default=func.now(), nullable=False
+    )
+
+    @classmethod
+    def after_write(cls, conn, rows: List[dict]):
+        """ Keep derived data current for the rows in this batch """
+        api10s = {row.get("api10") for row in rows} - {None}
+        if api10s:
+            FracScheduleLatest.refresh(conn, api10s)
+
+        api14s = {row.get("api14") for row in rows} - {None}
+        if api14s and cls.s.bind.dialect.name == "postgresql":
+            cls.update_geometries(conn, api14s)
+
+    @classmethod
+    def after_swap(cls, conn):
+        conn.execute(FracScheduleLatest.rebuild_statement())
+
+    @classmethod
+    def database_now(cls):
+        """ Current time according to the database, for comparing with the
+            updated_at values it assigns """
+        return cls.s.query(func.now()).scalar()
+
+    @classmethod
+    def changed_since(cls, since) -> List[dict]:
+        """ Rows inserted or changed at or after the given database time """
+        columns = cls.__table__.columns
+        rows = cls.s.query(*columns).filter(cls.updated_at >= since).all()
+        return [row._asdict() for row in rows]
+
+    @classmethod
+    def geometry_statement(cls, table: str = None):
+        """ Set-based update of the PostGIS geometry columns. Limited to rows
+            inserted or changed in the current transaction (updated_at = now())
+            and rows that have never had their geometry populated.
+
+            Given another table with this layout (e.g. a shadow copy being loaded
+            for a swap), every row of that table is updated instead. """
+        sql = """
+            update {table} t set
+                shl = g.shl,
+                bhl = g.bhl,
+                stick = g.stick,
+                shl_webmercator = ST_Transform(g.shl, 3857),
+                bhl_webmercator = ST_Transform(g.bhl, 3857),
+                stick_webmercator = ST_Transform(g.stick, 3857)
+            from (
+                select
+                    id,
+                    ST_SetSRID(ST_MakePoint(shllon, shllat), 4326) as shl,
+                    case when bhllon is not null and bhllat is not null
+                        then ST_SetSRID(ST_MakePoint(bhllon, bhllat), 4326)
+                    end as bhl,
+                    case when bhllon is not null and bhllat is not null
+                        then ST_SetSRID(
+                            ST_MakeLine(
+                                ST_MakePoint(shllon, shllat),
+                                ST_MakePoint(bhllon, bhllat)
+                            ),
+                            4326
+                        )
+                    end as stick
+                from {table}
+                {where}
+            ) g
+            where t.id = g.id
+        """
+        if table is not None:
+            return text(sql.format(table=table, where=""))
+
+        where = "where api14 in :api14s and (updated_at = now() or shl is null)"
+        return text(sql.format(table=cls.__tablename__, where=where)).bindparams(
+            bindparam("api14s", expanding=True)
+        )
+
+    @classmethod
+    def update_geometries(cls, conn, api14s: Iterable[str]):
+        result = conn.execute(cls.geometry_statement(), {"api14s": sorted(api14s)})
+        logger.debug(f"{cls.__tablename__}: updated {result.rowcount} geometries")
+
+
+class FracScheduleLatest(CoreMixin, db.Model):
+    """ Id of the most recently inserted schedule for each api10. Maintained by
+        the loader, one batch at a time, so readers get a point lookup instead of
+        aggregating the whole schedule table. """
+
+    __tablename__ = f"{conf.FRAC_SCHEDULE_TABLE_NAME}_latest_by_api10"
+
+    api10 = db.Column(db.String(10), primary_key=True)
+    id = db.Column(db.Integer(), nullable=False)
+
+    @classmethod
+    def refresh_statement(cls, dialect: str):
+        params = {"latest": cls.__tablename__, "table": FracSchedule.__tablename__}
+        if dialect == "mssql":
+            sql = """
+                merge {latest} as target
+                using (
+                    select api10, max(id) as id
+                    from {table}
+                    where api10 in :api10s and removed_at is null
+                    group by api10
+                ) as source
+                on target.api10 = source.api10
+                when matched then update set id = source.id
+                when not matched then insert (api10, id)
+                    values (source.api10, source.id)
+                when not matched by source and target.api10 in :api10s
+                    then delete;
+            """
+        else:
+            sql = """
+                with fresh as (
+                    select api10, max(id) as id
+                    from {table}
+                    where api10 in :api10s and removed_at is null
+                    group by api10
+                ), gone as (
+                    delete from {latest}
+                    where api10 in :api10s
+                        and api10 not in (select api10 from fresh)
+                )
+                insert into {latest} (api10, id)
+                select api10, id from fresh
+                on conflict (api10) do update set id = excluded.id
+            """
+        return text(sql.format(**params)).bindparams(
+            bindparam("api10s", expanding=True)
+        )
+
+    @classmethod
+    def rebuild_statement(cls):
+        """ Recompute the latest id of every api10 (postgres) """
+        params = {"latest": cls.__tablename__, "table": FracSchedule.__tablename__}
+        sql = """
+            delete from {latest};
+            insert into {latest} (api10, id)
+            select api10, max(id)
+            from {table}
+            where api10 is not null and removed_at is null
+            group by api10
+        """
+        return text(sql.format(**params))
+
+    @classmethod
+    def refresh(cls, conn, api10s: Iterable[str]):
+        """ Recompute the latest id of the given api10s only, dropping api10s
+            whose schedules have all been removed. Runs on the passed connection
+            (or session) so it shares the transaction of the write. """
+        keys: List[str] = sorted(set(api10s))
+        stmt = cls.refresh_statement(cls.s.bind.dialect.name)
+        conn.execute(stmt, {"api10s": keys})
+        logger.debug(f"{cls.__tablename__}: refreshed {len(keys)} api10s")
+
+
+class IngestGeneration(CoreMixin, db.Model):
+    """ Monotonic counter bumped each time the collector writes to a table. Readers
+        use it to tell whether data has changed without querying the table itself.
+    """
+
+    __tablename__ = f"{conf.FRAC_SCHEDULE_TABLE_NAME}_generation"
+
+    name = db.Column(db.String(), primary_key=True)
+    generation = db.Column(db.BigInteger(), nullable=False, default=0)
+    updated_at = db.Column(
+        db.DateTime(timezone=True), default=func.now(), nullable=False
+    )
+
+    @classmethod
+    def current(cls, name: str) -> int:
+        return cls.s.query(cls.generation).filter(cls.name == name).scalar() or 0
+
+    @classmethod
+    def bump(cls, name: str) -> int:
+        """ Increment and return the generation for the given table name """
+        table = cls.__table__
+        result = cls.s.execute(
+            table.update()
+            .where(table.c.name == name)
+            .values(generation=table.c.generation + 1, updated_at=func.now())
+        )
+        if result.rowcount == 0:
+            cls.s.execute(table.insert().values(name=name, generation=1))
+        cls.persist()
+        return cls.current(name)
+
+
+class IngestJournal(CoreMixin, db.Model):
+    """ One row per attempt to ingest an export file. committed_rows is written
+        in the same transaction as the data it counts, so after a crash it is
+        exactly the number of rows of the file (from the top) that are in the
+        table, and a new run can pick up from there. """
+
+    __tablename__ = f"{conf.FRAC_SCHEDULE_TABLE_NAME}_ingest_journal"
+
+    RUNNING = "running"
+    COMPLETE = "complete"
+
+    id = db.Column(db.Integer(), primary_key=True, autoincrement=True)
+    filename = db.Column(db.String(), nullable=False)
+    modified = db.Column(db.String(50), nullable=True)
+    content_hash = db.Column(db.String(64), nullable=False)
+    size = db.Column(db.BigInteger(), nullable=False)
+    batch_size = db.Column(db.Integer(), nullable=False)
+    committed_rows = db.Column(db.BigInteger(), nullable=False, default=0)
+    status = db.Column(db.String(25), nullable=False, default=RUNNING)
+    created_at = db.Column(
+        db.DateTime(timezone=True), default=func.now(), nullable=False
+    )
+    updated_at = db.Column(
+        db.DateTime(timezone=True), default=func.now(), nullable=False
+    )
+
+    def __repr__(self):
+        return (
+            f"IngestJournal({self.id}): {self.filename} {self.status},"
+            f" {self.committed_rows} rows committed"
+        )
+
+    @classmethod
+    def resumable(cls, filename: str, modified: str = None):
+        """ The latest unfinished ingest of the given file, if any """
+        return (
+            cls.s.query(cls)
+            .filter(
+                cls.filename == filename,
+                cls.modified == modified,
+                cls.status == cls.RUNNING,
+            )
+            .order_by(cls.id.desc())
+            .first()
+        )
+
+    @classmethod
+    def start(
+        cls,
+        filename: str,
+        content_hash: str,
+        size: int,
+        batch_size: int,
+        modified: str = None,
+    ) -> "IngestJournal":
+        """ Record (and commit) the start of a new ingest """
+        entry = cls(
+            filename=filename,
+            modified=modified,
+            content_hash=content_hash,
+            size=size,
+            batch_size=batch_size,
+            committed_rows=0,
+            status=cls.RUNNING,
+        )
+        cls.persist_objects([entry])
+        return entry
+
+    def advance(self, committed_rows: int):
+        """ Record progress in the current transaction, to be committed with the
+            rows it counts """
+        self.committed_rows = committed_rows
+        self.updated_at = func.now()
+        self.s.flush()
+
+    def complete(self):
+        """ Mark the ingest finished in the current transaction """
+        self.status = self.COMPLETE
+        self.updated_at = func.now()
+        self.s.flush()
+
+
+class Watchlist(CoreMixin, db.Model):
+    """ Locations (typically our own wells) to be alerted about when a frac is
+        scheduled within radius miles of them """
+
+    __tablename__ = f"{conf.FRAC_SCHEDULE_TABLE_NAME}_watchlist"
+
+    id = db.Column(db.Integer(), primary_key=True, autoincrement=True)
+    name = db.Column(db.String(), nullable=False)
+    api14 = db.Column(db.String(14), nullable=True)
+    lat = db.Column(db.Float(), nullable=False)
+    lon = db.Column(db.Float(), nullable=False)
+    radius = db.Column(db.Float(), nullable=False)
+    created_at = db.Column(
+        db.DateTime(timezone=True), default=func.now(), nullable=False
+    )
+    updated_at = db.Column(
+        db.DateTime(timezone=True), default=func.now(), nullable=False
+    )
+
+
+class Alert(CoreMixin, db.Model):
+    """ A frac schedule that was new or changed within range of a watched
+        location. One row per watched location and schedule. """
+
+    __tablename__ = f"{conf.FRAC_SCHEDULE_TABLE_NAME}_alerts"
+
+    watch_id = db.Column(db.Integer(), primary_key=True)
+    api14 = db.Column(db.String(14), primary_key=True)
+    frac_start_date = db.Column(db.Date(), primary_key=True)
+    frac_end_date = db.Column(db.Date(), primary_key=True)
+    operator = db.Column(db.String())
+    wellname = db.Column(db.String())
+    distance = db.Column(db.Float(), nullable=False)
+    reason = db.Column(db.String(25), nullable=False)
     created_at = db.Column(
         db.DateTime(timezone=True), default=func.now(), nullable=False
     )
@@ -0,0 +1,113 @@
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, List, Tuple, Type
+from collections import abc
+import functools
+
+from flask_sqlalchemy import Model
+
+
+class _Missing(object):
+    """ Placeholder for fields that were never assigned """
+
+    def __repr__(self):
+        return "<missing>"
+
+    def __reduce__(self):
+        return "MISSING"
+
+
+MISSING = _Missing()
+
+
+class Record(abc.MutableMapping):
+    """ Compact, schema-bound row. Field names live once on the generated class
+        (as __slots__) instead of being repeated as keys in every row. Unassigned
+        fields are omitted from keys(), so database defaults still apply to them.
+    """
+
+    __slots__ = ()
+    _fields: Tuple[str, ...] = ()
+    _field_set: FrozenSet[str] = frozenset()
+
+    def __init__(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Record":
+        return cls(data)
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._field_set:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any):
+        if key not in self._field_set:
+            raise KeyError(f"{self.__class__.__name__} has no field '{key}'")
+        setattr(self, key, value)
+
+    def __delitem__(self, key: str):
+        if key in self._field_set:
+            try:
+                return delattr(self, key)
+            except AttributeError:
+                pass
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        for name in self._fields:
+            if hasattr(self, name):
+                yield name
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._field_set and hasattr(self, key)
+
+    def __repr__(self):
+        values = ", ".join(f"{k}={v!r}" for k, v in self.items())
+        return f"{self.__class__.__name__}({values})"
+
+    def __reduce__(self):
+        values = tuple(getattr(self, name, MISSING) for name in self._fields)
+        return (_rebuild, (self.__class__.__name__, self._fields, values))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self}
+
+
+@functools.lru_cache(maxsize=None)
+def make_record_type(name: str, fields: Tuple[str, ...]) -> Type[Record]:
+    """ Generate (once) a Record subclass with the given field names """
+    namespace = {
+        "__slots__": tuple(fields),
+        "_fields": tuple(fields),
+        "_field_set": frozenset(fields),
+        "__module__": __name__,
+    }
+    return type(name, (Record,), namespace)
+
+
+def record_type_for(model: Model) -> Type[Record]:
+    """ Record type with one field per column of the given model """
+    fields = tuple(model.__table__.columns.keys())
+    return make_record_type(f"{model.__name__}Record", fields)
+
+
+def as_dicts(rows: Iterable) -> List[Dict[str, Any]]:
+    """ Materialize plain dicts for APIs that require them (e.g. multi-row
+        Insert.values), leaving dict rows untouched """
+    return [row.to_dict() if isinstance(row, Record) else row for row in rows]
+
+
+def _rebuild(name: str, fields: Tuple[str, ...], values: Tuple[Any, ...]) -> Record:
+    cls = make_record_type(name, fields)
+    record = cls.__new__(cls)
+    for field, value in zip(fields, values):
+        if value is not MISSING:
+            setattr(record, field, value)
+    return record
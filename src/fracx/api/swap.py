@@ -0,0 +1,253 @@
+from typing import Dict, List, Tuple
+import logging
+import re
+
+from sqlalchemy import MetaData, Table, text
+
+from api.mixins import AUDIT_COLUMNS, LOCATION_COLUMNS, LOCATION_STAMP, LoadContext
+from api.records import as_dicts
+from config import get_active_config
+from util import RootException
+
+logger = logging.getLogger(__name__)
+
+conf = get_active_config()
+
+# shadow copies of model tables, created once per process
+_shadow_metadata = MetaData()
+
+
+class TableSwapError(RootException):
+    pass
+
+
+class TableSwap(object):
+    """ Full refresh of a model's table from a complete snapshot (postgres only).
+
+        Rows are bulk loaded into a shadow copy of the table that has only its
+        primary key, so the load does not maintain any other index. When the load
+        is finished, the shadow table gets the ids and created_at of the rows it
+        shares with the live table (and their updated_at, if nothing changed),
+        its geometries, and copies of the live table's indexes. It is then
+        renamed into place. Rows missing from the snapshot disappear with the
+        old table.
+
+        Everything runs in the transaction of the open LoadContext. Readers keep
+        seeing the old table until it commits, and then see the new one all at
+        once. The live table is only locked for the renames at the very end.
+    """
+
+    def __init__(self, model, schema: str = None):
+        self.model = model
+        self.schema = schema or conf.DATABASE_SCHEMA
+        self.name = model.__tablename__
+        self.shadow = f"{self.name}_shadow"
+        self.retired = f"{self.name}_retired"
+        self.table = self.shadow_table(model)
+        self.rows = 0
+        self.indexes: List[Tuple[str, str]] = []
+
+    def __repr__(self):
+        return f"TableSwap: {self.shadow} -> {self.name} ({self.rows} rows)"
+
+    @staticmethod
+    def shadow_table(model) -> Table:
+        name = f"{model.__tablename__}_shadow"
+        if name not in _shadow_metadata.tables:
+            model.__table__.tometadata(_shadow_metadata, name=name)
+        return _shadow_metadata.tables[name]
+
+    def qualify(self, name: str) -> str:
+        return f"{self.schema}.{name}"
+
+    @property
+    def primary_key(self) -> List[str]:
+        return self.model.primary_key_names()
+
+    def _context(self) -> LoadContext:
+        context = LoadContext.current()
+        if context is None:
+            raise TableSwapError("A table swap must run inside a load context")
+        return context
+
+    def _execute(self, conn, sql: str, **params):
+        return conn.execute(text(sql), params)
+
+    @staticmethod
+    def _escape(sql: str) -> str:
+        """ Escape colons in SQL read back from the catalog (e.g. ::casts), so
+            text() does not mistake them for bind parameters """
+        return sql.replace(":", "\\:")
+
+    def begin(self):
+        """ Create an empty shadow table and capture the live table's indexes """
+        conn = self._context().session.connection()
+        live, shadow = self.qualify(self.name), self.qualify(self.shadow)
+        self._execute(conn, f"drop table if exists {shadow}")
+        self._execute(
+            conn,
+            f"create table {shadow}"
+            f" (like {live} including defaults including constraints)",
+        )
+        keys = ", ".join(self.primary_key)
+        self._execute(conn, f"alter table {shadow} add primary key ({keys})")
+        self.indexes = self._indexes(conn)
+        self.rows = 0
+        logger.info(f"Created {shadow} for a full refresh of {live}")
+
+    def load(self, rows: List[Dict]):
+        """ Write a batch into the shadow table. A later row replaces an earlier
+            one with the same key. """
+        context = self._context()
+        groups = self.model.group_by_columns(as_dicts(rows))
+        with context.savepoint() as conn:
+            for columns, batch in groups.items():
+                stmt = self.model.upsert_statement(columns, table=self.table)
+                conn.execute(stmt, batch)
+        self.rows += len(rows)
+
+    def finish(self):
+        """ Complete the shadow table and rename it into place """
+        conn = self._context().session.connection()
+        live, shadow = self.qualify(self.name), self.qualify(self.shadow)
+
+        result = conn.execute(self.carry_over_statement())
+        logger.info(f"{shadow}: carried over {result.rowcount} existing rows")
+        conn.execute(self.model.geometry_statement(table=shadow))
+        for name, definition in self.indexes:
+            self._execute(conn, self.shadow_index(name, definition))
+        self._execute(conn, f"analyze {shadow}")
+        logger.info(f"{shadow}: built {len(self.indexes)} indexes")
+
+        sequence = self._execute(
+            conn, "select pg_get_serial_sequence(:table, 'id')", table=live
+        ).scalar()
+        views = self._views(conn)
+
+        for sql in self.swap_statements(sequence, views):
+            self._execute(conn, sql)
+        self.model.after_swap(conn)
+        logger.info(f"Swapped {shadow} into {live} ({self.rows} rows loaded)")
+
+    def carry_over_statement(self):
+        """ Keep the identity and history of rows that are already live: their
+            id and created_at always, their updated_at when no other value has
+            changed, and their located_at when no location has, so only real
+            changes appear as changed """
+        keys = self.primary_key
+        compare = [
+            c.name
+            for c in self.table.columns
+            if c.name not in keys and c.name not in AUDIT_COLUMNS
+        ]
+        match = " and ".join(f"s.{k} = l.{k}" for k in keys)
+        shadow_values = ", ".join(f"s.{c}" for c in compare)
+        live_values = ", ".join(f"l.{c}" for c in compare)
+        located = ""
+        if LOCATION_STAMP in self.table.c:
+            shadow_locations = ", ".join(f"s.{c}" for c in LOCATION_COLUMNS)
+            live_locations = ", ".join(f"l.{c}" for c in LOCATION_COLUMNS)
+            located = f""",
+                {LOCATION_STAMP} = case
+                    when ({shadow_locations}) is not distinct from ({live_locations})
+                    then l.{LOCATION_STAMP}
+                    else s.{LOCATION_STAMP}
+                end"""
+        sql = f"""
+            update {self.qualify(self.shadow)} s set
+                id = l.id,
+                created_at = l.created_at,
+                updated_at = case
+                    when ({shadow_values}) is not distinct from ({live_values})
+                    then l.updated_at
+                    else s.updated_at
+                end{located}
+            from {self.qualify(self.name)} l
+            where {match}
+        """
+        return text(sql)
+
+    def _indexes(self, conn) -> List[Tuple[str, str]]:
+        """ (name, definition) of the live table's indexes, except its primary
+            key, which the shadow table already has """
+        rows = self._execute(
+            conn,
+            """
+            select i.indexname, i.indexdef
+            from pg_indexes i
+            where i.schemaname = :schema
+                and i.tablename = :table
+                and i.indexname not in (
+                    select conname from pg_constraint
+                    where conrelid = cast(:qualified as regclass)
+                        and contype = 'p'
+                )
+            order by i.indexname
+            """,
+            schema=self.schema,
+            table=self.name,
+            qualified=self.qualify(self.name),
+        )
+        return [(name, self._escape(definition)) for name, definition in rows]
+
+    def _views(self, conn) -> List[Tuple[str, str]]:
+        """ (name, definition) of the views that select from the live table.
+            Views follow a table through a rename, so they are re-pointed at
+            the new table after the swap. """
+        rows = self._execute(
+            conn,
+            """
+            select distinct cast(v.oid as regclass)::text, pg_get_viewdef(v.oid)
+            from pg_depend d
+                join pg_rewrite r on r.oid = d.objid
+                join pg_class v on v.oid = r.ev_class
+            where d.refobjid = cast(:table as regclass)
+                and v.oid <> d.refobjid
+                and v.relkind = 'v'
+            """,
+            table=self.qualify(self.name),
+        )
+        return [(name, self._escape(definition)) for name, definition in rows]
+
+    def shadow_index(self, name: str, definition: str) -> str:
+        """ The definition of a live index, rewritten for the shadow table """
+        pattern = re.compile(
+            rf"^(CREATE (?:UNIQUE )?INDEX ){re.escape(name)}"
+            rf" ON (?:ONLY )?{re.escape(self.qualify(self.name))} ",
+            re.IGNORECASE,
+        )
+        sql, count = pattern.subn(
+            rf"\g<1>{name}_shadow ON {self.qualify(self.shadow)} ", definition
+        )
+        if not count:
+            raise TableSwapError(f"Unrecognized index definition: {definition}")
+        return sql
+
+    def swap_statements(
+        self, sequence: str = None, views: List[Tuple[str, str]] = None
+    ) -> List[str]:
+        """ Statements that put the shadow table in place of the live one """
+        live, shadow = self.qualify(self.name), self.qualify(self.shadow)
+        retired = self.qualify(self.retired)
+        statements = [
+            f"lock table {live} in access exclusive mode",
+            f"alter table {live} rename to {self.retired}",
+            f"alter table {retired}"
+            f" rename constraint {self.name}_pkey to {self.retired}_pkey",
+            f"alter table {shadow} rename to {self.name}",
+            f"alter table {live}"
+            f" rename constraint {self.shadow}_pkey to {self.name}_pkey",
+        ]
+        for name, _ in self.indexes:
+            statements += [
+                f"alter index {self.qualify(name)} rename to {name}_retired",
+                f"alter index {self.qualify(name)}_shadow rename to {name}",
+            ]
+        if sequence:
+            # the id sequence belongs to the old table and would be dropped
+            # with it
+            statements.append(f"alter sequence {sequence} owned by {live}.id")
+        for name, definition in views or []:
+            statements.append(f"create or replace view {name} as {definition}")
+        statements.append(f"drop table {retired}")
+        return statements
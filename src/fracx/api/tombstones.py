@@ -0,0 +1,170 @@
+from typing import Dict, List
+import logging
+
+from sqlalchemy import Column, MetaData, Table, and_, exists, func, select
+
+from api.mixins import TOMBSTONE_COLUMN, LoadContext
+from config import get_active_config
+from util import RootException
+
+logger = logging.getLogger(__name__)
+
+conf = get_active_config()
+
+
+class TombstoneError(RootException):
+    pass
+
+
+class Tombstones(object):
+    """ Marks the rows of a model's table that have disappeared from a complete
+        snapshot of the source, such as a cancelled frac missing from the latest
+        export.
+
+        While the snapshot is loaded, the keys of every row are staged in a
+        temporary table. When it is finished, a single anti-join finds the
+        active rows whose keys were not staged and stamps them removed. Neither
+        the table's keys nor the snapshot's are ever held in Python.
+
+        If the snapshot would remove more than max_ratio of the active rows,
+        it is assumed to be truncated and nothing is marked.
+
+        Everything runs in the transaction of the open LoadContext, so the
+        staging table and the marks are rolled back with a failed load. For a
+        load that commits at checkpoints, pass durable=True: the staging table
+        is then a regular table, committed with the rows whose keys it holds,
+        so a resumed load can pick it up where the interrupted one left off.
+        Its name ends in suffix (e.g. the id of the load's journal), so loads
+        running at the same time never share one. It is dropped when the load
+        finishes.
+    """
+
+    def __init__(
+        self,
+        model,
+        max_ratio: float = None,
+        durable: bool = False,
+        suffix: str = None,
+    ):
+        self.model = model
+        self.max_ratio = (
+            conf.COLLECTOR_TOMBSTONE_MAX_RATIO if max_ratio is None else max_ratio
+        )
+        self.durable = durable
+        self.suffix = suffix
+        self.keys = model.primary_key_names()
+        self.partial = False
+        self.staged = 0
+        self.removed = 0
+        self.staging: Table = None
+
+    def __repr__(self):
+        return (
+            f"Tombstones: {self.model.__tablename__}"
+            f" ({self.staged} staged, {self.removed} removed)"
+        )
+
+    def _connection(self):
+        context = LoadContext.current()
+        if context is None:
+            raise TombstoneError("Tombstones must be tracked inside a load context")
+        return context.session.connection()
+
+    def staging_table(self, dialect: str) -> Table:
+        """ Temporary table holding the primary keys of the snapshot """
+        table = self.model.__table__
+        name = f"{table.name}_snapshot_keys"
+        columns = [Column(k, table.c[k].type) for k in self.keys]
+        if self.durable:
+            if self.suffix is not None:
+                name = f"{name}_{self.suffix}"
+            return Table(name, MetaData(), *columns)
+        if dialect == "mssql":
+            return Table(f"#{name}", MetaData(), *columns)
+        return Table(name, MetaData(), *columns, prefixes=["TEMPORARY"])
+
+    def begin(self, resume: bool = False):
+        """ Create the staging table, or when resuming an interrupted load, keep
+            the durable one it left behind """
+        conn = self._connection()
+        self.staging = self.staging_table(conn.dialect.name)
+        self.staged = self.removed = 0
+        self.partial = False
+        if resume:
+            if self.durable and self.staging.exists(conn):
+                self.staged = conn.execute(
+                    select([func.count()]).select_from(self.staging)
+                ).scalar()
+                logger.info(f"{self}: resuming")
+                return
+            # the keys of the rows loaded before the interruption are gone
+            self.partial = True
+        if self.durable:
+            self.staging.drop(conn, checkfirst=True)
+        self.staging.create(conn)
+
+    def add(self, rows: List[Dict]):
+        """ Stage the keys of a batch of snapshot rows """
+        if self.staging is None:
+            raise TombstoneError("Tombstones.begin() has not been called")
+        keys = [{k: row[k] for k in self.keys} for row in rows]
+        if keys:
+            self._connection().execute(self.staging.insert(), keys)
+            self.staged += len(keys)
+
+    def missing(self):
+        """ Criteria for active rows whose keys are not in the snapshot """
+        table = self.model.__table__
+        match = and_(*[self.staging.c[k] == table.c[k] for k in self.keys])
+        return and_(
+            table.c[TOMBSTONE_COLUMN].is_(None),
+            ~exists().where(match),
+        )
+
+    def finish(self) -> int:
+        """ Mark the rows missing from the snapshot as removed and return how
+            many were marked """
+        conn = self._connection()
+        table = self.model.__table__
+        try:
+            if not self.staged:
+                logger.warning(f"{self}: snapshot is empty, not marking removals")
+                return 0
+            if self.partial:
+                logger.warning(f"{self}: snapshot is incomplete, not marking removals")
+                return 0
+
+            if conn.dialect.name == "postgresql":
+                conn.execute(f"analyze {self.staging.name}")
+            active = conn.execute(
+                select([func.count()]).where(table.c[TOMBSTONE_COLUMN].is_(None))
+            ).scalar()
+            missing = conn.execute(
+                select([func.count()]).select_from(table).where(self.missing())
+            ).scalar()
+            if active and missing / active > self.max_ratio:
+                logger.error(
+                    f"{self}: {missing} of {active} active rows are missing from"
+                    f" the snapshot (more than {self.max_ratio:.0%}), not marking"
+                    f" removals"
+                )
+                return 0
+
+            api10s = [
+                api10
+                for (api10,) in conn.execute(
+                    select([table.c.api10]).distinct().where(self.missing())
+                )
+            ]
+            result = conn.execute(
+                table.update()
+                .where(self.missing())
+                .values({TOMBSTONE_COLUMN: func.now()})
+            )
+            self.removed = result.rowcount
+            self.model.after_write(conn, [{"api10": api10} for api10 in api10s])
+            logger.info(f"{self}: marked {self.removed} rows removed")
+            return self.removed
+        finally:
+            self.staging.drop(conn)
+            self.staging = None
@@ -0,0 +1,273 @@
+from typing import Any, Generator, List, NamedTuple, Optional, Tuple
+from datetime import date
+import base64
+import json
+import logging
+
+import dateutil.parser
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from sqlalchemy import and_, func, literal_column, or_, tuple_
+
+from api.cache import GenerationClock, ResponseCache, make_etag
+from api.models import FracSchedule, IngestGeneration
+from config import get_active_config
+from fracx import db
+from util import RootException, geohash
+from util.jsontools import DateTimeEncoder
+
+logger = logging.getLogger(__name__)
+
+conf = get_active_config()
+
+blueprint = Blueprint("frac_schedules", __name__)
+
+response_cache = ResponseCache(
+    max_entries=conf.API_CACHE_MAX_ENTRIES,
+    max_body_bytes=conf.API_CACHE_MAX_BODY_BYTES,
+)
+
+current_generation = GenerationClock(
+    lambda: IngestGeneration.current(FracSchedule.__tablename__),
+    ttl=conf.API_GENERATION_TTL,
+)
+
+
+class InvalidQueryError(RootException):
+    pass
+
+
+BBox = Tuple[float, float, float, float]
+Cursor = Tuple[str, date, date]
+
+
+class ScheduleQuery(NamedTuple):
+    """ Normalized query parameters for the frac schedule listing """
+
+    api10: Optional[str] = None
+    operator: Optional[str] = None
+    start: Optional[date] = None
+    end: Optional[date] = None
+    bbox: Optional[BBox] = None
+    limit: int = 1000
+    cursor: Optional[Cursor] = None
+
+
+def encode_cursor(key: Cursor) -> str:
+    """ Opaque, url safe representation of a primary key """
+    api14, start, end = key
+    raw = json.dumps([api14, start.isoformat(), end.isoformat()])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(value: str) -> Cursor:
+    try:
+        api14, start, end = json.loads(base64.urlsafe_b64decode(value.encode()))
+        return str(api14), parse_date(start), parse_date(end)
+    except InvalidQueryError:
+        raise
+    except Exception:
+        raise InvalidQueryError(f"invalid cursor: {value}")
+
+
+def parse_date(value: str) -> date:
+    try:
+        return dateutil.parser.parse(value).date()
+    except (ValueError, OverflowError):
+        raise InvalidQueryError(f"invalid date: {value}")
+
+
+def parse_bbox(value: str) -> BBox:
+    """ min_lon,min_lat,max_lon,max_lat """
+    try:
+        min_lon, min_lat, max_lon, max_lat = [float(x) for x in value.split(",")]
+    except ValueError:
+        raise InvalidQueryError(
+            f"invalid bbox: {value} (expected min_lon,min_lat,max_lon,max_lat)"
+        )
+    if min_lon > max_lon or min_lat > max_lat:
+        raise InvalidQueryError(f"invalid bbox: {value} (min > max)")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def parse_query(args: dict) -> ScheduleQuery:
+    try:
+        limit = int(args.get("limit", conf.API_PAGE_SIZE))
+    except ValueError:
+        raise InvalidQueryError(f"invalid limit: {args.get('limit')}")
+    if not 0 < limit <= conf.API_MAX_PAGE_SIZE:
+        raise InvalidQueryError(
+            f"limit must be between 1 and {conf.API_MAX_PAGE_SIZE}"
+        )
+
+    start = args.get("start")
+    end = args.get("end")
+    bbox = args.get("bbox")
+    cursor = args.get("cursor")
+
+    return ScheduleQuery(
+        api10=args.get("api10") or None,
+        operator=args.get("operator") or None,
+        start=parse_date(start) if start else None,
+        end=parse_date(end) if end else None,
+        bbox=parse_bbox(bbox) if bbox else None,
+        limit=limit,
+        cursor=decode_cursor(cursor) if cursor else None,
+    )
+
+
+def after_key(columns: List, key: Cursor, dialect: str):
+    """ Seek predicate selecting rows ordered after the given primary key """
+    if dialect == "postgresql":
+        # row value comparison is index-backed in postgres
+        return tuple_(*columns) > tuple_(*key)
+
+    # expanded form for backends without row value comparison (e.g. sql server)
+    clause = columns[-1] > key[-1]
+    for column, value in reversed(list(zip(columns[:-1], key[:-1]))):
+        clause = or_(column > value, and_(column == value, clause))
+    return clause
+
+
+def geohash_filter(column, bbox: BBox):
+    """ Match values of a full precision geohash column inside the cells
+        covering the bbox, as a handful of index range seeks """
+    clauses = []
+    for low, high in geohash.ranges(bbox):
+        if high is None:
+            clauses.append(column >= low)
+        else:
+            clauses.append(and_(column >= low, column < high))
+    return or_(*clauses)
+
+
+def build_query(q: ScheduleQuery, dialect: str = None):
+    model = FracSchedule
+    dialect = dialect or db.session.bind.dialect.name
+    pks = model.primary_key_columns()
+    query = db.session.query(*model.__table__.columns).filter(
+        model.removed_at.is_(None)
+    )
+
+    if q.api10:
+        query = query.filter(model.api10 == q.api10)
+    if q.operator:
+        query = query.filter(model.operator == q.operator)
+    if q.start:  # schedules still active on or after the window start
+        query = query.filter(model.frac_end_date >= q.start)
+    if q.end:  # schedules starting on or before the window end
+        query = query.filter(model.frac_start_date <= q.end)
+    if q.bbox:
+        min_lon, min_lat, max_lon, max_lat = q.bbox
+        if dialect == "postgresql":
+            # bounding box overlap on the gist indexed surface location
+            envelope = func.ST_MakeEnvelope(min_lon, min_lat, max_lon, max_lat, 4326)
+            shl = literal_column(f"{model.__tablename__}.shl")
+            query = query.filter(shl.op("&&")(envelope))
+        else:
+            # seek the indexed geohash ranges covering the box, then trim exactly
+            query = query.filter(
+                geohash_filter(model.shl_geohash, q.bbox),
+                model.shllon.between(min_lon, max_lon),
+                model.shllat.between(min_lat, max_lat),
+            )
+    if q.cursor:
+        query = query.filter(after_key(pks, q.cursor, dialect))
+
+    # one extra row to detect whether another page exists
+    return query.order_by(*pks).limit(q.limit + 1)
+
+
+def stream_page(q: ScheduleQuery, query) -> Generator[str, None, None]:
+    """ Serialize a page of results as JSON, one row at a time """
+    pk_names = FracSchedule.primary_key_names()
+    rows = query.execution_options(stream_results=True).yield_per(
+        conf.API_STREAM_BATCH_SIZE
+    )
+
+    yield '{"data": ['
+    count = 0
+    last: Any = None
+    for row in rows:
+        if count == q.limit:
+            break
+        row = row._asdict()
+        yield ("," if count else "") + json.dumps(row, cls=DateTimeEncoder)
+        last = row
+        count += 1
+    else:
+        last = None  # exhausted: no next page
+
+    next_cursor = encode_cursor(tuple(last[k] for k in pk_names)) if last else None
+    trailer = json.dumps({"count": count, "next": next_cursor})
+    yield "], " + trailer[1:]
+
+
+def cache_stream(
+    key: Any, generation: int, chunks: Generator[str, None, None]
+) -> Generator[str, None, None]:
+    """ Pass chunks through to the client, saving the complete body to the
+        response cache if the stream finishes, the body is small enough, and
+        no ingest has committed since generation was read """
+    buffer: Optional[List[str]] = []
+    size = 0
+    for chunk in chunks:
+        if buffer is not None:
+            size += len(chunk.encode())
+            if size > response_cache.max_body_bytes:
+                buffer = None
+            else:
+                buffer.append(chunk)
+        yield chunk
+
+    if buffer is not None:
+        if current_generation.refresh() == generation:
+            response_cache.set(key, "".join(buffer))
+        else:
+            logger.debug("Not caching a page read while the table changed")
+
+
+@blueprint.errorhandler(InvalidQueryError)
+def handle_invalid_query(e):
+    return jsonify({"error": str(e)}), 400
+
+
+@blueprint.route("/frac_schedules", methods=["GET"])
+def list_frac_schedules():
+    """ List frac schedules in primary key order.
+
+        Query parameters:
+            api10: exact api10
+            operator: exact operator name
+            start, end: only schedules active within the date window
+            bbox: min_lon,min_lat,max_lon,max_lat of the surface location
+            limit: page size
+            cursor: value of "next" from the previous page
+    """
+    q = parse_query(request.args)
+    # the clock can lag an ingest by up to its ttl, so read the generation now
+    # before validating an etag or serving a body from (or saving to) the cache
+    generation = current_generation.refresh()
+
+    if generation is None:  # generation unknown, serve without caching
+        return Response(
+            stream_with_context(stream_page(q, build_query(q))),
+            mimetype="application/json",
+        )
+
+    etag = make_etag(generation, q)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        key = (q, generation)
+        body = response_cache.get(key)
+        if body is None:
+            chunks = cache_stream(key, generation, stream_page(q, build_query(q)))
+            response = Response(
+                stream_with_context(chunks), mimetype="application/json"
+            )
+        else:
+            response = Response(body, mimetype="application/json")
+
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
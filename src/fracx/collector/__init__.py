@@ -4,3 +4,6 @@ from collector.endpoint import Endpoint
 from collector.collector import Collector, FracScheduleCollector
 from collector.transformer import Transformer
 from collector.filehandler import BytesFileHandler
+from collector.dedupe import Deduplicator
+from collector.pipeline import Pipeline, PipelineError
+from collector.journal import DownloadCache, IngestError, open_ingest
@@ -1,11 +1,18 @@
-from typing import Dict, List, Union, Iterable
+from typing import Dict, Iterator, List, Type, Union, Iterable
+from contextlib import contextmanager
 import logging
 
 from flask_sqlalchemy import Model
 
 
 from api.models import *  # noqa
+from api.mixins import LoadContext
+from api.models import IngestGeneration, IngestJournal
+from api.records import Record, record_type_for
+from api.swap import TableSwap
+from api.tombstones import Tombstones
 from collector.endpoint import Endpoint
+from collector.keyindex import KeyIndex
 from collector.transformer import Transformer
 from config import get_active_config
 
@@ -42,6 +49,10 @@ class Collector(object):
             self._model = self.endpoint.model
         return self._model
 
+    @property
+    def record_type(self) -> Type[Record]:
+        return record_type_for(self.model)
+
     @property
     def tf(self):
         if self._tf is None:
@@ -49,14 +60,39 @@ class Collector(object):
                 aliases=self.endpoint.mappings.get("aliases", {}),
                 exclude=self.endpoint.exclude,
                 ignore_unknown=self.endpoint.ignore_unknown,
+                record_type=self.record_type,
             )
         return self._tf
 
-    def transform(self, data: dict) -> dict:
+    def transform(self, data: dict) -> Record:
         return self.tf.transform(data)
 
 
 class FracScheduleCollector(Collector):
+    """ Writes frac schedules to their model's table. In "upsert" mode rows are
+        merged into the live table, except those the collector's key index has
+        never seen, which are simply inserted; in "swap" mode (postgres only) the
+        table is rebuilt from the rows in a shadow copy and swapped into place.
+    """
+
+    started_at = None
+    modes = ("upsert", "swap")
+
+    def __init__(
+        self,
+        endpoint: Endpoint,
+        functions: Dict[Union[str, None], Union[str, None]] = None,
+        mode: str = "upsert",
+    ):
+        super().__init__(endpoint, functions=functions)
+        if mode not in self.modes:
+            raise ValueError(f"mode must be one of {self.modes}")
+        self.mode = mode
+        self.swap: Union[TableSwap, None] = None
+        self.tombstones: Union[Tombstones, None] = None
+        self.keys: Union[KeyIndex, None] = None
+        self.journal: Union[IngestJournal, None] = None
+
     def collect(
         self,
         iterable: Iterable,
@@ -82,6 +118,47 @@ class FracScheduleCollector(Collector):
         update_on_conflict: bool = True,
         ignore_on_conflict: bool = False,
     ):
+        if self.started_at is None:
+            # database time, so it is comparable with the updated_at it assigns
+            self.started_at = self.model.database_now()
+
+        if self.swap is not None:
+            self.swap.load(rows)
+        else:
+            existing = rows
+            if self.keys is not None:
+                # rows the key index has never seen go in with a plain insert;
+                # if it was wrong about any of them, the batch is upserted
+                new, existing = self.keys.split(rows)
+                if new and not self.model.insert_new(new):
+                    existing = rows
+            if existing:
+                self.write(existing, update_on_conflict, ignore_on_conflict)
+        if self.keys is not None:
+            self.keys.add(rows)
+        if self.tombstones is not None:
+            self.tombstones.add(rows)
+        if LoadContext.current() is None:
+            self.bump_generation()
+        rows = []
+
+    def skip(self, rows: List[Dict]):
+        """ Rows of the snapshot that are not loaded (e.g. dropped by filter).
+            Their keys are still staged, so the live rows they correspond to
+            are not marked removed. Rows without a complete key are ignored. """
+        if self.tombstones is not None:
+            keys = self.tombstones.keys
+            self.tombstones.add(
+                [row for row in rows if all(row.get(k) is not None for k in keys)]
+            )
+
+    def write(
+        self,
+        rows: List[Dict],
+        update_on_conflict: bool = True,
+        ignore_on_conflict: bool = False,
+    ):
+        """ Upsert rows into the live table """
         if "pymssql" in conf.DATABASE_DRIVER:
             self.model.bulk_merge(rows)
         else:
@@ -90,7 +167,86 @@ class FracScheduleCollector(Collector):
                 update_on_conflict=update_on_conflict,
                 ignore_on_conflict=ignore_on_conflict,
             )
-        rows = []
+
+    def checkpoint(self, committed_rows: int):
+        """ Commit the rows loaded so far, recording in the journal how many
+            rows of the file they cover. Without a journal the load could not be
+            resumed from the commit, and its temporary staging tables would not
+            survive it, so this does nothing; nor in swap mode, as swap loads
+            only commit once. """
+        context = LoadContext.current()
+        if context is None or self.swap is not None or self.journal is None:
+            return
+        self.journal.advance(committed_rows)
+        self.bump_generation()
+        context.checkpoint()
+
+    @contextmanager
+    def load_context(self) -> Iterator[LoadContext]:
+        """ Persist everything written inside the block in one transaction (or
+            in several, when it checkpoints), bumping the ingest generation once
+            it has committed. The rows are taken to be a complete snapshot: in
+            swap mode they go to a shadow table that replaces the live one at
+            the end of the block, otherwise live rows missing from them are
+            marked removed. If the collector has a journal, the ingest is marked
+            complete in the final transaction, and a journal with committed rows
+            resumes the interrupted load. The key index, if enabled, is restored
+            from the last run or rebuilt on entry, and saved on success. """
+        journal = self.journal
+        with LoadContext(self.model.s, name=self.model.__tablename__) as context:
+            if self.mode == "swap":
+                self.swap = TableSwap(self.model)
+                self.swap.begin()
+            else:
+                if journal is not None:
+                    # staged keys are committed at every checkpoint
+                    self.tombstones = Tombstones(
+                        self.model, durable=True, suffix=journal.id
+                    )
+                else:
+                    self.tombstones = Tombstones(self.model)
+                self.tombstones.begin(
+                    resume=journal is not None and journal.committed_rows > 0
+                )
+                if conf.COLLECTOR_KEY_INDEX and (self.keys is None or self.keys.stale):
+                    self.keys = KeyIndex(self.model)
+                    generation = IngestGeneration.current(self.model.__tablename__)
+                    if not self.keys.restore(generation):
+                        self.keys.build()
+            try:
+                yield context
+                if self.swap is not None:
+                    self.swap.finish()
+                else:
+                    self.tombstones.finish()
+                if journal is not None:
+                    journal.complete()
+            finally:
+                self.swap = None
+                self.tombstones = None
+        generation = self.bump_generation()
+        if self.keys is not None and generation is not None:
+            try:
+                self.keys.save(generation)
+            except Exception as e:
+                logger.warning(f"Failed to save key index -- {e}")
+
+    def changes(self) -> List[Dict]:
+        """ Rows inserted or changed since this collector first persisted """
+        if self.started_at is None:
+            return []
+        return self.model.changed_since(self.started_at)
+
+    def bump_generation(self) -> Union[int, None]:
+        """ Signal readers that the table contents may have changed. Returns the
+            new generation, or None if it could not be bumped. """
+        try:
+            generation = IngestGeneration.bump(self.model.__tablename__)
+            logger.debug(f"{self.model.__tablename__} generation -> {generation}")
+            return generation
+        except Exception as e:
+            logger.warning(f"Failed to bump ingest generation -- {e}")
+            return None
 
     def filter(self, row: Dict) -> Union[Dict, None]:
         if row.get("shllat") and row.get("shllon"):
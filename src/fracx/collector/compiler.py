@@ -0,0 +1,181 @@
+from typing import Dict, Tuple
+from datetime import datetime
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+
+import collector.endpoint
+import collector.parser
+import collector.row_parser
+from __version__ import __version__
+from collector.endpoint import Endpoint
+from collector.parser import locate_resource
+from collector.row_parser import RowParser
+import util
+from config import get_active_config, safe_load_yaml
+from util import RootException
+
+logger = logging.getLogger(__name__)
+
+conf = get_active_config()
+
+# bump when the layout of CompiledConfig changes to invalidate existing artifacts
+CACHE_VERSION = 1
+
+# modules whose classes are pickled into the artifact (or that build it)
+SOURCE_MODULES = (collector.endpoint, collector.parser, collector.row_parser)
+
+
+class ConfigCompilationError(RootException):
+    pass
+
+
+class CompiledConfig(object):
+    """ Prebuilt endpoint and parser definitions, keyed on the stat key of the
+        source yaml files they were compiled from """
+
+    def __init__(
+        self,
+        digest: str,
+        endpoints: Dict[str, dict],
+        row_parser: RowParser,
+        version: str = None,
+    ):
+        self.digest = digest
+        self.endpoints = endpoints
+        self.row_parser = row_parser
+        self.version = version or cache_version()
+        self.compiled_at = datetime.utcnow()
+
+    def __repr__(self):
+        return f"CompiledConfig: {self.version[:20]} ({self.digest[:12]})"
+
+    def load_endpoints(self, load_disabled: bool = False) -> Dict[str, Endpoint]:
+        loaded: Dict[str, Endpoint] = {}
+        for name, spec in self.endpoints.items():
+            ep = Endpoint(name=name, **spec["params"])
+            ep._model = spec["model"]
+            if ep.enabled or load_disabled:
+                loaded[name] = ep
+        return loaded
+
+
+def stat_key(*paths: str) -> str:
+    """ sha256 over the path, mtime and size of each file. Editing or replacing
+        a file changes its key, and nothing is read to compute it. """
+    h = hashlib.sha256()
+    for path in paths:
+        st = os.stat(path)
+        h.update(f"{os.path.abspath(path)}:{st.st_mtime_ns}:{st.st_size}\n".encode())
+    return h.hexdigest()
+
+
+def cache_version() -> str:
+    """ Identifies the code an artifact was compiled with: the layout version,
+        the package version and the stat key of the compiler's own sources, so an
+        upgrade never loads an artifact built by older code """
+    paths = [__file__] + [module.__file__ for module in SOURCE_MODULES]
+    return f"{CACHE_VERSION}:{__version__}:{stat_key(*paths)}"
+
+
+def check_owner(path: str) -> None:
+    """ Refuse a file (or directory) that another user owns or can write to,
+        since unpickling it would run whatever code they put in it """
+    try:
+        util.check_owner(path)
+    except util.UnsafePathError as e:
+        raise ConfigCompilationError(str(e))
+
+
+def build(collector_path: str, parser_path: str) -> CompiledConfig:
+    """ Load and validate the collector and parser definitions. All config errors
+        are raised here instead of at first use. """
+    digest = stat_key(collector_path, parser_path)
+    collector_conf = safe_load_yaml(collector_path) or {}
+    parser_conf = safe_load_yaml(parser_path) or {}
+
+    endpoints: Dict[str, dict] = {}
+    for name, params in (collector_conf.get("endpoints") or {}).items():
+        try:
+            ep = Endpoint(name=name, **params)
+            model = ep.locate_model(ep.model_name)
+        except Exception as e:
+            raise ConfigCompilationError(f"Invalid endpoint ({name}) -> {e}")
+        if model is None:
+            raise ConfigCompilationError(
+                f"Invalid endpoint ({name}) -> model '{ep.model_name}' not found"
+            )
+        endpoints[name] = {"params": params, "model": model}
+
+    try:
+        for parser_def in parser_conf.get("parsers", {}).values():
+            for rule in parser_def.get("rules", []):
+                for criterion in rule.get("criteria", []):
+                    locate_resource(criterion["type"])
+        row_parser = RowParser.load_from_config(parser_conf)
+    except Exception as e:
+        raise ConfigCompilationError(f"Invalid parser definition -> {e}")
+
+    return CompiledConfig(digest=digest, endpoints=endpoints, row_parser=row_parser)
+
+
+def dump(compiled: CompiledConfig, path: str) -> None:
+    """ Write the artifact to a private directory (created 0700), under a
+        temporary name that is then renamed into place """
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        util.private_dir(directory)
+    except util.UnsafePathError as e:
+        raise ConfigCompilationError(str(e))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".fracx-config-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(
+                (compiled.version, compiled.digest, compiled),
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(tmp, path)
+    except Exception:
+        os.remove(tmp)
+        raise
+    logger.debug(f"Saved {compiled} to {path}")
+
+
+def read(path: str) -> Tuple[str, str, CompiledConfig]:
+    check_owner(os.path.dirname(os.path.abspath(path)))
+    check_owner(path)
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def load(c=None, rebuild: bool = True) -> CompiledConfig:
+    """ Load the compiled configuration artifact, rebuilding it if it is missing,
+        unreadable, or stale relative to the source yaml files """
+    c = c or conf
+    collector_path = c.COLLECTOR_CONFIG_PATH
+    parser_path = c.PARSER_CONFIG_PATH
+    cache_path = c.CONFIG_CACHE_PATH
+    digest = stat_key(collector_path, parser_path)
+
+    if cache_path and os.path.exists(cache_path):
+        try:
+            version, cached_digest, compiled = read(cache_path)
+            if version == cache_version() and cached_digest == digest:
+                return compiled
+            logger.debug(f"Compiled config at {cache_path} is stale")
+        except Exception as e:
+            logger.debug(f"Failed to read compiled config at {cache_path} -- {e}")
+
+    if not rebuild:
+        raise ConfigCompilationError(f"No valid compiled config at {cache_path}")
+
+    compiled = build(collector_path, parser_path)
+    if cache_path:
+        try:
+            dump(compiled, cache_path)
+        except Exception as e:
+            logger.warning(f"Unable to save compiled config to {cache_path} -- {e}")
+    return compiled
@@ -0,0 +1,66 @@
+from typing import Callable, Dict, Hashable, Iterable, List, Set, Tuple
+import logging
+
+from config import get_active_config
+
+logger = logging.getLogger(__name__)
+
+conf = get_active_config()
+
+Key = Tuple[Hashable, ...]
+
+
+def sort_key(key: Key) -> Tuple:
+    """ Orders keys that may contain None (None sorts last) """
+    return tuple((value is None, value) for value in key)
+
+
+class Deduplicator(object):
+    """ Collapses rows of a file that share a primary key, so a batch never asks
+        the database to upsert the same row twice (which postgres rejects with
+        "ON CONFLICT DO UPDATE command cannot affect row a second time").
+
+        With the "last" policy the last occurrence of a key wins: duplicates
+        within a batch are collapsed here, and a duplicate in a later batch
+        overwrites the earlier one when it is written. With the "first" policy
+        the first occurrence wins, so the keys of every batch are remembered
+        for the rest of the file. When an interrupted ingest is resumed, the
+        rows it already committed must be passed to seed() first, or a later
+        duplicate of one of them would overwrite it.
+
+        Each batch is returned sorted by key, so writes touch index pages (and
+        take row locks) in key order. """
+
+    policies = ("last", "first")
+
+    def __init__(self, key: Callable[[Dict], Key], policy: str = None):
+        policy = policy or conf.COLLECTOR_DUPLICATE_POLICY
+        if policy not in self.policies:
+            raise ValueError(f"policy must be one of {self.policies}")
+        self.key = key
+        self.policy = policy
+        self.seen: Set[Key] = set()
+        self.duplicates = 0
+
+    def __repr__(self):
+        return f"Deduplicator: {self.policy} wins ({self.duplicates} duplicates)"
+
+    def __call__(self, batch: List[Dict]) -> List[Dict]:
+        unique: Dict[Key, Dict] = {}
+        first = self.policy == "first"
+        for row in batch:
+            key = self.key(row)
+            if key in unique or (first and key in self.seen):
+                self.duplicates += 1
+                if first:
+                    continue
+            unique[key] = row
+        if first:
+            self.seen.update(unique)
+        return [unique[key] for key in sorted(unique, key=sort_key)]
+
+    def seed(self, rows: Iterable[Dict]):
+        """ Remember the keys of rows that were written before this file was
+            resumed. Only the "first" policy needs them. """
+        if self.policy == "first":
+            self.seen.update(self.key(row) for row in rows)
@@ -290,13 +290,17 @@ class Ftp(FTP):
         latest_name = None
 
         for name in names:
-            time = self.voidcmd("MDTM " + name)
+            time = self.modified(name)
             if (latest_time is None) or (time > latest_time):
                 latest_name = name
                 latest_time = time
 
         return latest_name
 
+    def modified(self, filename: str) -> str:
+        """ Modification time of a remote file, as YYYYMMDDHHMMSS """
+        return self.voidcmd("MDTM " + filename)[4:].strip()
+
     def get_latest(self) -> Dict:
         return self.get(self.latest_filename)
 
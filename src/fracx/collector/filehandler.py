@@ -1,44 +1,184 @@
-from typing import Generator, Dict, List, Union
+from typing import (
+    Callable,
+    Deque,
+    Dict,
+    Generator,
+    Iterator,
+    List,
+    Optional,
+    Union,
+)
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from datetime import datetime
 import logging
+import multiprocessing
 
 import xlrd
+from config import get_active_config
 from util import StringProcessor
 
 logger = logging.getLogger(__name__)
 
+conf = get_active_config()
+
 sp = StringProcessor()
 
+# how to convert the rows of the sheet, set by _init_worker in each process
+_worker: Dict = {}
+
+
+def _mp_context() -> multiprocessing.context.BaseContext:
+    """ Start parse workers from a clean server process (or a fresh interpreter)
+        rather than forking the calling process, which runs other threads """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
 
 class BytesFileHandler:
     @classmethod
     def xlsx(
-        cls, content: bytes, sheet_no: int = 0, date_columns: List[str] = None
+        cls,
+        content: bytes,
+        sheet_no: int = 0,
+        date_columns: List[str] = None,
+        start: int = 0,
     ) -> Generator[Dict, None, None]:
-        """ Extract the data of an Excel sheet from a byte stream """
+        """ Extract the data of an Excel sheet from a byte stream, skipping the
+            first start rows after the header """
         date_columns = date_columns or []
 
         try:
             sheet = xlrd.open_workbook(file_contents=content).sheet_by_index(sheet_no)
 
-            keys = sheet.row_values(0)
-            keys = [sp.normalize(x) for x in keys]
-
-            for idx in range(1, sheet.nrows):
-                result = dict(zip(keys, sheet.row_values(idx)))
-                for dc in date_columns:
-                    value = result.get(dc)
-                    # print(f"{dc=}, {value=}")
-                    result[dc] = cls._parse_excel_date(value, sheet.book.datemode)
-
-                yield result
+            keys = cls._keys(sheet)
+            for idx in range(1 + start, sheet.nrows):
+                yield cls._row(
+                    keys, sheet.row_values(idx), date_columns, sheet.book.datemode
+                )
         except TypeError as te:
             logger.error(f"Error converting bytes to xlsx -- {te}")
             yield {}
 
+    @classmethod
+    def xlsx_parallel(
+        cls,
+        content: bytes,
+        sheet_no: int = 0,
+        date_columns: List[str] = None,
+        transform: Callable[[Dict], Dict] = None,
+        workers: int = None,
+        chunk_rows: int = None,
+        start: int = 0,
+    ) -> Generator[Dict, None, None]:
+        """ Extract (and optionally transform) the rows of an Excel sheet on a
+            pool of processes, yielding them in sheet order.
+
+            The sheet is parsed once, in the calling process (xlrd reads an
+            xlsx sheet whole). Its raw row values are then sent to the workers
+            in chunks of chunk_rows rows, to be converted (dates) and
+            transformed there. Workers are started with forkserver (or spawn),
+            never forked from the calling thread. Only a few chunks per worker
+            are in flight at a time, so the converted rows held in memory stay
+            bounded however large the sheet is. transform must be picklable,
+            e.g. a bound Transformer.transform. The first start rows after the
+            header are skipped without being converted.
+
+            Parsing defaults to a single worker (FRACX_PARSE_WORKERS), which
+            runs in the calling process without a pool. Measure with
+            scripts/bench_parse.py on the target host before raising it.
+        """
+        workers = workers or conf.COLLECTOR_PARSE_WORKERS
+        chunk_rows = chunk_rows or conf.COLLECTOR_WRITE_SIZE
+        date_columns = date_columns or []
+
+        if workers <= 1:
+            for row in cls.xlsx(
+                content, sheet_no=sheet_no, date_columns=date_columns, start=start
+            ):
+                yield transform(row) if transform else row
+            return
+
+        book = xlrd.open_workbook(file_contents=content)
+        sheet = book.sheet_by_index(sheet_no)
+        nrows = sheet.nrows
+        chunks = (
+            list(map(sheet.row_values, range(first, min(first + chunk_rows, nrows))))
+            for first in range(1 + start, nrows, chunk_rows)
+        )
+        logger.debug(
+            f"Converting {nrows - 1 - start} rows in chunks of {chunk_rows}"
+            f" on {workers} processes"
+        )
+
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=_mp_context(),
+            initializer=_init_worker,
+            initargs=(cls._keys(sheet), date_columns, book.datemode, transform),
+        ) as executor:
+            pending: Deque[Future] = deque()
+            for _ in range(workers * 2):
+                cls._submit(executor, chunks, pending)
+            while pending:
+                rows = pending.popleft().result()
+                cls._submit(executor, chunks, pending)
+                yield from rows
+
+    @staticmethod
+    def _submit(
+        executor: ProcessPoolExecutor,
+        chunks: Iterator[List[List]],
+        pending: Deque[Future],
+    ):
+        chunk = next(chunks, None)
+        if chunk is not None:
+            pending.append(executor.submit(_convert_rows, chunk))
+
+    @staticmethod
+    def _keys(sheet: xlrd.sheet.Sheet) -> List[str]:
+        return [sp.cached_normalize(x) for x in sheet.row_values(0)]
+
+    @classmethod
+    def _row(
+        cls, keys: List[str], values: List, date_columns: List[str], date_mode: int
+    ) -> Dict:
+        result = dict(zip(keys, values))
+        for dc in date_columns:
+            value = result.get(dc)
+            result[dc] = cls._parse_excel_date(value, date_mode)
+        return result
+
     @classmethod
     def _parse_excel_date(cls, value: Union[float, None], date_mode: int = 0):
         if value:
             return datetime(*xlrd.xldate_as_tuple(value, date_mode))
         else:
             return value
+
+
+def _init_worker(
+    keys: List[str],
+    date_columns: List[str],
+    date_mode: int,
+    transform: Optional[Callable[[Dict], Dict]],
+):
+    """ Set up the conversion of the sheet's rows once per process """
+    _worker.update(
+        keys=keys, date_columns=date_columns, date_mode=date_mode, transform=transform
+    )
+
+
+def _convert_rows(chunk: List[List]) -> List[Dict]:
+    """ Convert (and transform) a chunk of raw sheet row values """
+    keys = _worker["keys"]
+    date_columns = _worker["date_columns"]
+    date_mode = _worker["date_mode"]
+    transform = _worker["transform"]
+
+    rows = []
+    for values in chunk:
+        row = BytesFileHandler._row(keys, values, date_columns, date_mode)
+        rows.append(transform(row) if transform else row)
+    return rows
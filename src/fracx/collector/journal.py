@@ -0,0 +1,108 @@
+from typing import Tuple, Union
+from hashlib import sha256
+import logging
+import os
+import tempfile
+
+from api.models import IngestJournal
+from collector.downloader import Ftp
+import util
+from config import get_active_config
+from util import RootException
+
+logger = logging.getLogger(__name__)
+
+conf = get_active_config()
+
+
+class IngestError(RootException):
+    pass
+
+
+def content_hash(content: bytes) -> str:
+    return sha256(content).hexdigest()
+
+
+class DownloadCache(object):
+    """ Local copies of downloaded export files, named by the sha256 of their
+        content, so an interrupted ingest can be resumed without downloading
+        the file again. A cached file is only returned if its content still
+        matches its name. """
+
+    def __init__(self, path: str = None):
+        self.path = util.private_dir(path or conf.COLLECTOR_DOWNLOAD_CACHE_PATH)
+
+    def __repr__(self):
+        return f"DownloadCache: {self.path}"
+
+    def filename(self, digest: str) -> str:
+        return os.path.join(self.path, digest)
+
+    def put(self, content: bytes) -> str:
+        """ Save content and return its hash. The file is written under a
+            temporary name and renamed, so a crash never leaves a partial copy
+            under the final name. """
+        digest = content_hash(content)
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix=".partial-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.filename(digest))
+        except Exception:
+            os.remove(tmp)
+            raise
+        return digest
+
+    def get(self, digest: str) -> Union[bytes, None]:
+        try:
+            with open(self.filename(digest), "rb") as f:
+                content = f.read()
+        except FileNotFoundError:
+            return None
+        if content_hash(content) != digest:
+            logger.warning(f"{self}: discarding corrupt copy of {digest}")
+            self.discard(digest)
+            return None
+        return content
+
+    def discard(self, digest: str):
+        try:
+            os.remove(self.filename(digest))
+        except FileNotFoundError:
+            pass
+
+
+def open_ingest(
+    ftp: Ftp, cache: DownloadCache, batch_size: int, resume: bool = True
+) -> Tuple[IngestJournal, bytes]:
+    """ Journal entry and content for an ingest of the latest export file.
+
+        If an earlier ingest of the same file (by name and modification time)
+        was interrupted and its download is still cached, that ingest is
+        resumed from the cached copy. Otherwise the file is downloaded, cached
+        and a new ingest is started. """
+    filename = ftp.latest_filename
+    if filename is None:
+        raise IngestError("No export file found")
+    modified = ftp.modified(filename)
+
+    journal = IngestJournal.resumable(filename, modified) if resume else None
+    if journal is not None:
+        content = cache.get(journal.content_hash)
+        if content is not None:
+            logger.info(f"Resuming {journal} from the cached download")
+            return journal, content
+        logger.info(f"Download of {journal} is no longer cached, starting over")
+
+    result = ftp.get(filename)
+    content = result.get("content")
+    if result.get("status") != "success" or not content:
+        raise IngestError(f"Failed to download {filename}")
+    digest = cache.put(content)
+    journal = IngestJournal.start(
+        filename, digest, size=len(content), batch_size=batch_size, modified=modified
+    )
+    logger.info(f"Started {journal}")
+    return journal, content
@@ -0,0 +1,127 @@
+from typing import Dict, Hashable, Iterable, List, Tuple
+import logging
+import os
+import struct
+import tempfile
+
+from sqlalchemy import func
+from flask_sqlalchemy import Model
+
+import util
+from config import get_active_config
+from util.bloom import BloomFilter
+
+logger = logging.getLogger(__name__)
+
+conf = get_active_config()
+
+
+class KeyIndex(object):
+    """ In-memory index of the primary keys in a model's table, so a collector
+        can tell new rows from ones that may already exist without asking the
+        database.
+
+        The index is a Bloom filter built from a streaming scan of the table's
+        keys and kept current by adding the keys of every written batch. A row
+        whose key is not in the filter is certainly new (unless another process
+        wrote it since the scan, which the insert detects). A row whose key is
+        in the filter most likely exists, and is upserted as before.
+
+        The filter is sized for growth. Once more keys have been added than it
+        was sized for, it reports itself stale and should be rebuilt.
+
+        Building the filter scans every key in the table, so it can be saved
+        between runs along with the table's ingest generation. A saved filter
+        is only restored if the generation has not moved since, i.e. nothing
+        else has written to the table in the meantime. """
+
+    GENERATION = struct.Struct("<Q")
+
+    def __init__(self, model: Model, error_rate: float = None, headroom: float = 2.0):
+        self.model = model
+        self.error_rate = error_rate or conf.COLLECTOR_KEY_INDEX_ERROR_RATE
+        self.headroom = headroom
+        self.filter: BloomFilter = None
+
+    def __repr__(self):
+        return f"KeyIndex: {self.model.__tablename__} ({self.filter})"
+
+    @property
+    def stale(self) -> bool:
+        return self.filter is None or self.filter.full
+
+    def build(self):
+        """ (Re)build the filter from a streaming scan of the table's keys """
+        count = (
+            self.model.s.query(func.count()).select_from(self.model.__table__).scalar()
+        )
+        capacity = max(int(count * self.headroom), conf.COLLECTOR_WRITE_SIZE * 10)
+        self.filter = BloomFilter(capacity, self.error_rate)
+        self.filter.update(self.model.iter_pks())
+        logger.info(f"Built {self}")
+
+    def filename(self, path: str = None) -> str:
+        path = path or conf.COLLECTOR_KEY_INDEX_PATH
+        return os.path.join(path, f"{self.model.__tablename__}.bloom")
+
+    def save(self, generation: int, path: str = None):
+        """ Write the filter to a private directory, under a temporary name that
+            is then renamed into place """
+        filename = self.filename(path)
+        directory = os.path.dirname(filename)
+        util.private_dir(directory)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".partial-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.GENERATION.pack(generation))
+                f.write(self.filter.to_bytes())
+            os.replace(tmp, filename)
+        except Exception:
+            os.remove(tmp)
+            raise
+        logger.debug(f"Saved {self} at generation {generation}")
+
+    def restore(self, generation: int, path: str = None) -> bool:
+        """ Load the saved filter if it was saved at the given generation.
+            Returns whether it was loaded. """
+        filename = self.filename(path)
+        try:
+            with open(filename, "rb") as f:
+                data = f.read()
+            (saved,) = self.GENERATION.unpack_from(data)
+            if saved != generation:
+                logger.debug(
+                    f"Saved key index is at generation {saved}, not {generation}"
+                )
+                return False
+            bf = BloomFilter.from_bytes(data[self.GENERATION.size :])
+        except FileNotFoundError:
+            return False
+        except (struct.error, ValueError) as e:
+            logger.warning(f"Failed to read key index at {filename} -- {e}")
+            return False
+        if bf.full:
+            return False
+        self.filter = bf
+        logger.info(f"Restored {self}")
+        return True
+
+    def key(self, row: Dict) -> Tuple[Hashable, ...]:
+        return self.model.row_key(row)
+
+    def __contains__(self, row: Dict) -> bool:
+        return self.key(row) in self.filter
+
+    def split(self, rows: Iterable[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """ Separate rows into those that are certainly new and those that may
+            already exist """
+        new: List[Dict] = []
+        existing: List[Dict] = []
+        for row in rows:
+            (existing if row in self else new).append(row)
+        return new, existing
+
+    def add(self, rows: Iterable[Dict]):
+        """ Record the keys of written rows. Keys of rows that are later rolled
+            back only cost a false positive. """
+        self.filter.update(self.key(row) for row in rows)
@@ -0,0 +1,280 @@
+from typing import Any, Callable, Dict, Iterable, List
+from timeit import default_timer as timer
+import logging
+import queue
+import threading
+
+import util
+from collector.collector import FracScheduleCollector
+from config import get_active_config
+from util import RootException
+
+logger = logging.getLogger(__name__)
+
+conf = get_active_config()
+
+STAGES = ("extract", "transform", "load")
+
+
+class PipelineError(RootException):
+    pass
+
+
+class _Done(object):
+    """ End of stream marker passed down the queues """
+
+    def __repr__(self):
+        return "<done>"
+
+
+DONE = _Done()
+
+
+class _Failed(object):
+    """ Carries an exception raised in an upstream stage to the loader """
+
+    def __init__(self, stage: str, error: BaseException):
+        self.stage = stage
+        self.error = error
+
+
+class Batch(list):
+    """ Rows to load, along with the rows of the same source batch that the
+        collector's filter dropped. Those are still part of the snapshot. """
+
+    def __init__(self, rows: Iterable = (), skipped: List = None):
+        super().__init__(rows)
+        self.skipped = skipped or []
+
+
+class StageStats(object):
+    """ Work done by one stage. busy excludes time spent waiting on queues. """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.batches = 0
+        self.rows = 0
+        self.busy = 0.0
+
+    def __repr__(self):
+        return (
+            f"{self.name}: {self.rows} rows in {self.batches} batches"
+            f" ({self.busy:.2f}s busy)"
+        )
+
+
+class Pipeline(object):
+    """ Extract, transform and load batches of rows concurrently.
+
+        Extraction and transformation each run on a worker thread, connected to
+        the loader by bounded queues. The loader runs on the calling thread, so
+        it uses the caller's application context and database session. While
+        batch N is being written, batch N+1 is being transformed and batch N+2
+        extracted, so a run takes about as long as its slowest stage instead of
+        the sum of all of them. A full queue blocks the stage feeding it, which
+        bounds memory to (queue_size + 1) batches per stage.
+
+        Every batch is loaded inside the collector's load context, so a run is
+        committed once at the end, and every checkpoint batches along the way
+        (by default only if the collector has an ingest journal to resume from).
+        An exception in any stage stops the others and rolls the load back to
+        the last checkpoint; failures upstream of the loader are raised from
+        run() as a PipelineError. offset is the number of source rows an
+        earlier, interrupted run already committed; the rows passed to run()
+        are taken to follow them. Pass transformed=True for rows that were
+        already transformed upstream (e.g. by the parse workers); the transform
+        stage then only filters them. If dedupe is given (e.g. a Deduplicator),
+        the transform stage also passes each filtered batch through it. Rows the
+        filter drops are passed to the collector's skip(), so they still count
+        as present in the snapshot.
+    """
+
+    def __init__(
+        self,
+        collector: FracScheduleCollector,
+        batch_size: int = None,
+        queue_size: int = None,
+        update_on_conflict: bool = True,
+        ignore_on_conflict: bool = False,
+        transformed: bool = False,
+        dedupe: Callable[[List], List] = None,
+        checkpoint: int = None,
+        offset: int = 0,
+    ):
+        self.collector = collector
+        self.batch_size = batch_size or conf.COLLECTOR_WRITE_SIZE
+        self.queue_size = queue_size or conf.COLLECTOR_QUEUE_SIZE
+        self.update_on_conflict = update_on_conflict
+        self.ignore_on_conflict = ignore_on_conflict
+        self.transformed = transformed
+        self.dedupe = dedupe
+        if checkpoint is None:
+            # only a journaled load can be resumed from a checkpoint
+            journaled = getattr(collector, "journal", None) is not None
+            checkpoint = conf.COLLECTOR_CHECKPOINT_BATCHES if journaled else 0
+        self.checkpoint = checkpoint
+        self.offset = offset
+        self.stats: Dict[str, StageStats] = {}
+        self.elapsed = 0.0
+        self.context = None
+        self._stop = threading.Event()
+
+    def __repr__(self):
+        return f"Pipeline: batches of {self.batch_size}, queues of {self.queue_size}"
+
+    def _put(self, q: queue.Queue, item: Any) -> bool:
+        """ Blocking put that gives up if the pipeline is stopping """
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue) -> Any:
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return DONE
+
+    def _run_stage(
+        self,
+        name: str,
+        source: Iterable,
+        work: Callable[[List], List],
+        out: queue.Queue,
+    ):
+        """ Apply work to each batch from source and pass the result to out.
+            Control items (end of stream, upstream failures) are forwarded. """
+        stats = self.stats[name]
+        try:
+            for item in source:
+                if isinstance(item, (_Done, _Failed)):
+                    self._put(out, item)
+                    return
+                ts = timer()
+                result = work(item)
+                stats.busy += timer() - ts
+                stats.batches += 1
+                stats.rows += len(result)
+                if not self._put(out, result):
+                    return
+            self._put(out, DONE)
+        except Exception as e:
+            logger.exception(f"Pipeline stage '{name}' failed -- {e}")
+            self._put(out, _Failed(name, e))
+
+    def _read(self, q: queue.Queue) -> Iterable:
+        while True:
+            item = self._get(q)
+            yield item
+            if isinstance(item, (_Done, _Failed)):
+                return
+
+    def _extract(self, rows: Iterable) -> Iterable:
+        """ Batches of raw rows. Time spent pulling rows from the source
+            iterator is counted as extraction. """
+        batches = util.chunks(rows, self.batch_size)
+        stats = self.stats["extract"]
+        while True:
+            ts = timer()
+            batch = next(batches, None)
+            stats.busy += timer() - ts
+            if batch is None:
+                return
+            yield batch
+
+    def transform(self, batch: List) -> Batch:
+        collector = self.collector
+        if not self.transformed:
+            batch = [collector.transform(row) for row in batch]
+        kept: List = []
+        skipped: List = []
+        for row in batch:
+            (kept if collector.filter(row) else skipped).append(row)
+        if self.dedupe is not None:
+            kept = self.dedupe(kept)
+        return Batch(kept, skipped)
+
+    def load(self, batch: Batch):
+        if batch.skipped:
+            self.collector.skip(batch.skipped)
+        self.collector.persist(
+            batch,
+            update_on_conflict=self.update_on_conflict,
+            ignore_on_conflict=self.ignore_on_conflict,
+        )
+
+    def run(self, rows: Iterable) -> Dict[str, StageStats]:
+        """ Run the pipeline over the raw rows and return per-stage stats """
+        self._stop.clear()
+        self.stats = {name: StageStats(name) for name in STAGES}
+        extracted: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        transformed: queue.Queue = queue.Queue(maxsize=self.queue_size)
+
+        workers = [
+            threading.Thread(
+                target=self._run_stage,
+                args=("extract", self._extract(rows), list, extracted),
+                name="fracx-extract",
+                daemon=True,
+            ),
+            threading.Thread(
+                target=self._run_stage,
+                args=("transform", self._read(extracted), self.transform, transformed),
+                name="fracx-transform",
+                daemon=True,
+            ),
+        ]
+
+        ts = timer()
+        failed = True
+        for worker in workers:
+            worker.start()
+        try:
+            with self.collector.load_context() as context:
+                self.context = context
+                self._load(transformed)
+            failed = False
+        finally:
+            if failed:
+                self._stop.set()
+            for worker in workers:
+                worker.join()
+            self.elapsed = timer() - ts
+            self.log_summary(failed=failed)
+
+        return self.stats
+
+    def _load(self, transformed: queue.Queue):
+        stats = self.stats["load"]
+        for item in self._read(transformed):
+            if isinstance(item, _Done):
+                return
+            if isinstance(item, _Failed):
+                raise PipelineError(
+                    f"{item.stage} stage failed -- {item.error}"
+                ) from item.error
+            started = timer()
+            self.load(item)
+            stats.busy += timer() - started
+            stats.batches += 1
+            stats.rows += len(item)
+            if self.checkpoint and stats.batches % self.checkpoint == 0:
+                # every extracted batch but the last holds batch_size source rows
+                committed = self.offset + stats.batches * self.batch_size
+                self.collector.checkpoint(committed)
+
+    def log_summary(self, failed: bool = False):
+        total = sum(s.busy for s in self.stats.values())
+        status = "failed" if failed else "finished"
+        logger.info(
+            f"Pipeline {status} in {self.elapsed:.2f}s"
+            f" ({total:.2f}s of stage work): "
+            + ", ".join(repr(s) for s in self.stats.values())
+        )
+        if self.dedupe is not None:
+            logger.info(self.dedupe)
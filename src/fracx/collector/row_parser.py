@@ -30,26 +30,47 @@ class RowParser(object):
         self.exclude = exclude or []
         self.parsers = parsers or []
         self.errors: List[str] = []
+        self._converter = None
 
     def __repr__(self):
         s = "s" if len(self.parsers) > 1 else ""
         return f"RowParser: {len(self.parsers)} attached parser{s}"
 
+    def __getstate__(self):
+        # the fused converter is a closure and can't be pickled
+        state = self.__dict__.copy()
+        state["_converter"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._converter = util.fuse(*[p.parse for p in self.parsers])
+
     def add_parser(
         self, parser: Parser = None, ruleset: Dict[str, List] = None, name: str = None
     ):
         self.parsers.append(parser or Parser.init(ruleset, name=name))
+        self._converter = None
         return self
 
+    @property
+    def converter(self):
+        """ All attached parsers fused into a single value converter """
+        if self._converter is None:
+            self._converter = util.fuse(*[p.parse for p in self.parsers])
+        return self._converter
+
     def normalize_keys(self, data: Dict) -> Dict:
-        return util.apply_transformation(data, sp.normalize, keys=True, values=False)
+        return util.apply_transformation(
+            data, sp.cached_normalize, keys=True, values=False
+        )
 
     def parse_value_dtypes(self, data: Dict) -> Dict:
-        for parser in self.parsers:
-            data = util.apply_transformation(
-                data, parser.parse, keys=False, values=True
-            )
-        return data
+        if not self.parsers:
+            return data
+        return util.apply_transformation(
+            data, self.converter, keys=False, values=True
+        )
 
     def parse(self, row: dict, parse_dtypes: bool = True, **kwargs) -> Dict:
         # parsed = self.normalize_keys(row)
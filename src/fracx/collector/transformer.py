@@ -1,11 +1,13 @@
-from typing import Dict, List, Union
+from typing import Dict, List, Mapping, Type, Union
 import logging
 from datetime import date, datetime
 
 
+from api.records import Record, make_record_type
+from collector import compiler
 from collector.parser import Parser
-from collector.row_parser import RowParser
 from config import get_active_config
+from util import geohash
 
 
 conf = get_active_config()
@@ -21,7 +23,7 @@ class TransformationError(Exception):
 
 
 class Transformer(object):
-    parser = RowParser.load_from_config(conf.PARSER_CONFIG)
+    _default_parser: Union[Parser, None] = None
 
     def __init__(
         self,
@@ -30,13 +32,33 @@ class Transformer(object):
         normalize: bool = False,
         parser: Parser = None,
         ignore_unknown: bool = True,
+        record_type: Type[Record] = None,
     ):
         self.normalize = normalize
         self.aliases = aliases or {}
         self.exclude = exclude or []
         self.errors: List[str] = []
-        self.parser = parser or self.parser
+        self._parser = parser
         self.ignore_unknown = ignore_unknown
+        self.record_type = record_type
+        # plain dict rows always get geohashes; records only if they have fields
+        self.geohash = record_type is None or {
+            "shl_geohash",
+            "bhl_geohash",
+        } <= set(record_type._fields)
+
+    @classmethod
+    def default_parser(cls) -> Parser:
+        """ The row parser of the compiled config, loaded on first use """
+        if Transformer._default_parser is None:
+            Transformer._default_parser = compiler.load(conf).row_parser
+        return Transformer._default_parser
+
+    @property
+    def parser(self) -> Parser:
+        if self._parser is None:
+            self._parser = self.default_parser()
+        return self._parser
 
     def __repr__(self):
         la = len(self.aliases)
@@ -44,22 +66,52 @@ class Transformer(object):
         unknown = "permissive" if self.ignore_unknown else "strict"
         return f"Transformer: {la} aliases, {le} exclusions ({unknown})"
 
-    def transform(self, row: dict) -> Row:
+    def __getstate__(self) -> Dict:
+        """ Pickle the record type by name and fields, since generated record
+            types cannot be pickled by reference """
+        state = self.__dict__.copy()
+        record_type = state.pop("record_type")
+        if record_type is not None:
+            state["_record_spec"] = (record_type.__name__, record_type._fields)
+        return state
+
+    def __setstate__(self, state: Dict):
+        spec = state.pop("_record_spec", None)
+        self.__dict__.update(state)
+        self.record_type = make_record_type(*spec) if spec else None
+
+    def transform(self, row: Mapping) -> Union[Row, Record]:
+        """ Drop exclusions, apply aliases, and convert empty strings to None in a
+            single pass over the row. If the transformer has a record_type, the
+            result is built directly as a record of that type. """
 
         try:
-            row = self.drop_exclusions(row)
-            row = self.apply_aliases(row)
-            # row = self.parser.parse(row)
+            aliases = self.aliases
+            exclude = self._exclude_set
+            result = self.record_type() if self.record_type else {}
 
-            if "api14" in row.keys():
-                api14 = str(row["api14"])
+            for k, v in row.items():
+                if k in aliases and k not in exclude:
+                    result[aliases[k]] = v
+
+            if "api14" in result:
+                api14 = str(result["api14"])
                 ndiff = 14 - len(api14)
                 if ndiff > 0:
                     api14 += "0" * ndiff
-                row["api14"] = api14[:14]
-                row["api10"] = api14[:10]
+                result["api14"] = api14[:14]
+                result["api10"] = api14[:10]
+
+            for k, v in result.items():
+                if v == "":
+                    result[k] = None
 
-            row = {k: v if v != "" else None for k, v in row.items()}
+            if self.geohash:
+                # both keys are always set, so every row has the same columns
+                for prefix in ("shl", "bhl"):
+                    result[f"{prefix}_geohash"] = self.encode_location(
+                        result.get(f"{prefix}lat"), result.get(f"{prefix}lon")
+                    )
 
             numerrs = len(self.errors)
             if len(self.errors) > 0:
@@ -69,11 +121,31 @@ class Transformer(object):
                     self.errors,
                 )
 
-            return row
+            return result
         except Exception as e:
             logger.exception(f"Transformation error: {e}")
             raise TransformationError(e)
 
+    @staticmethod
+    def encode_location(lat: Scalar, lon: Scalar) -> Union[str, None]:
+        """ Full precision geohash of a location, or None if it is incomplete """
+        try:
+            lat, lon = float(lat), float(lon)  # type: ignore
+        except (TypeError, ValueError):
+            return None
+        if lat != lat or lon != lon:  # nan
+            return None
+        return geohash.encode(lat, lon)
+
+    @property
+    def exclude(self) -> List[str]:
+        return self._exclude
+
+    @exclude.setter
+    def exclude(self, value: List[str]):
+        self._exclude = value
+        self._exclude_set = frozenset(value)
+
     def apply_aliases(self, row: Row) -> Row:
         return {self.aliases[k]: v for k, v in row.items() if k in self.aliases.keys()}
 
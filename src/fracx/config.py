@@ -1,4 +1,5 @@
 import sys
+import functools
 import logging
 import os
 import socket
@@ -47,6 +48,12 @@ def safe_load_yaml(path: str) -> AttrDict:
         print(f"Failed to load configuration: {fe}")
 
 
+@functools.lru_cache(maxsize=None)
+def cached_yaml(path: str) -> AttrDict:
+    """ Parse a config file once per process, on first use """
+    return safe_load_yaml(path)
+
+
 def get_active_config() -> AttrDict:
     return globals()[APP_SETTINGS.replace("fracx.config.", "")]()
 
@@ -117,7 +124,6 @@ class BaseConfig:
 
     """ Collector """
     COLLECTOR_CONFIG_PATH = make_config_path(CONFIG_BASEPATH, "collector.yaml")
-    COLLECTOR_CONFIG = safe_load_yaml(COLLECTOR_CONFIG_PATH)
     COLLECTOR_FTP_URL = os.getenv("FRACX_FTP_URL", "sftp.pdswdx.com")
     COLLECTOR_FTP_PORT = os.getenv("FRACX_FTP_PORT", "21")
     COLLECTOR_FTP_OUTPATH = os.getenv("FRACX_FTP_OUTPATH", "/Outbound")
@@ -125,10 +131,69 @@ class BaseConfig:
     COLLECTOR_FTP_USERNAME = os.getenv("FRACX_FTP_USERNAME")
     COLLECTOR_FTP_PASSWORD = os.getenv("FRACX_FTP_PASSWORD")
     COLLECTOR_WRITE_SIZE = int(os.getenv("FRACX_WRITE_SIZE", "1000"))
+    COLLECTOR_QUEUE_SIZE = int(os.getenv("FRACX_QUEUE_SIZE", "4"))
+    COLLECTOR_PARSE_WORKERS = int(os.getenv("FRACX_PARSE_WORKERS", "1"))
+    COLLECTOR_TOMBSTONE_MAX_RATIO = float(
+        os.getenv("FRACX_TOMBSTONE_MAX_RATIO", "0.5")
+    )
+    COLLECTOR_CHECKPOINT_BATCHES = int(os.getenv("FRACX_CHECKPOINT_BATCHES", "10"))
+    COLLECTOR_DOWNLOAD_CACHE_PATH = os.getenv(
+        "FRACX_DOWNLOAD_CACHE_PATH",
+        os.path.join(
+            os.getenv("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+            "fracx",
+            "downloads",
+        ),
+    )
+    COLLECTOR_DUPLICATE_POLICY = os.getenv("FRACX_DUPLICATE_POLICY", "last")
+    COLLECTOR_KEY_INDEX = os.getenv("FRACX_KEY_INDEX", "true").lower() in (
+        "true",
+        "1",
+        "yes",
+    )
+    COLLECTOR_KEY_INDEX_ERROR_RATE = float(
+        os.getenv("FRACX_KEY_INDEX_ERROR_RATE", "0.01")
+    )
+    COLLECTOR_KEY_INDEX_PATH = os.getenv(
+        "FRACX_KEY_INDEX_PATH",
+        os.path.join(
+            os.getenv("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+            "fracx",
+            "keys",
+        ),
+    )
 
     """ Parser """
     PARSER_CONFIG_PATH = abs_path(CONFIG_BASEPATH, "parsers.yaml")
-    PARSER_CONFIG = safe_load_yaml(PARSER_CONFIG_PATH)
+
+    """ Compiled collector/parser config artifact """
+    CONFIG_CACHE_PATH = os.getenv(
+        "FRACX_CONFIG_CACHE_PATH",
+        os.path.join(
+            os.getenv("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+            "fracx",
+            "config.pickle",
+        ),
+    )
+
+    """ API """
+    API_PAGE_SIZE = int(os.getenv("FRACX_API_PAGE_SIZE", "1000"))
+    API_MAX_PAGE_SIZE = int(os.getenv("FRACX_API_MAX_PAGE_SIZE", "10000"))
+    API_STREAM_BATCH_SIZE = int(os.getenv("FRACX_API_STREAM_BATCH_SIZE", "500"))
+    API_CACHE_MAX_ENTRIES = int(os.getenv("FRACX_API_CACHE_MAX_ENTRIES", "256"))
+    API_CACHE_MAX_BODY_BYTES = int(
+        os.getenv("FRACX_API_CACHE_MAX_BODY_BYTES", str(2 ** 20))
+    )
+    API_GENERATION_TTL = float(os.getenv("FRACX_API_GENERATION_TTL", "5"))
+
+    """ Analysis """
+    ANALYSIS_CELL_MILES = float(os.getenv("FRACX_ANALYSIS_CELL_MILES", "1"))
+    ANALYSIS_MAX_LATERAL_MILES = float(
+        os.getenv("FRACX_ANALYSIS_MAX_LATERAL_MILES", "5")
+    )
+    ANALYSIS_NEAREST_MAX_MILES = float(
+        os.getenv("FRACX_ANALYSIS_NEAREST_MAX_MILES", "25")
+    )
 
     """ Logging """
     LOG_LEVEL = os.getenv("FRACX_LOG_LEVEL", logging.INFO)
@@ -156,6 +221,15 @@ class BaseConfig:
         "database": DATABASE_NAME,
     }
     SQLALCHEMY_DATABASE_URI = str(make_url(DATABASE_URL_PARAMS))
+    # let psycopg2 send executemany inserts as pages of multi-row VALUES
+    SQLALCHEMY_ENGINE_OPTIONS = (
+        {
+            "executemany_mode": "values",
+            "executemany_values_page_size": COLLECTOR_WRITE_SIZE,
+        }
+        if DATABASE_DIALECT in _pg_aliases
+        else {}
+    )
     FRAC_SCHEDULE_TABLE_NAME = os.getenv("FRACX_TABLE_NAME", "frac_schedules")
 
     @property
@@ -167,6 +241,16 @@ class BaseConfig:
             #  and not x.endswith("_CONFIG")
         }
 
+    @property
+    def COLLECTOR_CONFIG(self):
+        """ Parsed lazily: the collector reads the compiled artifact instead """
+        return cached_yaml(self.COLLECTOR_CONFIG_PATH)
+
+    @property
+    def PARSER_CONFIG(self):
+        """ Parsed lazily: the collector reads the compiled artifact instead """
+        return cached_yaml(self.PARSER_CONFIG_PATH)
+
     @property
     def collector_params(self):
         return self.with_prefix("collector")
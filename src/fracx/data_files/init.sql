@@ -13,10 +13,14 @@ create table {DATABASE_SCHEMA}.{TABLE_NAME}
 	shllon float,
 	bhllat float,
 	bhllon float,
+	shl_geohash varchar(12),
+	bhl_geohash varchar(12),
 	target_formation varchar(100),
 	created_at datetime default CURRENT_TIMESTAMP not null,
 	updated_at datetime default CURRENT_TIMESTAMP not null,
 	updated_by varchar(100) default CURRENT_USER not null,
+	removed_at datetime,
+	located_at datetime default CURRENT_TIMESTAMP not null,
 );
 
 alter table {DATABASE_SCHEMA}.{TABLE_NAME}
@@ -24,15 +28,53 @@ alter table {DATABASE_SCHEMA}.{TABLE_NAME}
 		primary key (api14, frac_start_date, frac_end_date);
 
 
+--
+
+create unique index ix_{TABLE_NAME}_id
+	on {DATABASE_SCHEMA}.{TABLE_NAME} (id);
+
+
+--
+
+create index ix_{TABLE_NAME}_updated_at
+	on {DATABASE_SCHEMA}.{TABLE_NAME} (updated_at);
+
+
+--
+
+create index ix_{TABLE_NAME}_shl_geohash
+	on {DATABASE_SCHEMA}.{TABLE_NAME} (shl_geohash);
+
+
+--
+
+create index ix_{TABLE_NAME}_bhl_geohash
+	on {DATABASE_SCHEMA}.{TABLE_NAME} (bhl_geohash);
+
+
+--
+
+create table {DATABASE_SCHEMA}.{TABLE_NAME}_latest_by_api10
+(
+	api10 varchar(10) not null
+		constraint pk_{TABLE_NAME}_latest_by_api10
+			primary key,
+	id int not null
+);
+
+
+--
+
+insert into {DATABASE_SCHEMA}.{TABLE_NAME}_latest_by_api10 (api10, id)
+select api10, max(id)
+from {DATABASE_SCHEMA}.{TABLE_NAME}
+where api10 is not null and removed_at is null
+group by api10;
+
+
 --
 
 create view {DATABASE_SCHEMA}.{TABLE_NAME}_most_recent_by_api10 as
-    with most_recent as (
-        select
-            max({TABLE_NAME}_1.id) as id
-        from {DATABASE_SCHEMA}.{TABLE_NAME} {TABLE_NAME}_1
-        group by {TABLE_NAME}_1.api10
-    )
     select
         fs.id,
         fs.api14,
@@ -55,7 +97,80 @@ create view {DATABASE_SCHEMA}.{TABLE_NAME}_most_recent_by_api10 as
         case when [shllon] IS NOT NULL AND [shllat] IS NOT NULL then [GEOMETRY]::Point([shllon],[shllat],4326)  end as shl,
         case when [bhllon] IS NOT NULL AND [bhllat] IS NOT NULL then [GEOMETRY]::Point([bhllon],[bhllat],4326)  end as bhl,
         case when [shllon] IS NOT NULL AND [shllat] IS NOT NULL AND [bhllon] IS NOT NULL AND [bhllat] IS NOT NULL then [Geometry]::STGeomFromText(((((((('LINESTRING ('+CONVERT([varchar],[shllon]))+' ')+CONVERT([varchar],[shllat]))+', ')+CONVERT([varchar],[bhllon]))+' ')+CONVERT([varchar],[bhllat]))+')',4326)  end as stick
-    from {DATABASE_SCHEMA}.{TABLE_NAME} fs
-             join most_recent on fs.id = most_recent.id;
+    from {DATABASE_SCHEMA}.{TABLE_NAME}_latest_by_api10 latest
+             join {DATABASE_SCHEMA}.{TABLE_NAME} fs on fs.id = latest.id
+    where fs.removed_at is null;
 
 
+--
+
+create table {DATABASE_SCHEMA}.{TABLE_NAME}_generation
+(
+	name varchar(100) not null
+		constraint pk_{TABLE_NAME}_generation
+			primary key,
+	generation bigint default 0 not null,
+	updated_at datetime default CURRENT_TIMESTAMP not null
+);
+
+
+--
+
+create table {DATABASE_SCHEMA}.{TABLE_NAME}_ingest_journal
+(
+	id int identity
+		constraint pk_{TABLE_NAME}_ingest_journal
+			primary key,
+	filename varchar(255) not null,
+	modified varchar(50),
+	content_hash varchar(64) not null,
+	size bigint not null,
+	batch_size int not null,
+	committed_rows bigint default 0 not null,
+	status varchar(25) default 'running' not null,
+	created_at datetime default CURRENT_TIMESTAMP not null,
+	updated_at datetime default CURRENT_TIMESTAMP not null
+);
+
+
+--
+
+create index ix_{TABLE_NAME}_ingest_journal_filename
+	on {DATABASE_SCHEMA}.{TABLE_NAME}_ingest_journal (filename, modified);
+
+
+--
+
+create table {DATABASE_SCHEMA}.{TABLE_NAME}_watchlist
+(
+	id int identity
+		constraint pk_{TABLE_NAME}_watchlist
+			primary key,
+	name varchar(100) not null,
+	api14 varchar(14),
+	lat float not null,
+	lon float not null,
+	radius float not null,
+	created_at datetime default CURRENT_TIMESTAMP not null,
+	updated_at datetime default CURRENT_TIMESTAMP not null
+);
+
+
+--
+
+create table {DATABASE_SCHEMA}.{TABLE_NAME}_alerts
+(
+	watch_id int not null
+		references {DATABASE_SCHEMA}.{TABLE_NAME}_watchlist (id) on delete cascade,
+	api14 varchar(14) not null,
+	frac_start_date date not null,
+	frac_end_date date not null,
+	operator varchar(100),
+	wellname varchar(100),
+	distance float not null,
+	reason varchar(25) not null,
+	created_at datetime default CURRENT_TIMESTAMP not null,
+	updated_at datetime default CURRENT_TIMESTAMP not null,
+	constraint pk_{TABLE_NAME}_alerts
+		primary key (watch_id, api14, frac_start_date, frac_end_date)
+);
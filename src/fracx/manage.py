@@ -1,3 +1,4 @@
+from itertools import islice
 import logging
 import os
 import shutil
@@ -7,7 +8,22 @@ import click
 from flask.cli import AppGroup, FlaskGroup
 import sqlalchemy
 
-from collector import BytesFileHandler, Endpoint, FracScheduleCollector, Ftp
+from analysis import ProximityIndex, ScheduleSnapshot, watchlist
+from analysis import overlaps
+from analysis.proximity import attach_queries, load_schedules, query_points
+from analysis.sticks import attach_pairs, lateral_distances
+from api.models import Alert, IngestGeneration, Watchlist
+from collector import (
+    BytesFileHandler,
+    Deduplicator,
+    DownloadCache,
+    FracScheduleCollector,
+    Ftp,
+    IngestError,
+    Pipeline,
+    compiler,
+    open_ingest,
+)
 from config import get_active_config
 from fracx import create_app
 
@@ -26,6 +42,8 @@ cli = FlaskGroup(create_app=create_app, context_settings=CONTEXT_SETTINGS)
 run_cli = AppGroup("run")
 db_cli = AppGroup("db")
 test_cli = AppGroup("test")
+analysis_cli = AppGroup("analysis")
+watchlist_cli = AppGroup("watchlist")
 
 
 def get_terminal_columns():
@@ -60,7 +78,35 @@ def hr():
     help=f"Use a previously downloaded file",
     is_flag=True,
 )
-def collector(update_on_conflict, ignore_on_conflict, use_existing):
+@click.option(
+    "mode",
+    "--mode",
+    "-m",
+    type=click.Choice(FracScheduleCollector.modes),
+    help="upsert into the live table, or load a shadow table and swap it in"
+    " (postgres only)",
+    show_default=True,
+    default="upsert",
+)
+@click.option(
+    "duplicates",
+    "--duplicates",
+    "-d",
+    type=click.Choice(Deduplicator.policies),
+    help="which of the rows in the file sharing a primary key is kept",
+    show_default=True,
+    default=conf.COLLECTOR_DUPLICATE_POLICY,
+)
+@click.option(
+    "resume",
+    "--resume/--no-resume",
+    help="Resume an interrupted ingest of the latest file from its last checkpoint",
+    show_default=True,
+    default=True,
+)
+def collector(
+    update_on_conflict, ignore_on_conflict, use_existing, mode, duplicates, resume
+):
     "Run a one-off task to synchronize from the fracx data source"
 
     # import pandas as pd
@@ -72,35 +118,88 @@ def collector(update_on_conflict, ignore_on_conflict, use_existing):
 
     logger.info(conf)
 
-    endpoint = Endpoint.load_from_config(conf)["frac_schedules"]
-    collector = FracScheduleCollector(endpoint)
+    if mode == "swap" and conf.DATABASE_DRIVER != "postgres":
+        raise click.ClickException("--mode swap is only supported on postgres")
 
-    ftp = Ftp.from_config()
-    latest = ftp.get_latest()
+    endpoint = compiler.load(conf).load_endpoints()["frac_schedules"]
+    collector = FracScheduleCollector(endpoint, mode=mode)
 
-    rows = BytesFileHandler.xlsx(
-        latest.get("content"), date_columns=endpoint.mappings.get("dates"), sheet_no=1
+    ftp = Ftp.from_config()
+    cache = DownloadCache()
+    batch_size = conf.COLLECTOR_WRITE_SIZE
+    try:
+        journal, content = open_ingest(ftp, cache, batch_size, resume=resume)
+    except IngestError as e:
+        raise click.ClickException(str(e))
+
+    offset = journal.committed_rows
+    collector.journal = journal
+    if offset:
+        # changes committed before the interruption belong to this run too
+        collector.started_at = journal.created_at
+
+    rows = BytesFileHandler.xlsx_parallel(
+        content,
+        date_columns=endpoint.mappings.get("dates"),
+        sheet_no=1,
+        transform=collector.tf.transform,
+        start=offset,
     )
 
-    rows = list(rows)
-
-    rows = [collector.transform(row) for row in rows]
-
-    _ = [collector.persist([row]) for row in rows]
-
-    collector.collect(rows, update_on_conflict, ignore_on_conflict)
+    dedupe = Deduplicator(collector.model.row_key, policy=duplicates)
+    if offset and dedupe.policy == "first":
+        # keys of the rows committed before the interruption, so a later
+        # duplicate of one of them is still dropped
+        prefix = islice(
+            BytesFileHandler.xlsx(
+                content, date_columns=endpoint.mappings.get("dates"), sheet_no=1
+            ),
+            offset,
+        )
+        dedupe.seed(
+            row for row in map(collector.tf.transform, prefix) if collector.filter(row)
+        )
+
+    pipeline = Pipeline(
+        collector,
+        batch_size=batch_size,
+        update_on_conflict=update_on_conflict,
+        ignore_on_conflict=ignore_on_conflict,
+        transformed=True,
+        dedupe=dedupe,
+        offset=offset,
+    )
+    try:
+        pipeline.run(rows)
+        cache.discard(journal.content_hash)
+    finally:
+        ftp.cleanup()
 
-    ftp.cleanup()
+    if collector.started_at is not None:
+        try:
+            watchlist.check(collector.started_at)
+        except Exception as e:
+            logger.error(f"Watchlist evaluation failed -- {e}")
 
 
 @cli.command()
 def endpoints():
-    from collector import Endpoint
-
-    for name, ep in Endpoint.load_from_config(conf).items():
+    for name, ep in compiler.load(conf).load_endpoints().items():
         click.secho(name)
 
 
+@cli.command("compile-config")
+def compile_config():
+    "Validate the collector and parser definitions and save the compiled artifact"
+    try:
+        compiled = compiler.build(conf.COLLECTOR_CONFIG_PATH, conf.PARSER_CONFIG_PATH)
+    except compiler.ConfigCompilationError as e:
+        raise click.ClickException(str(e))
+
+    compiler.dump(compiled, conf.CONFIG_CACHE_PATH)
+    click.secho(f"{compiled} -> {conf.CONFIG_CACHE_PATH}")
+
+
 @cli.command()
 def show():
     import yaml
@@ -108,6 +207,241 @@ def show():
     yaml.safe_dump(conf.show, sys.stdout)
 
 
+@analysis_cli.command()
+@click.argument("wells", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "radius", "--radius", "-r", help="Search radius in miles", default=5.0, type=float
+)
+@click.option(
+    "k",
+    "--nearest",
+    "-k",
+    help="Return the k nearest schedules instead of all within the radius",
+    type=int,
+)
+@click.option("start", "--start", help="Start of the date window (YYYY-MM-DD)")
+@click.option("end", "--end", help="End of the date window (YYYY-MM-DD)")
+@click.option(
+    "output", "--output", "-o", help="Write results to a csv instead of stdout"
+)
+def proximity(wells, radius, k, start, end, output):
+    "Find frac schedules near the wells (lat/lon columns) in a csv"
+    import pandas as pd
+
+    queries = pd.read_csv(wells)
+    try:
+        lats, lons = query_points(queries)
+    except KeyError as e:
+        raise click.ClickException(str(e))
+
+    index = ProximityIndex.from_db(start=start, end=end)
+    logger.info(index)
+
+    if k:
+        result = index.nearest(lats, lons, k=k, max_radius=radius)
+    else:
+        result = index.within(lats, lons, radius)
+
+    result = attach_queries(result, queries)
+    result.to_csv(output or sys.stdout, index=False)
+
+
+@analysis_cli.command()
+@click.option("start", "--start", help="Start of the date window (YYYY-MM-DD)")
+@click.option("end", "--end", help="End of the date window (YYYY-MM-DD)")
+@click.option(
+    "wells",
+    "--near",
+    help="Only schedules near the wells (lat/lon columns) in this csv",
+    type=click.Path(exists=True, dir_okay=False),
+)
+@click.option(
+    "radius", "--radius", "-r", help="Search radius in miles", default=5.0, type=float
+)
+@click.option(
+    "output", "--output", "-o", help="Write results to a csv instead of stdout"
+)
+def active(start, end, wells, radius, output):
+    "List frac schedules active within a date window"
+    import pandas as pd
+
+    snapshot = ScheduleSnapshot(load_schedules())
+    logger.info(snapshot)
+
+    if wells:
+        queries = pd.read_csv(wells)
+        try:
+            lats, lons = query_points(queries)
+        except KeyError as e:
+            raise click.ClickException(str(e))
+        result = snapshot.active_near(lats, lons, radius, start=start, end=end)
+        result = attach_queries(result, queries)
+    else:
+        result = snapshot.active(start, end)
+
+    result.to_csv(output or sys.stdout, index=False)
+
+
+@analysis_cli.command()
+@click.argument("wellbores", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "distance",
+    "--distance",
+    "-d",
+    help="Maximum lateral to lateral distance in miles",
+    default=1.0,
+    type=float,
+)
+@click.option("start", "--start", help="Start of the date window (YYYY-MM-DD)")
+@click.option("end", "--end", help="End of the date window (YYYY-MM-DD)")
+@click.option(
+    "output", "--output", "-o", help="Write results to a csv instead of stdout"
+)
+def laterals(wellbores, distance, start, end, output):
+    "Screen scheduled laterals against wellbores (shllat/shllon/bhllat/bhllon csv)"
+    import pandas as pd
+
+    wells = pd.read_csv(wellbores)
+    missing = {"shllat", "shllon", "bhllat", "bhllon"} - set(wells.columns)
+    if missing:
+        raise click.ClickException(f"wellbores missing columns: {sorted(missing)}")
+
+    schedules = load_schedules(start=start, end=end)
+    result = lateral_distances(schedules, wells, max_distance=distance)
+    result = attach_pairs(result, schedules, wells)
+    result.to_csv(output or sys.stdout, index=False)
+
+
+@analysis_cli.command("overlaps")
+@click.option(
+    "distance",
+    "--distance",
+    "-d",
+    help="Maximum distance between schedules in miles",
+    default=1.0,
+    type=float,
+)
+@click.option(
+    "method",
+    "--method",
+    "-m",
+    help="Measure between surface locations or laterals (SHL-BHL sticks)",
+    type=click.Choice(overlaps.METHODS),
+    default="shl",
+    show_default=True,
+)
+@click.option("start", "--start", help="Start of the date window (YYYY-MM-DD)")
+@click.option("end", "--end", help="End of the date window (YYYY-MM-DD)")
+@click.option(
+    "output", "--output", "-o", help="Write results to a csv instead of stdout"
+)
+def analysis_overlaps(distance, method, start, end, output):
+    "Find nearby frac schedules that are active at the same time"
+    schedules = load_schedules(start=start, end=end)
+    result = overlaps.overlapping_pairs(
+        schedules, max_distance=distance, method=method
+    )
+    logger.info(f"Found {len(result)} overlapping pairs in {len(schedules)} schedules")
+    result = overlaps.attach_pairs(result, schedules)
+    result.to_csv(output or sys.stdout, index=False)
+
+
+@watchlist_cli.command("add")
+@click.argument("name")
+@click.argument("lat", type=float)
+@click.argument("lon", type=float)
+@click.option(
+    "radius", "--radius", "-r", help="Alert radius in miles", default=5.0, type=float
+)
+@click.option("api14", "--api14", help="API number of the watched well")
+def watchlist_add(name, lat, lon, radius, api14):
+    "Watch a location for nearby frac schedules"
+    watch = Watchlist(name=name, lat=lat, lon=lon, radius=radius, api14=api14)
+    Watchlist.persist_objects([watch])
+    click.secho(f"{watch.id}: {name} ({lat}, {lon}) within {radius} mi")
+
+
+@watchlist_cli.command("import")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "radius",
+    "--radius",
+    "-r",
+    help="Alert radius in miles, for rows without a radius column",
+    default=5.0,
+    type=float,
+)
+def watchlist_import(path, radius):
+    "Watch the locations (name, lat, lon[, radius, api14]) in a csv"
+    import pandas as pd
+
+    frame = pd.read_csv(path)
+    try:
+        lats, lons = query_points(frame)
+    except KeyError as e:
+        raise click.ClickException(str(e))
+
+    watches = []
+    rows = frame.rename(columns=str.lower).iterrows()
+    for lat, lon, (_, row) in zip(lats, lons, rows):
+        api14 = row.get("api14")
+        watches.append(
+            Watchlist(
+                name=str(row.get("name", f"{lat},{lon}")),
+                lat=float(lat),
+                lon=float(lon),
+                radius=float(row.get("radius", radius)),
+                api14=str(api14) if pd.notnull(api14) else None,
+            )
+        )
+    Watchlist.persist_objects(watches)
+    click.secho(f"Added {len(watches)} locations to the watchlist")
+
+
+@watchlist_cli.command("list")
+def watchlist_list():
+    "Show the watched locations"
+    for watch in Watchlist.query.order_by(Watchlist.id):
+        click.secho(
+            f"{watch.id}: {watch.name} ({watch.lat}, {watch.lon})"
+            f" within {watch.radius} mi"
+        )
+
+
+@watchlist_cli.command("remove")
+@click.argument("watch_id", type=int)
+def watchlist_remove(watch_id):
+    "Stop watching a location"
+    deleted = Watchlist.query.filter(Watchlist.id == watch_id).delete()
+    Watchlist.persist()
+    if not deleted:
+        raise click.ClickException(f"No watchlist entry with id {watch_id}")
+
+
+@watchlist_cli.command("alerts")
+@click.option("since", "--since", help="Only alerts raised since (YYYY-MM-DD)")
+@click.option(
+    "output", "--output", "-o", help="Write alerts to a csv instead of stdout"
+)
+def watchlist_alerts(since, output):
+    "Show watchlist alerts"
+    import pandas as pd
+
+    query = Alert.s.query(*Alert.__table__.columns)
+    if since:
+        query = query.filter(Alert.updated_at >= since)
+    frame = pd.read_sql(query.order_by(Alert.updated_at).statement, Alert.s.bind)
+    frame.to_csv(output or sys.stdout, index=False)
+
+
+@watchlist_cli.command("check")
+@click.argument("since")
+def watchlist_check(since):
+    "Evaluate schedules changed since the given time against the watchlist"
+    alerts = watchlist.check(since)
+    click.secho(f"{len(alerts)} alerts")
+
+
 @db_cli.command()
 def init(c=None):
     c = c or conf
@@ -148,8 +482,15 @@ def recreate(ctx):
         f"drop view if exists {conf.FRAC_SCHEDULE_TABLE_NAME}_most_recent_by_api10;"
     )
     engine.execute(f"drop table if exists {conf.FRAC_SCHEDULE_TABLE_NAME};")
+    engine.execute(
+        f"drop table if exists {conf.FRAC_SCHEDULE_TABLE_NAME}_latest_by_api10;"
+    )
     ctx.invoke(init)
 
+    # the generation table is kept so that cached reads of the dropped data expire
+    with app.app_context():
+        IngestGeneration.bump(conf.FRAC_SCHEDULE_TABLE_NAME)
+
 
 def main(argv=sys.argv):
     """
@@ -166,6 +507,8 @@ def main(argv=sys.argv):
 
 cli.add_command(run_cli)
 cli.add_command(db_cli)
+cli.add_command(analysis_cli)
+cli.add_command(watchlist_cli)
 
 if __name__ == "__main__":
     cli()
@@ -1,9 +1,20 @@
-from typing import Callable, Union, Iterable, Generator, Dict
+from typing import (
+    Any,
+    Callable,
+    Union,
+    Iterable,
+    Generator,
+    Dict,
+    NamedTuple,
+    Sequence,
+)
+from collections import abc
 import math
 import itertools
 
 from util.strings import StringProcessor  # noqa
 from util.exc import RootException  # noqa
+from util.files import UnsafePathError, check_owner, private_dir  # noqa
 
 
 def hf_size(size_bytes: Union[str, int]) -> str:
@@ -31,38 +42,150 @@ def hf_size(size_bytes: Union[str, int]) -> str:
     return f"{s} {suffixes[i]}"
 
 
+class Batch(NamedTuple):
+    """ A chunk of records along with its position in the source iterable """
+
+    index: int
+    offset: int
+    size: int
+    items: Sequence
+
+
 def chunks(iterable: Iterable, n: int = 1000) -> Generator:
-    """ Process an interable in chunks of size n (default=1000) """
-    it = iter(iterable)
-    while True:
-        chunk_it = itertools.islice(it, n)
-        try:
-            first_el = next(chunk_it)
-        except StopIteration:
-            return
-        yield itertools.chain((first_el,), chunk_it)
+    """ Process an interable in chunks of size n (default=1000).
+
+        Bytes-like inputs are chunked as memoryviews (zero-copy) and sequences
+        are chunked by slicing. Anything else is streamed into lists of at most
+        n items, so only one chunk is held in memory at a time.
+    """
+    n = max(int(n), 1)
+    if isinstance(iterable, (bytes, bytearray, memoryview)):
+        view = memoryview(iterable)
+        for idx in range(0, len(view), n):
+            yield view[idx : idx + n]
+    elif isinstance(iterable, abc.Sequence):
+        for idx in range(0, len(iterable), n):
+            yield iterable[idx : idx + n]
+    else:
+        it = iter(iterable)
+        while True:
+            chunk = list(itertools.islice(it, n))
+            if not chunk:
+                return
+            yield chunk
+
+
+def batches(iterable: Iterable, n: int = 1000) -> Generator[Batch, None, None]:
+    """ Same as chunks, but each chunk is wrapped in a Batch reporting its
+        index, offset, and size for instrumentation """
+    offset = 0
+    for index, chunk in enumerate(chunks(iterable, n)):
+        size = len(chunk)
+        yield Batch(index, offset, size, chunk)
+        offset += size
+
+
+def fuse(*converters: Callable) -> Callable:
+    """ Combine several value converters into one callable so a single traversal
+        can apply all of them. Each converter only receives the previous result
+        if it is still a scalar, matching sequential apply_transformation calls.
+    """
+    if len(converters) == 1:
+        return converters[0]
+
+    def fused(value):
+        for convert in converters:
+            if not isinstance(value, _SCALARS):
+                break
+            value = convert(value)
+        return value
+
+    return fused
+
+
+_SCALARS = (str, int, float)
+_SCALAR_TYPES = {str, int, float, bool}
+_MAPPING, _SEQUENCE, _SCALAR, _OTHER = range(4)
+
+# exact type -> node kind. subclasses are resolved once and cached.
+_dispatch: Dict[type, int] = {
+    dict: _MAPPING,
+    list: _SEQUENCE,
+    set: _SEQUENCE,
+    tuple: _SEQUENCE,
+    str: _SCALAR,
+    int: _SCALAR,
+    float: _SCALAR,
+    bool: _SCALAR,
+}
+
+
+def _kind(obj: Any) -> int:
+    cls = type(obj)
+    kind = _dispatch.get(cls)
+    if kind is None:
+        if isinstance(obj, dict):
+            kind = _MAPPING
+        elif isinstance(obj, (list, set, tuple)):
+            kind = _SEQUENCE
+        elif isinstance(obj, _SCALARS):
+            kind = _SCALAR
+        else:
+            kind = _OTHER
+        _dispatch[cls] = kind
+    return kind
+
+
+def _walk(data: Any, convert: Callable, keys: bool, values: bool) -> Any:
+    """ Iterative traversal backing apply_transformation """
+    root: list = [None]
+    stack = [(data, root, 0)]
+    pending = []  # sequences to rebuild once their children are converted
+
+    while stack:
+        node, target, slot = stack.pop()
+        kind = _kind(node)
+
+        if kind == _SCALAR:
+            target[slot] = convert(node) if values else node
+        elif kind == _MAPPING:
+            new = node.__class__()
+            target[slot] = new
+            for k, v in node.items():
+                if keys:
+                    k = convert(k)
+                new[k] = v
+                if _kind(v) != _OTHER:
+                    stack.append((v, new, k))
+        elif kind == _SEQUENCE:
+            items = list(node)
+            pending.append((target, slot, node.__class__, items))
+            for idx, v in enumerate(items):
+                if _kind(v) != _OTHER:
+                    stack.append((v, items, idx))
+        else:
+            target[slot] = node
+
+    # children are always queued after their parents
+    for target, slot, cls, items in reversed(pending):
+        target[slot] = cls(items)
+
+    return root[0]
 
 
 def apply_transformation(
     data: dict, convert: Callable, keys: bool = False, values: bool = True
 ) -> Dict:
-    """ Recursively apply the passed function to a dict's keys, values, or both """
-    if isinstance(data, (str, int, float)):
-        if values:
-            return convert(data)
-        else:
-            return data
-    if isinstance(data, dict):
-        new = data.__class__()
-        for k, v in data.items():
-            if keys:
-                new[convert(k)] = apply_transformation(v, convert, keys, values)
-            else:
-                new[k] = apply_transformation(v, convert, keys, values)
-    elif isinstance(data, (list, set, tuple)):
-        new = data.__class__(
-            apply_transformation(v, convert, keys, values) for v in data
-        )
-    else:
-        return data
-    return new
+    """ Apply the passed function to a dict's keys, values, or both, descending
+        into nested dicts, lists, sets, and tuples """
+    if type(data) is dict and not keys:
+        # fast path for flat rows
+        if not values:
+            return dict(data)
+        return {
+            k: convert(v)
+            if type(v) in _SCALAR_TYPES
+            else _walk(v, convert, keys, values)
+            for k, v in data.items()
+        }
+    return _walk(data, convert, keys, values)
@@ -0,0 +1,100 @@
+from typing import Hashable, Iterable, Iterator
+from hashlib import blake2b
+import math
+import struct
+
+
+HEADER = struct.Struct("<4sQdQIQ")
+MAGIC = b"FXBF"
+
+
+class BloomFilter(object):
+    """ Compact probabilistic set. A key that was added is always reported as
+        present; a key that was not is reported present with a probability of
+        about error_rate, as long as no more than capacity keys are added.
+
+        Each key is hashed once (blake2b of its repr) and the k bit positions
+        are derived from the two halves of the digest by double hashing. Keys
+        must therefore have a stable repr: tuples of strings, numbers and dates
+        do. """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate must be between 0 and 1")
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+        self.size = self.optimal_size(self.capacity, error_rate)
+        self.hashes = self.optimal_hashes(self.capacity, self.size)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def __repr__(self):
+        return (
+            f"BloomFilter: {self.count}/{self.capacity} keys"
+            f" ({self.size} bits, {self.hashes} hashes)"
+        )
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, key: Hashable) -> bool:
+        bits = self.bits
+        return all(bits[i >> 3] & (1 << (i & 7)) for i in self._positions(key))
+
+    @staticmethod
+    def optimal_size(capacity: int, error_rate: float) -> int:
+        """ Number of bits for capacity keys at the given error rate """
+        bits = -capacity * math.log(error_rate) / math.log(2) ** 2
+        return max(int(math.ceil(bits)), 8)
+
+    @staticmethod
+    def optimal_hashes(capacity: int, size: int) -> int:
+        """ Number of bit positions per key that minimizes the error rate """
+        return max(int(round(size / capacity * math.log(2))), 1)
+
+    @property
+    def full(self) -> bool:
+        """ More keys than capacity were added, so the error rate is no longer
+            guaranteed """
+        return self.count > self.capacity
+
+    def _positions(self, key: Hashable) -> Iterator[int]:
+        digest = blake2b(repr(key).encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key: Hashable):
+        bits = self.bits
+        for i in self._positions(key):
+            bits[i >> 3] |= 1 << (i & 7)
+        self.count += 1
+
+    def update(self, keys: Iterable[Hashable]):
+        for key in keys:
+            self.add(key)
+
+    def to_bytes(self) -> bytes:
+        header = HEADER.pack(
+            MAGIC, self.capacity, self.error_rate, self.size, self.hashes, self.count
+        )
+        return header + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BloomFilter":
+        """ Inverse of to_bytes. Raises ValueError if data is not a filter. """
+        if len(data) < HEADER.size:
+            raise ValueError("data is too short to be a bloom filter")
+        magic, capacity, error_rate, size, hashes, count = HEADER.unpack_from(data)
+        bits = data[HEADER.size :]
+        if magic != MAGIC or len(bits) != (size + 7) // 8:
+            raise ValueError("data is not a bloom filter")
+        bf = cls.__new__(cls)
+        bf.capacity = capacity
+        bf.error_rate = error_rate
+        bf.size = size
+        bf.hashes = hashes
+        bf.bits = bytearray(bits)
+        bf.count = count
+        return bf
@@ -0,0 +1,26 @@
+import os
+
+from util.exc import RootException
+
+
+class UnsafePathError(RootException):
+    pass
+
+
+def check_owner(path: str) -> None:
+    """ Refuse a file (or directory) that another user owns or can write to """
+    if not hasattr(os, "getuid"):
+        return
+    st = os.stat(path)
+    if st.st_uid != os.getuid():
+        raise UnsafePathError(f"{path} is not owned by the current user")
+    if st.st_mode & 0o022:
+        raise UnsafePathError(f"{path} is writable by other users")
+
+
+def private_dir(path: str) -> str:
+    """ Create a directory only the current user can access (0700), or check
+        that an existing one is owned by them and not writable by others """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    check_owner(path)
+    return path
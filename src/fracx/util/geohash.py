@@ -0,0 +1,168 @@
+""" Geohash encoding and range covers for index-backed spatial filtering on
+    backends without spatial types.
+
+    A geohash interleaves the bits of the quantized longitude and latitude, so
+    every cell at a coarser precision is a prefix of the hashes inside it. Stored
+    at full precision, a single indexed column therefore serves every precision:
+    the hashes inside a cell are exactly the range [cell, successor(cell)).
+"""
+
+from typing import List, Optional, Tuple
+import math
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+PRECISION = 12
+
+_DECODE = {c: i for i, c in enumerate(BASE32)}
+
+MILES_PER_DEGREE = 69.09
+
+BBox = Tuple[float, float, float, float]
+Range = Tuple[str, Optional[str]]
+
+
+def _bits(precision: int) -> Tuple[int, int]:
+    """ (longitude bits, latitude bits) at the given precision """
+    total = precision * 5
+    return (total + 1) // 2, total // 2
+
+
+def _quantize(value: float, low: float, high: float, bits: int) -> int:
+    cells = 1 << bits
+    index = int((value - low) / (high - low) * cells)
+    return min(max(index, 0), cells - 1)
+
+
+def _interleave(lon_index: int, lat_index: int, precision: int) -> str:
+    lon_bits, lat_bits = _bits(precision)
+    value = 0
+    for i in range(precision * 5):
+        # even bits (from the most significant) are longitude
+        if i % 2 == 0:
+            lon_bits -= 1
+            bit = (lon_index >> lon_bits) & 1
+        else:
+            lat_bits -= 1
+            bit = (lat_index >> lat_bits) & 1
+        value = (value << 1) | bit
+
+    chars = []
+    for _ in range(precision):
+        chars.append(BASE32[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+def _deinterleave(geohash: str) -> Tuple[int, int]:
+    value = 0
+    for c in geohash:
+        value = (value << 5) | _DECODE[c]
+
+    lon_index = lat_index = 0
+    for i in range(len(geohash) * 5):
+        bit = (value >> (len(geohash) * 5 - 1 - i)) & 1
+        if i % 2 == 0:
+            lon_index = (lon_index << 1) | bit
+        else:
+            lat_index = (lat_index << 1) | bit
+    return lon_index, lat_index
+
+
+def encode(lat: float, lon: float, precision: int = PRECISION) -> str:
+    lon_bits, lat_bits = _bits(precision)
+    return _interleave(
+        _quantize(lon, -180.0, 180.0, lon_bits),
+        _quantize(lat, -90.0, 90.0, lat_bits),
+        precision,
+    )
+
+
+def bounds(geohash: str) -> BBox:
+    """ (min_lon, min_lat, max_lon, max_lat) of a geohash cell """
+    lon_bits, lat_bits = _bits(len(geohash))
+    lon_index, lat_index = _deinterleave(geohash)
+    lon_size = 360.0 / (1 << lon_bits)
+    lat_size = 180.0 / (1 << lat_bits)
+    min_lon = -180.0 + lon_index * lon_size
+    min_lat = -90.0 + lat_index * lat_size
+    return min_lon, min_lat, min_lon + lon_size, min_lat + lat_size
+
+
+def decode(geohash: str) -> Tuple[float, float]:
+    """ (lat, lon) of the center of a geohash cell """
+    min_lon, min_lat, max_lon, max_lat = bounds(geohash)
+    return (min_lat + max_lat) / 2, (min_lon + max_lon) / 2
+
+
+def successor(geohash: str) -> Optional[str]:
+    """ The first hash after every hash prefixed by geohash, or None if there is
+        no such hash (the prefix is all z) """
+    chars = list(geohash)
+    while chars:
+        i = _DECODE[chars[-1]]
+        if i < len(BASE32) - 1:
+            chars[-1] = BASE32[i + 1]
+            return "".join(chars)
+        chars.pop()
+    return None
+
+
+def _span(bbox: BBox, precision: int) -> Tuple[int, int, int, int]:
+    """ Inclusive longitude and latitude cell index ranges of a bbox """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    lon_bits, lat_bits = _bits(precision)
+    return (
+        _quantize(min_lon, -180.0, 180.0, lon_bits),
+        _quantize(max_lon, -180.0, 180.0, lon_bits),
+        _quantize(min_lat, -90.0, 90.0, lat_bits),
+        _quantize(max_lat, -90.0, 90.0, lat_bits),
+    )
+
+
+def cells(bbox: BBox, precision: int) -> List[str]:
+    """ Every geohash cell at the given precision that intersects the bbox """
+    i0, i1, j0, j1 = _span(bbox, precision)
+    return [
+        _interleave(i, j, precision)
+        for i in range(i0, i1 + 1)
+        for j in range(j0, j1 + 1)
+    ]
+
+
+def cover(
+    bbox: BBox, max_cells: int = 32, max_precision: int = PRECISION
+) -> List[str]:
+    """ The finest set of at most max_cells geohash cells covering the bbox """
+    best = [""]
+    for precision in range(1, max_precision + 1):
+        i0, i1, j0, j1 = _span(bbox, precision)
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > max_cells:
+            break
+        best = cells(bbox, precision)
+    return sorted(best)
+
+
+def ranges(bbox: BBox, max_cells: int = 32) -> List[Range]:
+    """ Half open [low, high) ranges of full precision hashes covering the bbox.
+        Adjacent cells in hash order are merged, so the cover becomes a few
+        index range seeks. A high of None is unbounded. """
+    merged: List[Range] = []
+    for cell in cover(bbox, max_cells=max_cells):
+        if merged and merged[-1][1] == cell:
+            merged[-1] = (merged[-1][0], successor(cell))
+        else:
+            merged.append((cell, successor(cell)))
+    return merged
+
+
+def radius_bbox(lat: float, lon: float, miles: float) -> BBox:
+    """ Bounding box of a circle of the given radius """
+    dlat = miles / MILES_PER_DEGREE
+    dlon = miles / (MILES_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+    return lon - dlon, lat - dlat, lon + dlon, lat + dlat
+
+
+def radius_ranges(
+    lat: float, lon: float, miles: float, max_cells: int = 32
+) -> List[Range]:
+    return ranges(radius_bbox(lat, lon, miles), max_cells=max_cells)
@@ -1,3 +1,5 @@
+from typing import Any
+import functools
 import re
 
 
@@ -5,17 +7,35 @@ class StringProcessor:
     re_ws = re.compile(r"\s+")
     re_dup_ws = re.compile(r"\s\s+")
     re_non_alphanum = re.compile(r"(?ui)\W")
+    re_non_alphanum_runs = re.compile(r"(?ui)\W+")
     re_non_num = re.compile(r"[^\d+]")
-    replacement = "_"
+    _replacement = "_"
+    _strip_table = str.maketrans({" ": None})
     tolower = True
 
     def __init__(
-        self, replacement: str = "_", tolower: bool = True, toupper: bool = False
+        self,
+        replacement: str = "_",
+        tolower: bool = True,
+        toupper: bool = False,
+        cache_size: int = 1024,
     ):
 
         self.replacement = replacement
         self.tolower = tolower
         self.toupper = toupper
+        self._cached = functools.lru_cache(maxsize=cache_size, typed=True)(
+            self.normalize
+        )
+
+    @property
+    def replacement(self) -> str:
+        return self._replacement
+
+    @replacement.setter
+    def replacement(self, value: str):
+        self._replacement = value
+        self._fill_table = str.maketrans({" ": value})
 
     def alphanum_only(self, s: str) -> str:
         """ Replace all non-alphanumeric characters with whitespace.
@@ -66,15 +86,14 @@ class StringProcessor:
         """
 
         if s is not None:
-            s = str(s)
-            s = self.alphanum_only(s)
-            s = self.dedupe_whitespace(s)
-            s = str.strip(s)
+            # a single pass collapses each run of non-alphanumerics to one space,
+            # leaving only single spaces between words for translate to fill
+            s = self.re_non_alphanum_runs.sub(" ", str(s)).strip(" ")
 
             if int_compatable:
-                s = self.remove_whitespace(s)
+                s = s.translate(self._strip_table)
             else:
-                s = self.fill_whitespace(s)
+                s = s.translate(self._fill_table)
 
                 if self.toupper:
                     s = s.upper()
@@ -82,3 +101,13 @@ class StringProcessor:
                     s = s.lower()
 
         return s
+
+    def cached_normalize(self, s: Any, int_compatable: bool = False) -> str:
+        """ LRU cached variant of normalize, intended for values that repeat
+            heavily, such as column headers and row keys. Options are read from
+            the instance, so they should not be changed after the first call.
+        """
+        try:
+            return self._cached(s, int_compatable)
+        except TypeError:  # unhashable input
+            return self.normalize(s, int_compatable)
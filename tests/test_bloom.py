@@ -0,0 +1,53 @@
+from datetime import date
+
+import pytest  # noqa
+
+from util.bloom import BloomFilter
+
+
+def key(i: int):
+    return (f"4246{i:010}", date(2020, 1, 1), date(2020, 2, 1))
+
+
+class TestBloomFilter:
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000)
+        bloom.update(key(i) for i in range(1000))
+        assert all(key(i) in bloom for i in range(1000))
+        assert len(bloom) == 1000
+        assert not bloom.full
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter(10000, error_rate=0.01)
+        bloom.update(key(i) for i in range(10000))
+        false_positives = sum(key(i) in bloom for i in range(10000, 30000))
+        assert false_positives / 20000 < 0.02
+
+    def test_sizing(self):
+        bloom = BloomFilter(1000, error_rate=0.01)
+        # ~9.6 bits and 7 hashes per key
+        assert bloom.size == 9586
+        assert bloom.hashes == 7
+        assert len(bloom.bits) == 1199
+
+    def test_full(self):
+        bloom = BloomFilter(2)
+        bloom.update(key(i) for i in range(3))
+        assert bloom.full
+
+    def test_invalid_error_rate(self):
+        with pytest.raises(ValueError):
+            BloomFilter(10, error_rate=1)
+
+    def test_round_trip(self):
+        bloom = BloomFilter(1000)
+        bloom.update(key(i) for i in range(500))
+        restored = BloomFilter.from_bytes(bloom.to_bytes())
+        assert all(key(i) in restored for i in range(500))
+        assert (restored.capacity, restored.hashes, len(restored)) == (1000, 7, 500)
+
+    def test_from_bytes_rejects_other_data(self):
+        with pytest.raises(ValueError):
+            BloomFilter.from_bytes(b"not a filter")
+        with pytest.raises(ValueError):
+            BloomFilter.from_bytes(BloomFilter(1000).to_bytes()[:-1])
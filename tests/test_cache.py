@@ -0,0 +1,160 @@
+import pytest  # noqa
+
+import api.views
+from api.cache import GenerationClock, ResponseCache, make_etag
+
+
+@pytest.fixture
+def cache():
+    yield ResponseCache(max_entries=2, max_body_bytes=10)
+
+
+@pytest.fixture
+def generation(monkeypatch):
+    """ fake ingest generation and query results so no database is needed """
+    state = {"generation": 1, "queries": 0}
+
+    def stream_page(q, query):
+        state["queries"] += 1
+        yield '{"data": []}'
+
+    state["clock"] = GenerationClock(lambda: state["generation"], ttl=0)
+    monkeypatch.setattr(api.views, "current_generation", state["clock"])
+    monkeypatch.setattr(api.views, "build_query", lambda q: None)
+    monkeypatch.setattr(api.views, "stream_page", stream_page)
+    api.views.response_cache.clear()
+    yield state
+
+
+class TestResponseCache:
+    def test_get_set(self, cache):
+        assert cache.get("key") is None
+        cache.set("key", "body")
+        assert cache.get("key") == b"body"
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_evicts_least_recently_used(self, cache):
+        cache.set("a", "1")
+        cache.set("b", "2")
+        cache.get("a")
+        cache.set("c", "3")
+        assert cache.get("b") is None
+        assert cache.get("a") == b"1"
+
+    def test_rejects_large_body(self, cache):
+        assert cache.set("key", "x" * 11) is False
+        assert cache.get("key") is None
+
+    def test_etag_depends_on_generation(self):
+        assert make_etag(1, ("query",)) == make_etag(1, ("query",))
+        assert make_etag(1, ("query",)) != make_etag(2, ("query",))
+
+
+class TestGenerationClock:
+    def test_value_is_reused_within_ttl(self):
+        calls = []
+        clock = GenerationClock(lambda: calls.append(1) or len(calls), ttl=60)
+        assert clock() == 1
+        assert clock() == 1
+
+    def test_value_is_refreshed_after_ttl(self):
+        calls = []
+        clock = GenerationClock(lambda: calls.append(1) or len(calls), ttl=0)
+        assert clock() == 1
+        assert clock() == 2
+
+    def test_refresh_ignores_ttl(self):
+        calls = []
+        clock = GenerationClock(lambda: calls.append(1) or len(calls), ttl=60)
+        assert clock() == 1
+        assert clock.refresh() == 2
+        assert clock() == 2
+
+    def test_failed_fetch(self):
+        def fail():
+            raise ValueError("no table")
+
+        assert GenerationClock(fail)() is None
+
+
+class TestConditionalRequests:
+    def test_repeat_request_is_served_from_cache(self, app, generation):
+        client = app.test_client()
+        first = client.get("/frac_schedules")
+        first_body = first.get_data()
+        second = client.get("/frac_schedules")
+        assert first_body == second.get_data()
+        assert first.headers["ETag"] == second.headers["ETag"]
+        assert generation["queries"] == 1
+
+    def test_if_none_match(self, app, generation):
+        client = app.test_client()
+        first = client.get("/frac_schedules")
+        first.get_data()
+        response = client.get(
+            "/frac_schedules", headers={"If-None-Match": first.headers["ETag"]}
+        )
+        assert response.status_code == 304
+        assert generation["queries"] == 1
+
+    def test_new_generation_changes_etag(self, app, generation):
+        client = app.test_client()
+        first = client.get("/frac_schedules")
+        first.get_data()
+        etag = first.headers["ETag"]
+        generation["generation"] += 1
+        response = client.get("/frac_schedules", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+        assert generation["queries"] == 2
+
+    def test_normalized_query_shares_cache(self, app, generation):
+        client = app.test_client()
+        client.get("/frac_schedules?start=2020-01-01").get_data()
+        client.get("/frac_schedules?start=2020-1-1").get_data()
+        assert generation["queries"] == 1
+
+    def test_lagging_clock_does_not_serve_previous_generation(self, app, generation):
+        generation["clock"].ttl = 60
+        client = app.test_client()
+        first = client.get("/frac_schedules")
+        first.get_data()
+        generation["generation"] += 1
+        # the clock still reads the old generation, but the body is rebuilt
+        second = client.get("/frac_schedules")
+        second.get_data()
+        assert second.headers["ETag"] != first.headers["ETag"]
+        assert generation["queries"] == 2
+
+    def test_lagging_clock_does_not_revalidate_previous_etag(self, app, generation):
+        generation["clock"].ttl = 60
+        client = app.test_client()
+        first = client.get("/frac_schedules")
+        first.get_data()
+        etag = first.headers["ETag"]
+        generation["generation"] += 1
+        response = client.get("/frac_schedules", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+
+    def test_page_read_during_ingest_is_not_cached(self, app, generation, monkeypatch):
+        def stream_page(q, query):
+            generation["queries"] += 1
+            yield '{"data": []}'
+            generation["generation"] += 1  # an ingest commits mid stream
+
+        monkeypatch.setattr(api.views, "stream_page", stream_page)
+        client = app.test_client()
+        client.get("/frac_schedules").get_data()
+        assert len(api.views.response_cache) == 0
+
+    def test_body_size_is_counted_in_bytes(self, app, generation, monkeypatch):
+        def stream_page(q, query):
+            generation["queries"] += 1
+            yield "\u00e9" * 6  # 6 characters, 12 bytes
+
+        monkeypatch.setattr(api.views, "stream_page", stream_page)
+        monkeypatch.setattr(api.views.response_cache, "max_body_bytes", 10)
+        client = app.test_client()
+        client.get("/frac_schedules").get_data()
+        assert len(api.views.response_cache) == 0
@@ -0,0 +1,109 @@
+import os
+import pickle
+
+import pytest  # noqa
+
+from __version__ import __version__
+from collector import compiler
+from collector.row_parser import RowParser
+
+
+@pytest.fixture
+def cache_conf(conf, tmpdir):
+    conf.CONFIG_CACHE_PATH = str(tmpdir.join("fracx", "config.pickle"))
+    yield conf
+
+
+@pytest.fixture
+def bad_parser_path(tmpdir):
+    path = tmpdir.join("parsers.yaml")
+    path.write(
+        """parsers:
+            default:
+                rules:
+                    - name: bad_rule
+                      criteria:
+                          - name: match_nothing
+                            type: NotACriterion
+                            value: ^$
+            """
+    )
+    yield str(path)
+
+
+class TestCompiler:
+    def test_build(self, conf):
+        compiled = compiler.build(conf.COLLECTOR_CONFIG_PATH, conf.PARSER_CONFIG_PATH)
+        assert "frac_schedules" in compiled.endpoints
+        assert isinstance(compiled.row_parser, RowParser)
+
+    def test_load_endpoints(self, conf):
+        compiled = compiler.build(conf.COLLECTOR_CONFIG_PATH, conf.PARSER_CONFIG_PATH)
+        ep = compiled.load_endpoints()["frac_schedules"]
+        assert ep.model.__name__ == "FracSchedule"
+
+    def test_load_writes_artifact(self, cache_conf, tmpdir):
+        compiled = compiler.load(cache_conf)
+        version, digest, cached = compiler.read(cache_conf.CONFIG_CACHE_PATH)
+        assert version == compiler.cache_version()
+        assert digest == compiled.digest
+        directory = os.path.dirname(cache_conf.CONFIG_CACHE_PATH)
+        assert os.stat(directory).st_mode & 0o777 == 0o700
+
+    def test_cache_version(self):
+        layout, package, source = compiler.cache_version().split(":")
+        assert layout == str(compiler.CACHE_VERSION)
+        assert package == __version__
+        assert len(source) == 64
+
+    def test_refuses_writable_artifact(self, cache_conf):
+        compiler.load(cache_conf)
+        os.chmod(cache_conf.CONFIG_CACHE_PATH, 0o666)
+        with pytest.raises(compiler.ConfigCompilationError, match="writable"):
+            compiler.read(cache_conf.CONFIG_CACHE_PATH)
+        with pytest.raises(compiler.ConfigCompilationError):
+            compiler.load(cache_conf, rebuild=False)
+
+    def test_load_from_artifact(self, cache_conf):
+        compiler.load(cache_conf)
+        compiled = compiler.load(cache_conf, rebuild=False)
+        assert compiled.row_parser.parsers[0].parse("1.5") == 1.5
+
+    def test_stale_artifact_is_rebuilt(self, cache_conf):
+        compiled = compiler.load(cache_conf)
+        compiled.digest = "stale"
+        compiler.dump(compiled, cache_conf.CONFIG_CACHE_PATH)
+        assert compiler.load(cache_conf).digest != "stale"
+
+    def test_stale_artifact_no_rebuild(self, cache_conf):
+        compiled = compiler.load(cache_conf)
+        compiled.digest = "stale"
+        compiler.dump(compiled, cache_conf.CONFIG_CACHE_PATH)
+        with pytest.raises(compiler.ConfigCompilationError):
+            compiler.load(cache_conf, rebuild=False)
+
+    def test_touched_yaml_is_rebuilt(self, cache_conf, tmpdir):
+        parser_path = tmpdir.join("parsers.yaml")
+        with open(cache_conf.PARSER_CONFIG_PATH) as f:
+            parser_path.write(f.read())
+        cache_conf.PARSER_CONFIG_PATH = str(parser_path)
+        compiled = compiler.load(cache_conf)
+        st = os.stat(cache_conf.PARSER_CONFIG_PATH)
+        os.utime(
+            cache_conf.PARSER_CONFIG_PATH, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9)
+        )
+        assert compiler.load(cache_conf).digest != compiled.digest
+
+    def test_pickle_multiple_parsers(self, conf):
+        rp = compiler.build(
+            conf.COLLECTOR_CONFIG_PATH, conf.PARSER_CONFIG_PATH
+        ).row_parser
+        rp.add_parser(rp.parsers[0])
+        row = {"value": "1.5", "date": "2020-01-01", "flag": "yes"}
+        expected = rp.parse(row)
+        restored = pickle.loads(pickle.dumps(rp))
+        assert restored.parse(row) == expected
+
+    def test_invalid_criterion_type(self, conf, bad_parser_path):
+        with pytest.raises(compiler.ConfigCompilationError):
+            compiler.build(conf.COLLECTOR_CONFIG_PATH, bad_parser_path)
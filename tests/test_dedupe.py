@@ -0,0 +1,73 @@
+from datetime import date, datetime
+
+import pytest  # noqa
+
+from api.models import FracSchedule
+from collector.dedupe import Deduplicator
+
+
+def row(api14: str, operator: str, start: datetime = datetime(2020, 1, 1)):
+    return {
+        "api14": api14,
+        "frac_start_date": start,
+        "frac_end_date": datetime(2020, 2, 1),
+        "operator": operator,
+    }
+
+
+@pytest.fixture
+def batches():
+    yield [
+        [
+            row("42461405560000", "a"),
+            row("42461405550000", "b"),
+            row("42461405560000", "c"),
+        ],
+        [row("42461405550000", "d"), row("42461405550000", "e", datetime(2020, 1, 2))],
+    ]
+
+
+class TestDeduplicator:
+    def test_last_wins(self, batches):
+        dedupe = Deduplicator(FracSchedule.row_key, policy="last")
+        first = dedupe(batches[0])
+        assert [(r["api14"], r["operator"]) for r in first] == [
+            ("42461405550000", "b"),
+            ("42461405560000", "c"),
+        ]
+        # a later batch is written later, so it overwrites on its own
+        assert len(dedupe(batches[1])) == 2
+        assert dedupe.duplicates == 1
+
+    def test_first_wins(self, batches):
+        dedupe = Deduplicator(FracSchedule.row_key, policy="first")
+        first = dedupe(batches[0])
+        assert [r["operator"] for r in first] == ["b", "a"]
+        second = dedupe(batches[1])
+        assert [r["operator"] for r in second] == ["e"]
+        assert dedupe.duplicates == 2
+
+    def test_seed_resumed_file(self, batches):
+        dedupe = Deduplicator(FracSchedule.row_key, policy="first")
+        dedupe.seed(batches[0])
+        second = dedupe(batches[1])
+        assert [r["operator"] for r in second] == ["e"]
+
+    def test_seed_ignored_when_last_wins(self, batches):
+        dedupe = Deduplicator(FracSchedule.row_key, policy="last")
+        dedupe.seed(batches[0])
+        assert not dedupe.seen
+
+    def test_sorted_by_key(self):
+        dedupe = Deduplicator(FracSchedule.row_key, policy="last")
+        rows = [
+            row("42461405550000", "a", datetime(2020, 1, 3)),
+            {"api14": "42461405550000", "frac_start_date": None},
+            row("42461405550000", "b", datetime(2020, 1, 2)),
+        ]
+        keys = [FracSchedule.row_key(r)[1] for r in dedupe(rows)]
+        assert keys == [date(2020, 1, 2), date(2020, 1, 3), None]
+
+    def test_invalid_policy(self):
+        with pytest.raises(ValueError):
+            Deduplicator(FracSchedule.row_key, policy="random")
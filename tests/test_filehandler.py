@@ -0,0 +1,150 @@
+import io
+import pickle
+import zipfile
+from datetime import datetime
+from operator import itemgetter
+
+import pytest  # noqa
+
+from api.models import FracSchedule
+from api.records import record_type_for
+from collector.filehandler import BytesFileHandler
+from collector.transformer import Transformer
+
+CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels"
+ ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml"
+ ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml"
+ ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+</Types>"""
+
+RELS = """<?xml version="1.0" encoding="UTF-8"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Target="xl/workbook.xml"
+ Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>
+</Relationships>"""
+
+WORKBOOK = """<?xml version="1.0" encoding="UTF-8"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+ xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets>
+</workbook>"""
+
+WORKBOOK_RELS = """<?xml version="1.0" encoding="UTF-8"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Target="worksheets/sheet1.xml"
+ Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>
+</Relationships>"""
+
+
+def _cell(value) -> str:
+    if isinstance(value, str):
+        return f'<c t="inlineStr"><is><t>{value}</t></is></c>'
+    return f"<c><v>{value}</v></c>"
+
+
+def make_xlsx(rows) -> bytes:
+    """ Minimal single sheet workbook """
+    data = "".join(
+        f"<row>{''.join(_cell(v) for v in row)}</row>" for row in rows
+    )
+    sheet = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        f"<sheetData>{data}</sheetData></worksheet>"
+    )
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as z:
+        z.writestr("[Content_Types].xml", CONTENT_TYPES)
+        z.writestr("_rels/.rels", RELS)
+        z.writestr("xl/workbook.xml", WORKBOOK)
+        z.writestr("xl/_rels/workbook.xml.rels", WORKBOOK_RELS)
+        z.writestr("xl/worksheets/sheet1.xml", sheet)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def content():
+    header = ["API Number", "Surface Lat", "Frac Start"]
+    rows = [[f"4200000000{i:04}", 31.0 + i / 1000, 43831 + i] for i in range(250)]
+    yield make_xlsx([header] + rows)
+
+
+@pytest.fixture
+def transformer():
+    yield Transformer(
+        aliases={"api_number": "api14", "surface_lat": "shllat"},
+        record_type=record_type_for(FracSchedule),
+    )
+
+
+class TestBytesFileHandler:
+    def test_xlsx(self, content):
+        rows = list(BytesFileHandler.xlsx(content, date_columns=["frac_start"]))
+        assert len(rows) == 250
+        assert rows[0] == {
+            "api_number": "42000000000000",
+            "surface_lat": 31.0,
+            "frac_start": datetime(2020, 1, 1),
+        }
+
+    @pytest.mark.parametrize("workers", [1, 3])
+    def test_xlsx_parallel_matches_serial(self, content, workers):
+        serial = list(BytesFileHandler.xlsx(content, date_columns=["frac_start"]))
+        parallel = list(
+            BytesFileHandler.xlsx_parallel(
+                content, date_columns=["frac_start"], workers=workers, chunk_rows=16
+            )
+        )
+        assert parallel == serial
+
+    @pytest.mark.parametrize("workers", [1, 3])
+    def test_xlsx_parallel_start(self, content, workers):
+        rows = list(
+            BytesFileHandler.xlsx_parallel(
+                content, workers=workers, chunk_rows=16, start=200
+            )
+        )
+        assert len(rows) == 50
+        assert rows[0]["api_number"] == "42000000000200"
+
+    def test_xlsx_parallel_transforms_in_workers(self, content, transformer):
+        rows = list(
+            BytesFileHandler.xlsx_parallel(
+                content, transform=transformer.transform, workers=2, chunk_rows=100
+            )
+        )
+        assert [row["api14"] for row in rows] == [
+            f"4200000000{i:04}" for i in range(250)
+        ]
+        assert isinstance(rows[0], transformer.record_type)
+
+    def test_xlsx_parallel_raises_worker_errors(self, content):
+        with pytest.raises(KeyError):
+            list(
+                BytesFileHandler.xlsx_parallel(
+                    content, transform=itemgetter("missing"), workers=2
+                )
+            )
+
+
+class TestTransformerPickle:
+    def test_round_trip(self, transformer):
+        clone = pickle.loads(pickle.dumps(transformer))
+        assert clone.record_type is transformer.record_type
+        assert clone.aliases == transformer.aliases
+        row = {"api_number": "4200000000", "surface_lat": 31.5}
+        assert clone.transform(row) == transformer.transform(row)
+
+    def test_parser_is_loaded_lazily(self, transformer, mocker):
+        load = mocker.patch("collector.compiler.load")
+        mocker.patch.object(Transformer, "_default_parser", None)
+        clone = pickle.loads(pickle.dumps(transformer))
+        load.assert_not_called()
+        assert clone.parser is load.return_value.row_parser
+        assert Transformer(aliases={}).parser is clone.parser
+        load.assert_called_once()
@@ -0,0 +1,64 @@
+import pytest  # noqa
+
+from util import geohash
+
+
+class TestGeohash:
+    @pytest.mark.parametrize(
+        "lat,lon,precision,expected",
+        [
+            (57.64911, 10.40744, 11, "u4pruydqqvj"),
+            (31.9686, -99.9018, 5, "9v8vy"),
+            (-25.382708, -49.265506, 8, "6gkzwgjz"),
+        ],
+    )
+    def test_encode(self, lat, lon, precision, expected):
+        assert geohash.encode(lat, lon, precision) == expected
+
+    def test_encode_default_precision(self):
+        assert len(geohash.encode(31.9686, -99.9018)) == geohash.PRECISION
+
+    def test_prefix_is_coarser_cell(self):
+        full = geohash.encode(31.9686, -99.9018)
+        for precision in range(1, geohash.PRECISION):
+            assert geohash.encode(31.9686, -99.9018, precision) == full[:precision]
+
+    def test_decode_roundtrip(self):
+        lat, lon = geohash.decode(geohash.encode(31.9686, -99.9018))
+        assert lat == pytest.approx(31.9686, abs=1e-6)
+        assert lon == pytest.approx(-99.9018, abs=1e-6)
+
+    def test_bounds_contain_point(self):
+        min_lon, min_lat, max_lon, max_lat = geohash.bounds("9v8vy")
+        assert min_lon <= -99.9018 <= max_lon
+        assert min_lat <= 31.9686 <= max_lat
+
+    @pytest.mark.parametrize(
+        "value,expected", [("9v8vy", "9v8vz"), ("9vzz", "9w"), ("zz", None)]
+    )
+    def test_successor(self, value, expected):
+        assert geohash.successor(value) == expected
+
+    def test_cover_limits_cells(self):
+        bbox = (-102.5, 31.0, -101.5, 32.0)
+        cells = geohash.cover(bbox, max_cells=16)
+        assert 0 < len(cells) <= 16
+        assert len(set(len(c) for c in cells)) == 1
+
+    def test_ranges_contain_points_in_bbox(self):
+        bbox = (-102.5, 31.0, -101.5, 32.0)
+        ranges = geohash.ranges(bbox)
+        for lat in (31.0, 31.33, 31.999):
+            for lon in (-102.5, -102.0, -101.51):
+                h = geohash.encode(lat, lon)
+                assert any(lo <= h and (hi is None or h < hi) for lo, hi in ranges)
+
+    def test_ranges_exclude_distant_points(self):
+        ranges = geohash.ranges((-102.5, 31.0, -101.5, 32.0))
+        h = geohash.encode(40.0, -90.0)
+        assert not any(lo <= h and (hi is None or h < hi) for lo, hi in ranges)
+
+    def test_radius_ranges(self):
+        ranges = geohash.radius_ranges(31.5, -102.0, 5)
+        h = geohash.encode(31.55, -102.02)
+        assert any(lo <= h and (hi is None or h < hi) for lo, hi in ranges)
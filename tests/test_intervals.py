@@ -0,0 +1,139 @@
+import pytest  # noqa
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from analysis.intervals import IntervalIndex, ordinals, to_ordinal
+from analysis.snapshot import ScheduleSnapshot, SnapshotCache
+
+
+@pytest.fixture
+def intervals():
+    rs = np.random.RandomState(3)
+    starts = to_ordinal("2020-01-01") + rs.randint(0, 365, 2000)
+    ends = starts + rs.randint(0, 60, 2000)
+    starts[::50] = -1  # missing start dates
+    yield starts, ends
+
+
+@pytest.fixture
+def schedules():
+    rs = np.random.RandomState(5)
+    n = 200
+    start = pd.to_datetime("2020-01-01") + pd.to_timedelta(
+        rs.randint(0, 365, n), unit="D"
+    )
+    yield pd.DataFrame(
+        {
+            "api14": [f"42{i:012}" for i in range(n)],
+            "shllat": rs.uniform(31.0, 32.5, n),
+            "shllon": rs.uniform(-104.0, -101.5, n),
+            "bhllat": np.nan,
+            "bhllon": np.nan,
+            "frac_start_date": start,
+            "frac_end_date": start + pd.Timedelta(days=14),
+        }
+    )
+
+
+def brute_force(starts, ends, lo, hi):
+    valid = starts >= 0
+    return np.flatnonzero(valid & (starts <= hi) & (ends >= lo))
+
+
+class TestIntervalIndex:
+    @pytest.mark.parametrize(
+        "window",
+        [
+            ("2020-03-01", "2020-03-07"),
+            ("2019-01-01", "2019-12-31"),
+            ("2020-06-15", "2020-06-15"),
+            ("2019-06-01", "2021-06-01"),
+        ],
+    )
+    def test_overlapping_matches_brute_force(self, intervals, window):
+        starts, ends = intervals
+        index = IntervalIndex(starts, ends)
+        lo, hi = (to_ordinal(x) for x in window)
+        expected = brute_force(starts, ends, lo, hi)
+        assert np.array_equal(index.overlapping(*window), expected)
+
+    def test_open_window(self, intervals):
+        starts, ends = intervals
+        index = IntervalIndex(starts, ends)
+        lo = to_ordinal("2020-12-01")
+        expected = np.flatnonzero((starts >= 0) & (ends >= lo))
+        assert np.array_equal(index.overlapping(start="2020-12-01"), expected)
+        assert len(index.overlapping()) == (starts >= 0).sum()
+
+    def test_inverted_window(self, intervals):
+        index = IntervalIndex(*intervals)
+        assert not len(index.overlapping("2020-02-01", "2020-01-01"))
+
+    def test_active_on(self):
+        day = to_ordinal("2020-01-01")
+        index = IntervalIndex([day, day + 10, day + 20], [day + 5, day + 15, day + 25])
+        assert list(index.active_on("2020-01-11")) == [1]
+        assert list(index.active_on("2020-01-08")) == []
+
+    def test_missing_end_is_single_day(self):
+        index = IntervalIndex([to_ordinal("2020-01-01")], [-1])
+        assert list(index.overlapping("2020-01-01", "2020-01-01")) == [0]
+        assert not len(index.overlapping("2020-01-02"))
+
+    def test_mask(self, intervals):
+        index = IntervalIndex(*intervals)
+        mask = index.mask("2020-03-01", "2020-03-07")
+        assert len(mask) == len(intervals[0])
+        expected = index.overlapping("2020-03-01", "2020-03-07")
+        assert np.array_equal(np.flatnonzero(mask), expected)
+
+    def test_empty(self):
+        index = IntervalIndex([], [])
+        assert not len(index.overlapping("2020-01-01", "2020-12-31"))
+
+    def test_ordinals(self):
+        values = pd.Series([pd.Timestamp("2020-01-02"), pd.NaT])
+        assert list(ordinals(values)) == [date(2020, 1, 2).toordinal(), -1]
+
+
+class TestScheduleSnapshot:
+    def test_active(self, schedules):
+        snapshot = ScheduleSnapshot(schedules)
+        result = snapshot.active("2020-05-01", "2020-05-07")
+        assert len(result)
+        assert (result.frac_start_date <= "2020-05-07").all()
+        assert (result.frac_end_date >= "2020-05-01").all()
+
+    def test_active_near(self, schedules):
+        snapshot = ScheduleSnapshot(schedules)
+        wells = schedules.iloc[:5]
+        result = snapshot.active_near(
+            wells.shllat, wells.shllon, 1, start="2020-01-01", end="2020-12-31"
+        )
+        assert set(wells.api14) <= set(result.api14)
+
+
+class TestSnapshotCache:
+    def test_rebuilds_on_new_generation(self, schedules):
+        generation = iter([1, 1, 2])
+        loads = []
+
+        def load():
+            loads.append(1)
+            return schedules
+
+        cache = SnapshotCache(load=load, generation=lambda: next(generation))
+        first = cache.get()
+        assert cache.get() is first
+        assert cache.get() is not first
+        assert len(loads) == 2
+
+    def test_unknown_generation_keeps_snapshot(self, schedules):
+        generation = iter([1, None])
+        cache = SnapshotCache(
+            load=lambda: schedules, generation=lambda: next(generation)
+        )
+        first = cache.get()
+        assert cache.get() is first
@@ -0,0 +1,134 @@
+import os
+import tempfile
+
+import pytest  # noqa
+
+from api.mixins import LoadContext
+from collector import FracScheduleCollector
+from collector.journal import DownloadCache, IngestError, content_hash, open_ingest
+from util import UnsafePathError
+
+
+@pytest.fixture
+def cache(tmpdir):
+    yield DownloadCache(str(tmpdir))
+
+
+@pytest.fixture
+def ftp(mocker):
+    ftp = mocker.MagicMock()
+    ftp.latest_filename = "export.xlsx"
+    ftp.modified.return_value = "20200101120000"
+    ftp.get.return_value = {"status": "success", "content": b"new"}
+    yield ftp
+
+
+@pytest.fixture
+def journal(mocker):
+    yield mocker.patch("collector.journal.IngestJournal")
+
+
+class TestDownloadCache:
+    def test_round_trip(self, cache):
+        digest = cache.put(b"content")
+        assert digest == content_hash(b"content")
+        assert cache.get(digest) == b"content"
+        assert os.listdir(cache.path) == [digest]
+
+    def test_missing(self, cache):
+        assert cache.get(content_hash(b"content")) is None
+
+    def test_corrupt_copy_is_discarded(self, cache):
+        digest = cache.put(b"content")
+        with open(cache.filename(digest), "wb") as f:
+            f.write(b"cont")
+        assert cache.get(digest) is None
+        assert not os.path.exists(cache.filename(digest))
+
+    def test_discard(self, cache):
+        digest = cache.put(b"content")
+        cache.discard(digest)
+        cache.discard(digest)
+        assert cache.get(digest) is None
+
+    def test_private_directory(self, tmpdir):
+        cache = DownloadCache(str(tmpdir.join("fracx", "downloads")))
+        assert os.stat(cache.path).st_mode & 0o777 == 0o700
+
+    def test_refuses_shared_directory(self, tmpdir):
+        shared = tmpdir.mkdir("downloads")
+        shared.chmod(0o777)
+        with pytest.raises(UnsafePathError, match="writable"):
+            DownloadCache(str(shared))
+
+    def test_default_path_is_per_user(self, conf):
+        assert conf.COLLECTOR_DOWNLOAD_CACHE_PATH.endswith(
+            os.path.join("fracx", "downloads")
+        )
+        assert not conf.COLLECTOR_DOWNLOAD_CACHE_PATH.startswith(tempfile.gettempdir())
+
+
+class TestOpenIngest:
+    def test_resumes_from_cache(self, ftp, cache, journal):
+        entry = journal.resumable.return_value
+        entry.content_hash = cache.put(b"cached")
+
+        assert open_ingest(ftp, cache, 1000) == (entry, b"cached")
+        journal.resumable.assert_called_once_with("export.xlsx", "20200101120000")
+        ftp.get.assert_not_called()
+
+    def test_starts_over_without_cached_copy(self, ftp, cache, journal):
+        journal.resumable.return_value.content_hash = content_hash(b"gone")
+
+        entry, content = open_ingest(ftp, cache, 1000)
+        assert content == b"new"
+        assert entry is journal.start.return_value
+        journal.start.assert_called_once_with(
+            "export.xlsx",
+            content_hash(b"new"),
+            size=3,
+            batch_size=1000,
+            modified="20200101120000",
+        )
+        assert cache.get(content_hash(b"new")) == b"new"
+
+    def test_no_resume(self, ftp, cache, journal):
+        open_ingest(ftp, cache, 1000, resume=False)
+        journal.resumable.assert_not_called()
+        journal.start.assert_called_once()
+
+    def test_failed_download(self, ftp, cache, journal):
+        journal.resumable.return_value = None
+        ftp.get.return_value = {"status": "error", "content": b""}
+        with pytest.raises(IngestError):
+            open_ingest(ftp, cache, 1000)
+        journal.start.assert_not_called()
+
+
+class TestCollectorCheckpoint:
+    @pytest.fixture
+    def collector(self, endpoint, mocker):
+        collector = FracScheduleCollector(endpoint)
+        collector.journal = mocker.MagicMock()
+        mocker.patch.object(collector, "bump_generation")
+        yield collector
+
+    def test_records_progress_in_committed_transaction(self, collector, mocker):
+        session = mocker.MagicMock()
+        with LoadContext(session) as context:
+            collector.checkpoint(3000)
+            assert context.commits == 1
+        collector.journal.advance.assert_called_once_with(3000)
+        collector.bump_generation.assert_called_once()
+
+    def test_outside_load_context(self, collector):
+        collector.checkpoint(3000)
+        collector.journal.advance.assert_not_called()
+
+    def test_without_journal(self, collector, mocker):
+        collector.journal = None
+        session = mocker.MagicMock()
+        with LoadContext(session) as context:
+            collector.checkpoint(3000)
+            assert context.commits == 0
+        collector.bump_generation.assert_not_called()
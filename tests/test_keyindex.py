@@ -0,0 +1,106 @@
+from datetime import date, datetime
+
+import pytest  # noqa
+
+from api.models import FracSchedule
+from collector import FracScheduleCollector
+from collector.keyindex import KeyIndex
+
+
+def row(api14: str, start: datetime = datetime(2020, 1, 1), **kwargs):
+    return {
+        "api14": api14,
+        "frac_start_date": start,
+        "frac_end_date": datetime(2020, 2, 1),
+        **kwargs,
+    }
+
+
+@pytest.fixture
+def keys(mocker):
+    db = mocker.patch("api.mixins.db")
+    db.session.query.return_value.select_from.return_value.scalar.return_value = 1
+    mocker.patch.object(
+        FracSchedule,
+        "iter_pks",
+        return_value=iter([("42461405550000", date(2020, 1, 1), date(2020, 2, 1))]),
+    )
+    index = KeyIndex(FracSchedule)
+    index.build()
+    yield index
+
+
+class TestKeyIndex:
+    def test_key_normalizes_dates(self):
+        index = KeyIndex(FracSchedule)
+        assert index.key(row("42461405550000")) == (
+            "42461405550000",
+            date(2020, 1, 1),
+            date(2020, 2, 1),
+        )
+
+    def test_stale_until_built(self, keys):
+        assert KeyIndex(FracSchedule).stale
+        assert not keys.stale
+
+    def test_split(self, keys):
+        rows = [row("42461405550000"), row("42461405560000")]
+        new, existing = keys.split(rows)
+        assert new == [rows[1]]
+        assert existing == [rows[0]]
+
+    def test_add(self, keys):
+        keys.add([row("42461405560000")])
+        assert row("42461405560000") in keys
+        assert row("42461405560000", start=datetime(2020, 1, 2)) not in keys
+
+    def test_save_and_restore(self, keys, tmpdir):
+        keys.add([row("42461405560000")])
+        keys.save(5, path=str(tmpdir))
+        restored = KeyIndex(FracSchedule)
+        assert restored.restore(5, path=str(tmpdir))
+        assert row("42461405550000") in restored
+        assert row("42461405560000") in restored
+        assert restored.filter.count == keys.filter.count
+
+    def test_restore_other_generation(self, keys, tmpdir):
+        keys.save(5, path=str(tmpdir))
+        restored = KeyIndex(FracSchedule)
+        assert not restored.restore(6, path=str(tmpdir))
+        assert restored.stale
+
+    def test_restore_missing_or_corrupt(self, keys, tmpdir):
+        index = KeyIndex(FracSchedule)
+        assert not index.restore(1, path=str(tmpdir))
+        tmpdir.join("frac_schedules.bloom").write_binary(b"garbage")
+        assert not index.restore(1, path=str(tmpdir))
+        assert index.stale
+
+
+class TestCollectorRouting:
+    @pytest.fixture
+    def collector(self, endpoint, keys, mocker):
+        collector = FracScheduleCollector(endpoint)
+        collector.started_at = datetime.now()
+        collector.keys = keys
+        mocker.patch.object(collector, "bump_generation")
+        mocker.patch.object(collector, "write")
+        mocker.patch.object(FracSchedule, "insert_new", return_value=True)
+        yield collector
+
+    def test_new_rows_skip_upsert(self, collector):
+        rows = [row("42461405550000"), row("42461405560000")]
+        collector.persist(rows)
+        FracSchedule.insert_new.assert_called_once_with([rows[1]])
+        collector.write.assert_called_once_with([rows[0]], True, False)
+        assert rows[1] in collector.keys
+
+    def test_all_new(self, collector):
+        collector.persist([row("42461405560000")])
+        collector.write.assert_not_called()
+
+    def test_conflict_falls_back_to_upsert(self, collector):
+        FracSchedule.insert_new.return_value = False
+        rows = [row("42461405550000"), row("42461405560000")]
+        collector.persist(rows)
+        collector.write.assert_called_once_with(rows, True, False)
@@ -1,10 +1,15 @@
-from datetime import datetime
+from datetime import date, datetime
+import itertools
 import subprocess
 
 import pytest  # noqa
 
+import api.mixins
+from api.mixins import LoadContext, Operation
 from api.models import FracSchedule
+from sqlalchemy.dialects import mssql, postgresql
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.util import LRUCache
 
 
 @pytest.fixture
@@ -58,7 +63,7 @@ class TestModelMixins:
                 records, update_on_conflict=False, ignore_on_conflict=True
             )
 
-            pks = [x[0] for x in FracSchedule.pks]
+            pks = [x[0] for x in FracSchedule.iter_pks()]
             expected = [x["api14"] for x in records]
             assert pks == expected
 
@@ -68,7 +73,7 @@ class TestModelMixins:
         with app.app_context():
             FracSchedule.bulk_merge(records)
 
-            pks = [x[0] for x in FracSchedule.pks]
+            pks = [x[0] for x in FracSchedule.iter_pks()]
             expected = [x["api14"] for x in records]
             assert pks == expected
 
@@ -79,7 +84,7 @@ class TestModelMixins:
         with app.app_context():
             FracSchedule.persist_objects(objs)
 
-            pks = [x[0] for x in FracSchedule.pks]
+            pks = [x[0] for x in FracSchedule.iter_pks()]
             expected = [x["api14"] for x in records]
             assert pks == expected
 
@@ -122,3 +127,209 @@ class TestModelMixins:
                 "frac_end_date",
             ]
 
+
+class TestUpsertStatement:
+    columns = ("api14", "frac_end_date", "frac_start_date", "operator", "shllat")
+
+    def compile(self, stmt):
+        return str(stmt.compile(dialect=postgresql.dialect(), column_keys=self.columns))
+
+    def test_statement_is_cached(self):
+        stmt = FracSchedule.upsert_statement(self.columns)
+        assert FracSchedule.upsert_statement(self.columns) is stmt
+        assert FracSchedule.upsert_statement(self.columns[:-1]) is not stmt
+        assert (
+            FracSchedule.upsert_statement(self.columns, ignore_on_conflict=True)
+            is not stmt
+        )
+
+    def test_statement_cache_is_bounded(self, monkeypatch):
+        monkeypatch.setattr(api.mixins, "_statements", LRUCache(10))
+        for columns in itertools.combinations(self.columns, 3):
+            FracSchedule.upsert_statement(columns)
+            FracSchedule.upsert_statement(columns, ignore_on_conflict=True)
+        assert len(api.mixins._statements) <= 15
+
+    def test_updates_only_present_columns(self):
+        sql = self.compile(FracSchedule.upsert_statement(self.columns))
+        update = sql.split("DO UPDATE SET")[1]
+        assert "operator = excluded.operator" in update
+        assert "shllat = excluded.shllat" in update
+        assert "updated_at = excluded.updated_at" in update
+        assert "wellname" not in update
+        assert "created_at" not in update
+        assert "IS DISTINCT FROM" in update
+
+    def test_update_revives_removed_rows(self):
+        sql = self.compile(FracSchedule.upsert_statement(self.columns))
+        update = sql.split("DO UPDATE SET")[1]
+        assert "removed_at = NULL" in update
+        assert "frac_schedules.removed_at IS NOT NULL" in update
+
+    def test_located_at_moves_only_with_locations(self):
+        sql = self.compile(FracSchedule.upsert_statement(self.columns))
+        update = sql.split("DO UPDATE SET")[1]
+        assert (
+            "located_at = CASE WHEN ((frac_schedules.shllat) IS DISTINCT FROM"
+            " (excluded.shllat)) THEN now() ELSE frac_schedules.located_at END"
+        ) in update
+
+        columns = ("api14", "frac_end_date", "frac_start_date", "operator")
+        sql = self.compile(FracSchedule.upsert_statement(columns))
+        assert "located_at" not in sql.split("DO UPDATE SET")[1]
+
+    def test_ignore_on_conflict(self):
+        stmt = FracSchedule.upsert_statement(self.columns, ignore_on_conflict=True)
+        sql = self.compile(stmt)
+        assert "ON CONFLICT (api14, frac_start_date, frac_end_date)" in sql
+        assert sql.endswith("DO NOTHING")
+
+    def test_keys_only_revive_removed_rows(self):
+        columns = ("api14", "frac_end_date", "frac_start_date")
+        sql = self.compile(FracSchedule.upsert_statement(columns))
+        update = sql.split("DO UPDATE SET")[1]
+        assert update.startswith(" removed_at = NULL, updated_at")
+        assert update.endswith("WHERE frac_schedules.removed_at IS NOT NULL")
+
+    def test_group_by_columns(self):
+        rows = [{"a": 1, "b": 2}, {"b": 3, "a": 4}, {"a": 5}]
+        groups = FracSchedule.group_by_columns(rows)
+        assert groups == {
+            ("a", "b"): [{"a": 1, "b": 2}, {"b": 3, "a": 4}],
+            ("a",): [{"a": 5}],
+        }
+
+
+class TestPrimaryKeys:
+    keys = [
+        ("42461405550000", date(2020, 1, 1), date(2020, 2, 1)),
+        ("42461405560000", date(2020, 1, 5), date(2020, 2, 5)),
+        ("42461405570000", date(2020, 1, 9), date(2020, 2, 9)),
+    ]
+
+    @pytest.fixture
+    def conn(self, mocker):
+        db = mocker.patch("api.mixins.db")
+        conn = db.session.connection.return_value
+        conn.execute.return_value = iter([self.keys[0]])
+        yield conn
+
+    def test_row_key(self):
+        row = {
+            "frac_end_date": datetime(2020, 2, 1),
+            "api14": "42461405550000",
+            "frac_start_date": date(2020, 1, 1),
+            "operator": "a",
+        }
+        assert FracSchedule.row_key(row) == (
+            "42461405550000",
+            date(2020, 1, 1),
+            date(2020, 2, 1),
+        )
+
+    def test_exists_statement_postgres(self):
+        stmt = FracSchedule.exists_statement("postgresql")
+        sql = str(stmt.compile(dialect=postgresql.dialect()))
+        assert "unnest(%(api14)s::VARCHAR(14)[], %(frac_start_date)s::DATE[]" in sql
+        assert FracSchedule.exists_statement("postgresql") is stmt
+
+    def test_exists_statement_mssql(self):
+        stmt = FracSchedule.exists_statement("mssql", 2)
+        sql = str(stmt.compile(dialect=mssql.dialect()))
+        assert "frac_schedules.api14 = :key_1_0" in sql
+        assert " OR " in sql
+
+    def test_exists_many_postgres(self, conn):
+        conn.dialect.name = "postgresql"
+        found = FracSchedule.exists_many(iter(self.keys), batch_size=2)
+        assert found == {self.keys[0]}
+        assert conn.execute.call_count == 2
+        params = conn.execute.call_args_list[0][0][1]
+        assert params["api14"] == ["42461405550000", "42461405560000"]
+        assert params["frac_end_date"] == [date(2020, 2, 1), date(2020, 2, 5)]
+
+    def test_exists_many_fallback(self, conn):
+        conn.dialect.name = "sqlite"
+        FracSchedule.exists_many(self.keys)
+        params = conn.execute.call_args[0][1]
+        assert params["key_2_1"] == date(2020, 1, 9)
+        assert len(params) == 9
+
+
+class TestPostOpMetrics:
+    def test_batch_index_is_not_a_tag(self, mocker, caplog):
+        metrics = mocker.patch("api.mixins.metrics")
+        with caplog.at_level("INFO", logger="api.mixins"):
+            FracSchedule.post_op_metrics(Operation.INSERT, "core_insert", 10, 0.5, 7)
+        assert metrics.post.call_count == 3
+        for call in metrics.post.call_args_list:
+            assert call[1]["tags"] == {
+                "tablename": FracSchedule.__table__.name,
+                "method": "core_insert",
+            }
+        assert caplog.records[-1].batch == 7
+
+
+class TestLoadContext:
+    def test_commits_once(self, mocker):
+        session = mocker.MagicMock()
+        with LoadContext(session) as context:
+            for _ in range(3):
+                with context.savepoint():
+                    pass
+        assert session.commit.call_count == 1
+        assert session.begin_nested.call_count == 3
+        assert (context.commits, context.fsyncs, context.savepoints) == (1, 1, 3)
+
+    def test_checkpoint(self, mocker):
+        session = mocker.MagicMock()
+        with LoadContext(session) as context:
+            with context.savepoint():
+                pass
+            context.checkpoint()
+            context.checkpoint()
+        assert session.commit.call_count == 3
+        # only the commit that followed a write flushed the WAL
+        assert (context.commits, context.fsyncs) == (3, 1)
+
+    def test_failed_savepoint_is_isolated(self, mocker):
+        session = mocker.MagicMock()
+        with LoadContext(session) as context:
+            with pytest.raises(IntegrityError):
+                with context.savepoint():
+                    raise IntegrityError("insert", {}, Exception("duplicate"))
+            with context.savepoint():
+                pass
+        nested = session.begin_nested.return_value
+        assert nested.rollback.call_count == 1
+        assert nested.commit.call_count == 1
+        assert session.commit.call_count == 1
+        assert context.rollbacks == 1
+
+    def test_error_rolls_back_everything(self, mocker):
+        session = mocker.MagicMock()
+        with pytest.raises(ValueError):
+            with LoadContext(session) as context:
+                with context.savepoint():
+                    pass
+                raise ValueError("bad file")
+        assert session.rollback.called
+        assert not session.commit.called
+        assert LoadContext.current() is None
+
+    def test_no_writes_no_fsync(self, mocker):
+        with LoadContext(mocker.MagicMock()) as context:
+            pass
+        assert (context.commits, context.fsyncs) == (1, 0)
+
+    def test_contexts_do_not_nest(self, mocker):
+        with LoadContext(mocker.MagicMock()):
+            with pytest.raises(RuntimeError):
+                LoadContext(mocker.MagicMock()).__enter__()
+
+    def test_persist_defers_commit(self, mocker):
+        session = mocker.patch("api.mixins.db").session
+        with LoadContext(session):
+            FracSchedule.persist()
+        assert session.flush.call_count == 1
+        assert session.commit.call_count == 1  # by the context, on exit
@@ -0,0 +1,57 @@
+import pytest  # noqa
+from sqlalchemy.dialects import mssql, postgresql
+
+from api.models import FracSchedule, FracScheduleLatest
+
+
+class TestFracScheduleLatest:
+    def test_refresh_statement_postgres(self):
+        stmt = FracScheduleLatest.refresh_statement("postgresql")
+        sql = str(stmt.compile(dialect=postgresql.dialect()))
+        assert "on conflict (api10) do update" in sql
+        assert "group by api10" in sql
+
+    def test_refresh_statement_mssql(self):
+        stmt = FracScheduleLatest.refresh_statement("mssql")
+        sql = str(stmt.compile(dialect=mssql.dialect()))
+        assert "merge" in sql
+
+    def test_after_write_refreshes_batch_api10s(self, mocker):
+        refresh = mocker.patch.object(FracScheduleLatest, "refresh")
+        rows = [{"api10": "4246140555"}, {"api10": "4246140555"}, {"api10": None}]
+        FracSchedule.after_write("conn", rows)
+        refresh.assert_called_once_with("conn", {"4246140555"})
+
+    def test_after_write_empty_batch(self, mocker):
+        refresh = mocker.patch.object(FracScheduleLatest, "refresh")
+        FracSchedule.after_write("conn", [])
+        refresh.assert_not_called()
+
+
+class TestFracScheduleGeometries:
+    def test_geometry_statement(self):
+        stmt = FracSchedule.geometry_statement()
+        sql = str(stmt.compile(dialect=postgresql.dialect()))
+        assert "ST_MakePoint(shllon, shllat)" in sql
+        assert "ST_Transform(g.shl, 3857)" in sql
+        assert "updated_at = now()" in sql
+
+    def test_after_write_skips_geometries_off_postgres(self, app, mocker):
+        mocker.patch.object(FracScheduleLatest, "refresh")
+        update = mocker.patch.object(FracSchedule, "update_geometries")
+        with app.app_context():
+            dialect = FracSchedule.s.bind.dialect.name
+            FracSchedule.after_write("conn", [{"api14": "42461405550000"}])
+        assert update.called == (dialect == "postgresql")
+
+    def test_geometry_statement_for_table(self):
+        stmt = FracSchedule.geometry_statement(table="public.frac_schedules_shadow")
+        sql = str(stmt.compile(dialect=postgresql.dialect()))
+        assert "update public.frac_schedules_shadow t set" in sql
+        assert "updated_at = now()" not in sql
+
+    def test_after_swap_rebuilds_latest(self, mocker):
+        conn = mocker.MagicMock()
+        FracSchedule.after_swap(conn)
+        sql = str(conn.execute.call_args[0][0])
+        assert "delete from frac_schedules_latest_by_api10" in sql
@@ -0,0 +1,129 @@
+import pytest  # noqa
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from analysis.intervals import from_ordinals, ordinals
+from analysis.overlaps import PAIR_COLUMNS, attach_pairs, overlapping_pairs
+from analysis.proximity import haversine
+from analysis.sticks import Sticks, segment_distance
+
+
+def synthetic(n, seed=0):
+    rs = np.random.RandomState(seed)
+    shllat = rs.uniform(31.0, 32.0, n)
+    shllon = rs.uniform(-103.0, -102.0, n)
+    start = pd.to_datetime("2020-01-01") + pd.to_timedelta(
+        rs.randint(0, 365, n), unit="D"
+    )
+    return pd.DataFrame(
+        {
+            "api14": [f"42{i:012}" for i in range(n)],
+            "shllat": shllat,
+            "shllon": shllon,
+            "bhllat": shllat + rs.uniform(-0.02, 0.02, n),
+            "bhllon": shllon + rs.uniform(-0.02, 0.02, n),
+            "frac_start_date": start,
+            "frac_end_date": start
+            + pd.to_timedelta(rs.randint(0, 30, n), unit="D"),
+        }
+    )
+
+
+def brute_force(frame, max_distance, method):
+    n = len(frame)
+    a, b = np.triu_indices(n, k=1)
+    starts = ordinals(frame.frac_start_date)
+    ends = ordinals(frame.frac_end_date)
+    concurrent = (starts[a] <= ends[b]) & (starts[b] <= ends[a])
+    if method == "lateral":
+        s = Sticks(frame, frame.shllat.mean())
+        d = segment_distance(
+            *(v[a] for v in (s.x0, s.y0, s.x1, s.y1)),
+            *(v[b] for v in (s.x0, s.y0, s.x1, s.y1)),
+        )
+    else:
+        d = haversine(
+            frame.shllat.values[a],
+            frame.shllon.values[a],
+            frame.shllat.values[b],
+            frame.shllon.values[b],
+        )
+    keep = concurrent & (d <= max_distance)
+    return {tuple(sorted(p)) for p in zip(a[keep], b[keep])}
+
+
+class TestOverlappingPairs:
+    @pytest.mark.parametrize("method", ["shl", "lateral"])
+    @pytest.mark.parametrize("cell_miles", [None, 0.5, 3])
+    def test_matches_brute_force(self, method, cell_miles):
+        frame = synthetic(600)
+        result = overlapping_pairs(
+            frame, max_distance=1.5, method=method, cell_miles=cell_miles
+        )
+        pairs = {tuple(sorted(p)) for p in zip(result.a, result.b)}
+        assert len(pairs) == len(result)
+        assert pairs == brute_force(frame, 1.5, method)
+
+    def test_long_laterals_leave_the_grid(self, caplog):
+        frame = synthetic(600)
+        # a few sticks with a bad bottom hole location tens of miles away
+        frame.loc[[5, 50, 500], "bhllat"] += 1.0
+        result = overlapping_pairs(
+            frame, max_distance=1.5, method="lateral", max_lateral=3
+        )
+        pairs = {tuple(sorted(p)) for p in zip(result.a, result.b)}
+        assert pairs == brute_force(frame, 1.5, "lateral")
+        assert "3 laterals are longer than 3 miles" in caplog.text
+
+    def test_overlap_range(self):
+        frame = pd.DataFrame(
+            {
+                "shllat": [31.0, 31.001, 31.0],
+                "shllon": [-102.0, -102.0, -102.001],
+                "bhllat": np.nan,
+                "bhllon": np.nan,
+                "frac_start_date": pd.to_datetime(
+                    ["2020-01-01", "2020-01-10", "2020-02-01"]
+                ),
+                "frac_end_date": pd.to_datetime(
+                    ["2020-01-15", "2020-01-20", "2020-02-05"]
+                ),
+            }
+        )
+        result = overlapping_pairs(frame, max_distance=1)
+        assert list(result.columns) == PAIR_COLUMNS
+        assert len(result) == 1
+        row = result.iloc[0]
+        assert (row.a, row.b) == (0, 1)
+        assert row.overlap_start == date(2020, 1, 10)
+        assert row.overlap_end == date(2020, 1, 15)
+        assert row.overlap_days == 6
+
+    def test_same_day_boundary_overlaps(self):
+        frame = synthetic(2)
+        frame.loc[:, ["shllat", "shllon"]] = [[31.0, -102.0], [31.0, -102.0]]
+        frame.frac_start_date = pd.to_datetime(["2020-01-01", "2020-01-05"])
+        frame.frac_end_date = pd.to_datetime(["2020-01-05", "2020-01-06"])
+        assert len(overlapping_pairs(frame, max_distance=0.1)) == 1
+
+    def test_invalid_method(self):
+        with pytest.raises(ValueError):
+            overlapping_pairs(synthetic(5), method="bhl")
+
+    def test_empty(self):
+        assert overlapping_pairs(synthetic(5).iloc[:0]).empty
+
+    def test_attach_pairs(self):
+        frame = synthetic(300)
+        result = overlapping_pairs(frame, max_distance=2)
+        joined = attach_pairs(result, frame)
+        assert len(joined) == len(result)
+        assert {"a_api14", "b_api14", "distance", "overlap_days"} <= set(
+            joined.columns
+        )
+
+    def test_from_ordinals(self):
+        values = ordinals(pd.Series(pd.to_datetime(["2020-01-02", "1999-12-31"])))
+        assert list(from_ordinals(values)) == [date(2020, 1, 2), date(1999, 12, 31)]
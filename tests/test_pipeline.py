@@ -0,0 +1,166 @@
+import pytest  # noqa
+from contextlib import contextmanager
+import threading
+import time
+
+from collector.pipeline import Pipeline, PipelineError
+from config import get_active_config
+
+conf = get_active_config()
+
+
+class FakeCollector:
+    """ Stands in for FracScheduleCollector, with a fixed cost per batch """
+
+    def __init__(self, delay: float = 0.0, fail_on: str = None):
+        self.delay = delay
+        self.fail_on = fail_on
+        self.persisted = []
+        self.skipped = []
+        self.threads = set()
+        self.opened = 0
+        self.committed = 0
+        self.checkpoints = []
+
+    @contextmanager
+    def load_context(self):
+        self.opened += 1
+        yield self
+        self.committed += 1
+
+    def checkpoint(self, committed_rows):
+        self.checkpoints.append(committed_rows)
+
+    def transform(self, row):
+        if self.fail_on == "transform":
+            raise ValueError("bad row")
+        return {**row, "transformed": True}
+
+    def filter(self, row):
+        return row if row.get("shllat") else None
+
+    def skip(self, rows):
+        self.skipped.append(rows)
+
+    def persist(self, rows, update_on_conflict=True, ignore_on_conflict=False):
+        self.threads.add(threading.get_ident())
+        if self.fail_on == "load":
+            raise ValueError("write failed")
+        time.sleep(self.delay)
+        self.persisted.append(rows)
+
+
+def make_rows(n: int, delay: float = 0.0, fail_at: int = None):
+    for i in range(n):
+        if i == fail_at:
+            raise IOError("truncated file")
+        if delay and i % 10 == 0:
+            time.sleep(delay)  # one slow read per batch of 10
+        yield {"id": i, "shllat": 31.0 if i % 5 else None}
+
+
+class TestPipeline:
+    def test_loads_filtered_batches_in_order(self):
+        collector = FakeCollector()
+        stats = Pipeline(collector, batch_size=10, queue_size=2).run(make_rows(100))
+
+        ids = [row["id"] for batch in collector.persisted for row in batch]
+        assert ids == [i for i in range(100) if i % 5]
+        assert all(row["transformed"] for b in collector.persisted for row in b)
+        assert stats["extract"].rows == 100
+        assert stats["transform"].rows == 80
+        assert stats["load"].rows == 80
+        assert stats["load"].batches == 10
+
+    def test_loads_in_one_unit_of_work(self):
+        collector = FakeCollector()
+        pipeline = Pipeline(collector, batch_size=10)
+        pipeline.run(make_rows(100))
+        assert pipeline.context is collector
+        assert (collector.opened, collector.committed) == (1, 1)
+
+    def test_failed_load_is_not_committed(self):
+        collector = FakeCollector(fail_on="transform")
+        with pytest.raises(PipelineError):
+            Pipeline(collector, batch_size=10).run(make_rows(100))
+        assert (collector.opened, collector.committed) == (1, 0)
+
+    def test_loads_on_calling_thread(self):
+        collector = FakeCollector()
+        Pipeline(collector, batch_size=10).run(make_rows(30))
+        assert collector.threads == {threading.get_ident()}
+
+    def test_checkpoints(self):
+        collector = FakeCollector()
+        pipeline = Pipeline(collector, batch_size=10, checkpoint=3, offset=500)
+        pipeline.run(make_rows(100))
+        assert collector.checkpoints == [530, 560, 590]
+
+    def test_checkpoints_disabled(self):
+        collector = FakeCollector()
+        Pipeline(collector, batch_size=10, checkpoint=0).run(make_rows(100))
+        assert collector.checkpoints == []
+
+    def test_checkpoints_only_with_journal(self, mocker):
+        collector = FakeCollector()
+        assert Pipeline(collector).checkpoint == 0
+        collector.journal = mocker.MagicMock()
+        assert Pipeline(collector).checkpoint == conf.COLLECTOR_CHECKPOINT_BATCHES
+
+    def test_dedupe_after_filter(self):
+        collector = FakeCollector()
+        seen = []
+
+        def dedupe(batch):
+            seen.append(len(batch))
+            return batch[:1]
+
+        Pipeline(collector, batch_size=10, dedupe=dedupe).run(make_rows(20))
+        assert seen == [8, 8]
+        assert [row["id"] for b in collector.persisted for row in b] == [1, 11]
+
+    def test_filtered_rows_are_skipped(self):
+        collector = FakeCollector()
+
+        def dedupe(batch):
+            return batch[:1]
+
+        Pipeline(collector, batch_size=10, dedupe=dedupe).run(make_rows(20))
+        # dropped by the filter, not by dedupe
+        skipped = [[row["id"] for row in b] for b in collector.skipped]
+        assert skipped == [[0, 5], [10, 15]]
+
+    def test_stages_overlap(self):
+        collector = FakeCollector(delay=0.05)
+        pipeline = Pipeline(collector, batch_size=10, queue_size=2)
+        stats = pipeline.run(make_rows(100, delay=0.05))
+
+        total = sum(s.busy for s in stats.values())
+        assert total >= 0.9
+        # reading and writing each take ~0.5s; run sequentially that is ~1s
+        assert pipeline.elapsed < total * 0.8
+
+    def test_empty_input(self):
+        collector = FakeCollector()
+        stats = Pipeline(collector).run(iter([]))
+        assert collector.persisted == []
+        assert stats["load"].batches == 0
+
+    @pytest.mark.parametrize(
+        "fail_on,fail_at,stage",
+        [(None, 25, "extract"), ("transform", None, "transform")],
+    )
+    def test_upstream_failure_is_raised(self, fail_on, fail_at, stage):
+        collector = FakeCollector(fail_on=fail_on)
+        pipeline = Pipeline(collector, batch_size=10)
+        with pytest.raises(PipelineError, match=stage):
+            pipeline.run(make_rows(100, fail_at=fail_at))
+        assert not any(t.name.startswith("fracx-") for t in threading.enumerate())
+
+    def test_load_failure_stops_workers(self):
+        collector = FakeCollector(fail_on="load")
+        pipeline = Pipeline(collector, batch_size=1, queue_size=1)
+        with pytest.raises(ValueError, match="write failed"):
+            pipeline.run(make_rows(1000))
+        assert not any(t.name.startswith("fracx-") for t in threading.enumerate())
+        assert pipeline.stats["extract"].rows < 1000
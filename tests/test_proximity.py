@@ -0,0 +1,117 @@
+import pytest  # noqa
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from analysis.proximity import ProximityIndex, attach_queries, haversine, query_points
+
+
+@pytest.fixture
+def schedules():
+    rs = np.random.RandomState(42)
+    n = 500
+    shllat = rs.uniform(31.0, 32.5, n)
+    shllon = rs.uniform(-104.0, -101.5, n)
+    frame = pd.DataFrame(
+        {
+            "api14": [f"42{i:012}" for i in range(n)],
+            "shllat": shllat,
+            "shllon": shllon,
+            "bhllat": shllat + rs.uniform(-0.03, 0.03, n),
+            "bhllon": shllon + rs.uniform(-0.03, 0.03, n),
+            "frac_start_date": pd.to_datetime("2020-01-01")
+            + pd.to_timedelta(rs.randint(0, 365, n), unit="D"),
+        }
+    )
+    frame["frac_end_date"] = frame.frac_start_date + pd.Timedelta(days=20)
+    frame.loc[::7, ["bhllat", "bhllon"]] = np.nan
+    yield frame
+
+
+@pytest.fixture
+def wells():
+    rs = np.random.RandomState(7)
+    yield pd.DataFrame(
+        {"lat": rs.uniform(31.0, 32.5, 50), "lon": rs.uniform(-104.0, -101.5, 50)}
+    )
+
+
+def brute_force(schedules, lat, lon):
+    shl = haversine(lat, lon, schedules.shllat.values, schedules.shllon.values)
+    bhl = haversine(lat, lon, schedules.bhllat.values, schedules.bhllon.values)
+    return np.fmin(shl, bhl)
+
+
+class TestProximityIndex:
+    def test_repr(self, schedules):
+        assert "500 schedules" in repr(ProximityIndex(schedules))
+
+    def test_haversine(self):
+        # one degree of latitude
+        assert haversine(31.0, -102.0, 32.0, -102.0) == pytest.approx(69.09, 0.01)
+
+    @pytest.mark.parametrize("cell_miles", [0.5, 1, 10])
+    def test_within_matches_brute_force(self, schedules, wells, cell_miles):
+        index = ProximityIndex(schedules, cell_miles=cell_miles)
+        result = index.within(wells.lat, wells.lon, radius=5)
+
+        for i, well in wells.iterrows():
+            dist = brute_force(schedules, well.lat, well.lon)
+            expected = set(schedules.api14[dist <= 5])
+            assert set(result.api14[result["query"] == i]) == expected
+
+    def test_within_reports_nearest_location(self, schedules, wells):
+        result = ProximityIndex(schedules).within(wells.lat, wells.lon, radius=5)
+        row = result.iloc[0]
+        well = wells.iloc[row["query"]]
+        dist = brute_force(schedules, well.lat, well.lon)
+        assert row.distance == pytest.approx(dist[schedules.api14 == row.api14][0])
+        assert not result.duplicated(["query", "api14"]).any()
+
+    def test_within_date_window(self, schedules, wells):
+        start, end = date(2020, 3, 1), date(2020, 3, 31)
+        result = ProximityIndex(schedules).within(
+            wells.lat, wells.lon, radius=10, start=start, end=end
+        )
+        assert len(result)
+        assert (result.frac_end_date >= pd.Timestamp(start)).all()
+        assert (result.frac_start_date <= pd.Timestamp(end)).all()
+
+    def test_nearest(self, schedules, wells):
+        result = ProximityIndex(schedules).nearest(wells.lat, wells.lon, k=3)
+        assert (result.groupby("query").size() == 3).all()
+
+        for i, well in wells.iterrows():
+            dist = np.sort(brute_force(schedules, well.lat, well.lon))[:3]
+            got = result.distance[result["query"] == i].values
+            assert got == pytest.approx(dist)
+
+    def test_nearest_grows_radius_in_steps(self, schedules, mocker):
+        index = ProximityIndex(schedules, cell_miles=1)
+        matches = mocker.spy(index, "_matches")
+        index.nearest([40.0], [-90.0], k=1, max_radius=3.5)
+        assert [c[0][2] for c in matches.call_args_list] == [1, 2, 3, 3.5]
+
+    def test_nearest_max_radius(self, schedules):
+        result = ProximityIndex(schedules).nearest([40.0], [-90.0], k=1, max_radius=5)
+        assert result.empty
+
+    def test_empty_index(self, schedules, wells):
+        index = ProximityIndex(schedules.iloc[:0])
+        assert index.within(wells.lat, wells.lon, radius=5).empty
+
+    def test_query_points(self, wells):
+        renamed = wells.rename(columns={"lat": "Latitude", "lon": "Longitude"})
+        lats, lons = query_points(renamed)
+        assert len(lats) == len(lons) == len(wells)
+
+    def test_query_points_missing_columns(self):
+        with pytest.raises(KeyError):
+            query_points(pd.DataFrame({"x": [1], "y": [2]}))
+
+    def test_attach_queries(self, schedules, wells):
+        result = ProximityIndex(schedules).within(wells.lat, wells.lon, radius=5)
+        joined = attach_queries(result, wells)
+        assert len(joined) == len(result)
+        assert {"well_lat", "well_lon", "api14", "distance"} <= set(joined.columns)
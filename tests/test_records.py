@@ -0,0 +1,125 @@
+import pickle
+
+import pytest  # noqa
+
+from api.models import FracSchedule
+from api.records import Record, as_dicts, make_record_type, record_type_for
+from collector.transformer import Transformer
+
+
+@pytest.fixture
+def Example():
+    yield make_record_type("ExampleRecord", ("a", "b", "c"))
+
+
+@pytest.fixture
+def transformer():
+    aliases = {"well_api": "api14", "surface_lat": "shllat", "comments": "operator"}
+    yield Transformer(
+        aliases=aliases,
+        exclude=["region"],
+        record_type=record_type_for(FracSchedule),
+    )
+
+
+class TestRecord:
+    def test_record_type_is_cached(self, Example):
+        assert make_record_type("ExampleRecord", ("a", "b", "c")) is Example
+
+    def test_record_has_no_dict(self, Example):
+        assert not hasattr(Example(a=1), "__dict__")
+
+    def test_unset_fields_are_omitted(self, Example):
+        record = Example(a=1, c=None)
+        assert dict(record) == {"a": 1, "c": None}
+        assert "b" not in record
+        assert record.get("b") is None
+
+    def test_unknown_field(self, Example):
+        with pytest.raises(KeyError):
+            Example(z=1)
+
+    def test_method_names_are_not_fields(self, Example):
+        with pytest.raises(KeyError):
+            Example()["to_dict"]
+
+    def test_pickle_roundtrip(self, Example):
+        record = Example(a=1, c="x")
+        restored = pickle.loads(pickle.dumps(record))
+        assert type(restored) is Example
+        assert restored == record
+        assert "b" not in restored
+
+    def test_as_dicts(self, Example):
+        assert as_dicts([Example(a=1), {"b": 2}]) == [{"a": 1}, {"b": 2}]
+
+    def test_record_type_for_model(self):
+        FracScheduleRecord = record_type_for(FracSchedule)
+        assert issubclass(FracScheduleRecord, Record)
+        assert "api14" in FracScheduleRecord._fields
+
+
+class TestTransformerRecords:
+    def test_transform_to_record(self, transformer):
+        row = {
+            "region": "PMI",
+            "well_api": "4246140555",
+            "surface_lat": "32.1",
+            "comments": "",
+            "unknown": "value",
+        }
+        result = transformer.transform(row)
+        assert isinstance(result, Record)
+        assert result.to_dict() == {
+            "api14": "42461405550000",
+            "api10": "4246140555",
+            "operator": None,
+            "shllat": "32.1",
+            "shl_geohash": None,
+            "bhl_geohash": None,
+        }
+
+    def test_transform_accepts_record(self, transformer):
+        source = make_record_type("Raw", ("well_api", "region"))(
+            well_api="42461405550000", region="PMI"
+        )
+        result = transformer.transform(source)
+        assert dict(result) == {
+            "api14": "42461405550000",
+            "api10": "4246140555",
+            "shl_geohash": None,
+            "bhl_geohash": None,
+        }
+
+    def test_transform_to_dict(self):
+        tf = Transformer(aliases={"a": "x", "b": "y"}, exclude=["b"])
+        assert tf.transform({"a": "", "b": 1, "c": 2}) == {
+            "x": None,
+            "shl_geohash": None,
+            "bhl_geohash": None,
+        }
+
+    def test_transform_adds_geohashes(self, transformer):
+        transformer.aliases = {
+            "surface_lat": "shllat",
+            "surface_long": "shllon",
+            "bottomhole_lat": "bhllat",
+            "bottomhole_long": "bhllon",
+        }
+        row = {
+            "surface_lat": 31.9686,
+            "surface_long": -99.9018,
+            "bottomhole_lat": "",
+            "bottomhole_long": "",
+        }
+        result = transformer.transform(row)
+        assert result["shl_geohash"].startswith("9v8vy")
+        assert len(result["shl_geohash"]) == 12
+        assert result["bhl_geohash"] is None
+
+    def test_transform_adds_geohashes_to_dict(self):
+        tf = Transformer(aliases={"surface_lat": "shllat", "surface_long": "shllon"})
+        result = tf.transform({"surface_lat": 31.9686, "surface_long": -99.9018})
+        assert isinstance(result, dict)
+        assert result["shl_geohash"].startswith("9v8vy")
+        assert result["bhl_geohash"] is None
@@ -0,0 +1,161 @@
+import pytest  # noqa
+
+import numpy as np
+import pandas as pd
+
+from analysis.sticks import (
+    StickIndex,
+    Sticks,
+    attach_pairs,
+    lateral_distances,
+    overlap_ratio,
+    point_segment_distance,
+    segment_distance,
+)
+
+
+def random_sticks(seed, n):
+    rs = np.random.RandomState(seed)
+    shllat = rs.uniform(31.0, 32.0, n)
+    shllon = rs.uniform(-103.0, -102.0, n)
+    bearing = rs.uniform(0, 2 * np.pi, n)
+    length = rs.uniform(0.5, 2.5, n) / 69.0
+    frame = pd.DataFrame(
+        {
+            "api14": [f"42{seed:02}{i:010}" for i in range(n)],
+            "shllat": shllat,
+            "shllon": shllon,
+            "bhllat": shllat + length * np.cos(bearing),
+            "bhllon": shllon + length * np.sin(bearing),
+        }
+    )
+    frame.loc[::11, ["bhllat", "bhllon"]] = np.nan
+    return frame
+
+
+class TestSegmentDistance:
+    def test_point_segment(self):
+        d = point_segment_distance(
+            np.array([0.0, 2.0, 0.5]),
+            np.array([1.0, 0.0, 0.0]),
+            0.0,
+            0.0,
+            1.0,
+            0.0,
+        )
+        assert d == pytest.approx([1.0, 1.0, 0.0])
+
+    def test_degenerate_segment(self):
+        assert point_segment_distance(3.0, 4.0, 0.0, 0.0, 0.0, 0.0) == 5.0
+
+    @pytest.mark.parametrize(
+        "segments,expected",
+        [
+            ((0, 0, 2, 2, 0, 2, 2, 0), 0.0),  # crossing
+            ((0, 0, 1, 0, 0, 1, 1, 1), 1.0),  # parallel
+            ((0, 0, 1, 0, 2, 0, 3, 0), 1.0),  # collinear, apart
+            ((0, 0, 2, 0, 1, 0, 3, 0), 0.0),  # collinear, overlapping
+            ((0, 0, 1, 0, 1, 1, 1, 2), 1.0),  # T, not touching
+            ((0, 0, 1, 0, 3, 4, 3, 4), np.hypot(2, 4)),  # degenerate second
+        ],
+    )
+    def test_segment_distance(self, segments, expected):
+        args = [np.array([float(v)]) for v in segments]
+        assert segment_distance(*args)[0] == pytest.approx(expected)
+
+    def test_overlap_ratio(self):
+        # CD covers the second half of AB, then runs past its end
+        assert overlap_ratio(0, 0, 2, 0, 1, 1, 3, 1) == pytest.approx(0.5)
+        # perpendicular CD projects to a point
+        assert overlap_ratio(0, 0, 2, 0, 1, 1, 1, 2) == pytest.approx(0.0)
+        assert overlap_ratio(0, 0, 0, 0, 1, 1, 3, 1) == 0.0
+
+
+def brute_force(schedules, wellbores, max_distance):
+    lat0 = np.concatenate([schedules.shllat, wellbores.shllat]).mean()
+    s = Sticks(schedules, lat0)
+    w = Sticks(wellbores, lat0)
+    qi, ti = np.meshgrid(np.arange(len(s)), np.arange(len(w)), indexing="ij")
+    qi, ti = qi.ravel(), ti.ravel()
+    d = segment_distance(
+        *(a[qi] for a in (s.x0, s.y0, s.x1, s.y1)),
+        *(a[ti] for a in (w.x0, w.y0, w.x1, w.y1)),
+    )
+    return set(zip(qi[d <= max_distance], ti[d <= max_distance]))
+
+
+class TestLateralDistances:
+    @pytest.mark.parametrize("cell_miles", [0.25, 1, 5])
+    def test_matches_brute_force(self, cell_miles):
+        schedules = random_sticks(1, 300)
+        wellbores = random_sticks(2, 200)
+        result = lateral_distances(
+            schedules, wellbores, max_distance=0.5, cell_miles=cell_miles
+        )
+
+        expected = brute_force(schedules, wellbores, 0.5)
+        assert set(zip(result.schedule, result.wellbore)) == expected
+
+    def test_placeholder_bottom_hole_locations(self, caplog):
+        schedules = random_sticks(1, 300)
+        wellbores = random_sticks(2, 200)
+        # a placeholder BHL of (0, 0) makes a stick thousands of miles long
+        schedules.loc[[3, 150], ["bhllat", "bhllon"]] = 0.0
+        wellbores.loc[[5], ["bhllat", "bhllon"]] = 0.0
+        result = lateral_distances(schedules, wellbores, max_distance=0.5)
+
+        expected = brute_force(schedules, wellbores, 0.5)
+        assert set(zip(result.schedule, result.wellbore)) == expected
+        assert "1 laterals are longer than" in caplog.text
+        assert "2 laterals are longer than" in caplog.text
+
+        index = StickIndex(Sticks(wellbores, 31.5), cell_miles=1)
+        assert list(index.outliers) == [5]
+        assert len(index.keys) < 10 * len(wellbores)
+
+    def test_prunes_candidates(self):
+        schedules = random_sticks(1, 300)
+        wellbores = random_sticks(2, 200)
+        lat0 = 31.5
+        index = StickIndex(Sticks(wellbores, lat0), cell_miles=1)
+        qidx, _ = index.candidates(Sticks(schedules, lat0), 0.5)
+        assert len(qidx) < len(schedules) * len(wellbores) / 10
+
+    def test_overlap_in_range(self):
+        result = lateral_distances(random_sticks(1, 300), random_sticks(2, 200))
+        assert ((result.overlap >= 0) & (result.overlap <= 1)).all()
+
+    def test_parallel_laterals(self):
+        schedules = pd.DataFrame(
+            {
+                "shllat": [31.0],
+                "shllon": [-102.0],
+                "bhllat": [31.02],
+                "bhllon": [-102.0],
+            }
+        )
+        # a quarter mile east, offset halfway up the scheduled lateral
+        east = 0.25 / (69.09 * np.cos(np.radians(31.0)))
+        wellbores = pd.DataFrame(
+            {
+                "shllat": [31.01],
+                "shllon": [-102.0 + east],
+                "bhllat": [31.03],
+                "bhllon": [-102.0 + east],
+            }
+        )
+        result = lateral_distances(schedules, wellbores, max_distance=1)
+        assert result.distance[0] == pytest.approx(0.25, rel=0.01)
+        assert result.overlap[0] == pytest.approx(0.5, rel=0.01)
+
+    def test_attach_pairs(self):
+        schedules, wellbores = random_sticks(1, 100), random_sticks(2, 100)
+        result = lateral_distances(schedules, wellbores)
+        joined = attach_pairs(result, schedules, wellbores)
+        assert len(joined) == len(result)
+        assert {"api14", "well_api14", "distance", "overlap"} <= set(joined.columns)
+
+    def test_empty(self):
+        frame = random_sticks(1, 10).iloc[:0]
+        assert lateral_distances(frame, random_sticks(2, 10)).empty
+        assert lateral_distances(random_sticks(2, 10), frame).empty
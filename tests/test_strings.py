@@ -41,3 +41,42 @@ class TestStringProcessor:
     def test_normalize_to_uppercase(self):
         sp = StringProcessor(toupper=True)
         assert sp.normalize("test 123") == "TEST_123"
+
+    def test_normalize_matches_stepwise_operations(self, sp):
+        values = [
+            f"test 123 {SPECIAL_CHARS}",
+            f"  {SPECIAL_CHARS}Well   API #  ",
+            "Frac Start Date",
+            "surface_long",
+            "tab\tand\nnewline",
+            "",
+            123,
+            1.5,
+        ]
+        for value in values:
+            s = sp.alphanum_only(str(value))
+            s = str.strip(sp.dedupe_whitespace(s))
+            assert sp.normalize(value) == sp.fill_whitespace(s).lower()
+            assert sp.normalize(value, int_compatable=True) == sp.remove_whitespace(s)
+
+    def test_normalize_none(self, sp):
+        assert sp.normalize(None) is None
+        assert sp.cached_normalize(None) is None
+
+    def test_cached_normalize(self, sp):
+        assert sp.cached_normalize(f"test 123 {SPECIAL_CHARS}") == "test_123"
+        assert sp.cached_normalize(f"test 123 {SPECIAL_CHARS}") == "test_123"
+        assert sp._cached.cache_info().hits == 1
+
+    def test_cached_normalize_distinguishes_types(self, sp):
+        assert sp.cached_normalize(1) == "1"
+        assert sp.cached_normalize(True) == "true"
+
+    def test_cached_normalize_unhashable(self, sp):
+        assert sp.cached_normalize(["a", "b"]) == "a_b"
+
+    def test_change_replacement(self):
+        sp = StringProcessor(replacement="-")
+        assert sp.normalize("test 123") == "test-123"
+        sp.replacement = ""
+        assert sp.normalize("test 123") == "test123"
@@ -0,0 +1,96 @@
+import pytest  # noqa
+from sqlalchemy.dialects import postgresql
+
+from api.models import FracSchedule
+from api.swap import TableSwap, TableSwapError
+from collector import FracScheduleCollector
+
+
+@pytest.fixture
+def swap():
+    yield TableSwap(FracSchedule, schema="public")
+
+
+class TestTableSwap:
+    def test_shadow_table(self, swap):
+        assert swap.table.name == "frac_schedules_shadow"
+        assert swap.table.columns.keys() == FracSchedule.__table__.columns.keys()
+        assert TableSwap(FracSchedule).table is swap.table
+
+    def test_shadow_index(self, swap):
+        definition = (
+            "CREATE UNIQUE INDEX frac_schedules_id_index"
+            " ON public.frac_schedules USING btree (id)"
+        )
+        assert swap.shadow_index("frac_schedules_id_index", definition) == (
+            "CREATE UNIQUE INDEX frac_schedules_id_index_shadow"
+            " ON public.frac_schedules_shadow USING btree (id)"
+        )
+
+    def test_shadow_index_unrecognized(self, swap):
+        with pytest.raises(TableSwapError):
+            swap.shadow_index("other_index", "CREATE INDEX other_index ON x (id)")
+
+    def test_swap_statements(self, swap):
+        swap.indexes = [("frac_schedules_api10_index", "...")]
+        views = [("frac_schedules_most_recent_by_api10", " SELECT 1;")]
+        statements = swap.swap_statements("public.frac_schedules_id_seq", views)
+
+        assert statements[0].startswith("lock table public.frac_schedules")
+        renames = [
+            "alter table public.frac_schedules rename to frac_schedules_retired",
+            "alter table public.frac_schedules_shadow rename to frac_schedules",
+            "alter index public.frac_schedules_api10_index"
+            " rename to frac_schedules_api10_index_retired",
+            "alter index public.frac_schedules_api10_index_shadow"
+            " rename to frac_schedules_api10_index",
+        ]
+        positions = [statements.index(sql) for sql in renames]
+        assert positions == sorted(positions)
+        assert (
+            "alter sequence public.frac_schedules_id_seq"
+            " owned by public.frac_schedules.id"
+        ) in statements
+        assert (
+            "create or replace view frac_schedules_most_recent_by_api10 as  SELECT 1;"
+        ) in statements
+        assert statements[-1] == "drop table public.frac_schedules_retired"
+
+    def test_carry_over_statement(self, swap):
+        sql = str(swap.carry_over_statement().compile(dialect=postgresql.dialect()))
+        assert "id = l.id" in sql
+        assert "created_at = l.created_at" in sql
+        assert "s.frac_start_date = l.frac_start_date" in sql
+        assert "s.operator" in sql and "l.shllat" in sql
+        assert "s.updated_at," not in sql
+        assert "s.located_at," not in sql
+        assert (
+            "when (s.shllat, s.shllon, s.bhllat, s.bhllon) is not distinct from"
+            " (l.shllat, l.shllon, l.bhllat, l.bhllon)\n"
+            "                    then l.located_at"
+        ) in sql
+
+    def test_escape_catalog_sql(self, swap):
+        assert swap._escape("(status)::text") == "(status)\\:\\:text"
+
+    def test_requires_load_context(self, swap):
+        with pytest.raises(TableSwapError):
+            swap.load([{"api14": "42461405550000"}])
+
+    def test_upsert_statement_targets_shadow(self, swap):
+        columns = ("api14", "frac_end_date", "frac_start_date", "operator")
+        stmt = FracSchedule.upsert_statement(columns, table=swap.table)
+        sql = str(stmt.compile(dialect=postgresql.dialect(), column_keys=columns))
+        assert sql.startswith("INSERT INTO frac_schedules_shadow ")
+        assert stmt is not FracSchedule.upsert_statement(columns)
+
+
+class TestCollectorMode:
+    def test_invalid_mode(self, endpoint):
+        with pytest.raises(ValueError):
+            FracScheduleCollector(endpoint, mode="replace")
+
+    def test_swap_mode(self, endpoint):
+        collector = FracScheduleCollector(endpoint, mode="swap")
+        assert collector.mode == "swap"
+        assert collector.swap is None
@@ -0,0 +1,87 @@
+from datetime import date
+
+import pytest  # noqa
+from sqlalchemy.dialects import mssql, postgresql
+from sqlalchemy.schema import CreateTable
+
+from api.models import FracSchedule
+from api.tombstones import TombstoneError, Tombstones
+from collector import FracScheduleCollector
+
+
+@pytest.fixture
+def tombstones():
+    yield Tombstones(FracSchedule, max_ratio=0.5)
+
+
+class TestTombstones:
+    def test_staging_table_postgres(self, tombstones):
+        table = tombstones.staging_table("postgresql")
+        sql = str(CreateTable(table).compile(dialect=postgresql.dialect()))
+        assert sql.strip().startswith("CREATE TEMPORARY TABLE")
+        assert table.columns.keys() == [
+            "api14",
+            "frac_start_date",
+            "frac_end_date",
+        ]
+
+    def test_staging_table_mssql(self, tombstones):
+        table = tombstones.staging_table("mssql")
+        sql = str(CreateTable(table).compile(dialect=mssql.dialect()))
+        assert "TEMPORARY" not in sql
+        assert table.name.startswith("#")
+
+    @pytest.mark.parametrize("dialect", ["postgresql", "mssql"])
+    def test_durable_staging_table(self, dialect):
+        table = Tombstones(FracSchedule, durable=True).staging_table(dialect)
+        assert table.name == "frac_schedules_snapshot_keys"
+        assert not table._prefixes
+
+    def test_durable_staging_table_per_load(self):
+        first = Tombstones(FracSchedule, durable=True, suffix=7).staging_table(
+            "postgresql"
+        )
+        second = Tombstones(FracSchedule, durable=True, suffix=8).staging_table(
+            "postgresql"
+        )
+        assert first.name == "frac_schedules_snapshot_keys_7"
+        assert second.name == "frac_schedules_snapshot_keys_8"
+
+    def test_missing_is_an_anti_join(self, tombstones):
+        tombstones.staging = tombstones.staging_table("postgresql")
+        stmt = FracSchedule.__table__.update().where(tombstones.missing())
+        sql = str(stmt.compile(dialect=postgresql.dialect()))
+        assert "frac_schedules.removed_at IS NULL" in sql
+        assert "NOT (EXISTS (SELECT *" in sql
+        assert "frac_schedules_snapshot_keys.api14 = frac_schedules.api14" in sql
+
+    def test_requires_load_context(self, tombstones):
+        with pytest.raises(TombstoneError):
+            tombstones.begin()
+
+    def test_add_before_begin(self, tombstones):
+        with pytest.raises(TombstoneError):
+            tombstones.add([{"api14": "42461405550000"}])
+
+
+class TestCollectorSkip:
+    def test_filtered_rows_stay_in_snapshot(self, endpoint, tombstones, mocker):
+        collector = FracScheduleCollector(endpoint)
+        collector.tombstones = tombstones
+        add = mocker.patch.object(tombstones, "add")
+        key = {
+            "api14": "42461405550000",
+            "frac_start_date": date(2020, 1, 1),
+            "frac_end_date": date(2020, 1, 31),
+        }
+        rows = [
+            {**key, "shllat": None, "shllon": None},
+            {**key, "api14": None, "shllat": None, "shllon": None},
+            {"api14": key["api14"], "shllat": None},
+        ]
+        assert not any(collector.filter(row) for row in rows)
+        collector.skip(rows)
+        add.assert_called_once_with(rows[:1])
+
+    def test_without_tombstones(self, endpoint):
+        FracScheduleCollector(endpoint).skip([{"api14": "42461405550000"}])
@@ -1,6 +1,6 @@
 import pytest  # noqa
 
-from util import hf_size, apply_transformation
+from util import hf_size, apply_transformation, batches, chunks, fuse
 
 
 class TestUtil:
@@ -36,3 +36,78 @@ class TestUtil:
         }
         result = apply_transformation(data, lambda x: str(x).upper())
         assert str(result) == str(expected)
+
+    def test_apply_transformation_keys(self):
+        data = {"a": {"b": [1, 2]}}
+        result = apply_transformation(
+            data, lambda x: str(x).upper(), keys=True, values=False
+        )
+        assert result == {"A": {"B": [1, 2]}}
+
+    def test_apply_transformation_preserves_container_types(self):
+        data = {"list": ["a", ("b", {"c"})], "none": None}
+        result = apply_transformation(data, lambda x: str(x).upper())
+        assert result == {"list": ["A", ("B", {"C"})], "none": None}
+        assert isinstance(result["list"][1], tuple)
+        assert isinstance(result["list"][1][1], set)
+
+    def test_apply_transformation_flat_row(self):
+        data = {"a": "1", "b": 2, "c": None, "d": 1.5}
+        assert apply_transformation(data, str) == {
+            "a": "1",
+            "b": "2",
+            "c": None,
+            "d": "1.5",
+        }
+
+    def test_apply_transformation_deeply_nested(self):
+        data: dict = {}
+        node = data
+        for _ in range(5000):
+            node["k"] = {}
+            node = node["k"]
+        node["k"] = "value"
+        apply_transformation(data, lambda x: x)  # no RecursionError
+
+    def test_apply_transformation_scalar(self):
+        assert apply_transformation("a", str.upper) == "A"
+        assert apply_transformation("a", str.upper, values=False) == "a"
+
+    def test_fuse_matches_sequential_passes(self):
+        to_int = lambda x: int(x) if str(x).isdigit() else x  # noqa
+        to_none = lambda x: None if x == 0 else x  # noqa
+        double = lambda x: x * 2  # noqa
+        data = {"a": "0", "b": ["2", "x"], "c": None}
+        expected = data
+        for func in (to_int, to_none, double):
+            expected = apply_transformation(expected, func)
+        fused = apply_transformation(data, fuse(to_int, to_none, double))
+        assert fused == expected
+
+    def test_chunks_list(self):
+        assert list(chunks([1, 2, 3, 4, 5], 2)) == [[1, 2], [3, 4], [5]]
+
+    def test_chunks_bytes_are_memoryviews(self):
+        result = list(chunks(b"abcde", 2))
+        assert all(isinstance(x, memoryview) for x in result)
+        assert [bytes(x) for x in result] == [b"ab", b"cd", b"e"]
+
+    def test_chunks_iterator(self):
+        result = list(chunks(iter(range(5)), 2))
+        assert result == [[0, 1], [2, 3], [4]]
+
+    def test_chunks_empty(self):
+        assert list(chunks([], 10)) == []
+        assert list(chunks(iter([]), 10)) == []
+
+    def test_chunks_size_floor(self):
+        assert list(chunks([1, 2], 0)) == [[1], [2]]
+
+    def test_batches(self):
+        result = list(batches(iter(range(5)), 2))
+        assert [(b.index, b.offset, b.size) for b in result] == [
+            (0, 0, 2),
+            (1, 2, 2),
+            (2, 4, 1),
+        ]
+        assert result[2].items == [4]
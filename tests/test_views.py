@@ -0,0 +1,103 @@
+from datetime import date
+
+import pytest  # noqa
+from sqlalchemy.dialects import mssql, postgresql
+
+from api.views import (
+    InvalidQueryError,
+    ScheduleQuery,
+    build_query,
+    decode_cursor,
+    encode_cursor,
+    parse_query,
+)
+
+
+def compile_query(query, dialect) -> str:
+    return str(query.statement.compile(dialect=dialect.dialect()))
+
+
+class TestViews:
+    def test_cursor_roundtrip(self):
+        key = ("42461405550000", date(2020, 1, 1), date(2020, 2, 1))
+        assert decode_cursor(encode_cursor(key)) == key
+
+    def test_invalid_cursor(self):
+        with pytest.raises(InvalidQueryError):
+            decode_cursor("not-a-cursor")
+
+    def test_parse_query(self):
+        q = parse_query(
+            {
+                "api10": "4246140555",
+                "start": "2020-01-01",
+                "end": "2020-02-01",
+                "bbox": "-102.5,31,-101.5,32",
+                "limit": "10",
+            }
+        )
+        assert q.api10 == "4246140555"
+        assert q.start == date(2020, 1, 1)
+        assert q.bbox == (-102.5, 31, -101.5, 32)
+        assert q.limit == 10
+        assert q.cursor is None
+
+    @pytest.mark.parametrize(
+        "args",
+        [
+            {"limit": "0"},
+            {"limit": "1000000"},
+            {"limit": "ten"},
+            {"start": "not a date"},
+            {"bbox": "1,2,3"},
+            {"bbox": "1,2,0,3"},
+        ],
+    )
+    def test_parse_query_invalid(self, args):
+        with pytest.raises(InvalidQueryError):
+            parse_query(args)
+
+    def test_keyset_predicate_postgres(self, app):
+        key = ("42461405550000", date(2020, 1, 1), date(2020, 2, 1))
+        with app.app_context():
+            query = build_query(ScheduleQuery(cursor=key), dialect="postgresql")
+            sql = compile_query(query, postgresql)
+        assert "frac_end_date) > (" in sql
+        assert "OFFSET" not in sql.upper()
+
+    def test_keyset_predicate_mssql(self, app):
+        key = ("42461405550000", date(2020, 1, 1), date(2020, 2, 1))
+        with app.app_context():
+            query = build_query(ScheduleQuery(cursor=key), dialect="mssql")
+            sql = compile_query(query, mssql)
+        assert " OR " in sql
+        assert "OFFSET" not in sql.upper()
+
+    def test_list_invalid_query(self, app):
+        response = app.test_client().get("/frac_schedules?limit=0")
+        assert response.status_code == 400
+        assert "error" in response.get_json()
+
+    def test_bbox_uses_geometry_index_on_postgres(self, app):
+        with app.app_context():
+            query = build_query(
+                ScheduleQuery(bbox=(-102.5, 31, -101.5, 32)), dialect="postgresql"
+            )
+            sql = compile_query(query, postgresql)
+        assert "shl && ST_MakeEnvelope" in sql
+
+    def test_bbox_uses_coordinates_on_mssql(self, app):
+        with app.app_context():
+            query = build_query(
+                ScheduleQuery(bbox=(-102.5, 31, -101.5, 32)), dialect="mssql"
+            )
+            sql = compile_query(query, mssql)
+        assert "BETWEEN" in sql
+
+    def test_bbox_seeks_geohash_ranges_on_mssql(self, app):
+        with app.app_context():
+            query = build_query(
+                ScheduleQuery(bbox=(-102.5, 31, -101.5, 32)), dialect="mssql"
+            )
+            sql = compile_query(query, mssql)
+        assert "shl_geohash >=" in sql
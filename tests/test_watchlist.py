@@ -0,0 +1,126 @@
+import pytest  # noqa
+from datetime import date, datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from analysis import watchlist
+from analysis.watchlist import ALERT_COLUMNS, WatchlistIndex, as_utc
+
+RUN_START = datetime(2020, 6, 1, 12, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def watches():
+    yield pd.DataFrame(
+        {
+            "id": [1, 2, 3],
+            "name": ["near", "far", "wide"],
+            "lat": [31.5, 32.5, 31.6],
+            "lon": [-102.0, -103.0, -101.6],
+            "radius": [2.0, 2.0, 50.0],
+        }
+    )
+
+
+@pytest.fixture
+def changes():
+    yield pd.DataFrame(
+        {
+            "api14": ["42000000000001", "42000000000002", "42000000000003"],
+            "operator": ["a", "b", "c"],
+            "wellname": ["w1", "w2", "w3"],
+            "frac_start_date": [date(2020, 7, 1)] * 3,
+            "frac_end_date": [date(2020, 7, 20)] * 3,
+            # 1: shl near watch 1, 2: only its bhl is near watch 1, 3: nowhere near
+            "shllat": [31.51, 31.7, 35.0],
+            "shllon": [-102.0, -102.0, -97.0],
+            "bhllat": [31.55, 31.505, np.nan],
+            "bhllon": [-102.0, -102.0, np.nan],
+            "created_at": [
+                RUN_START,
+                datetime(2020, 1, 1, tzinfo=timezone.utc),
+                RUN_START,
+            ],
+        }
+    )
+
+
+class TestWatchlistIndex:
+    def test_evaluate(self, watches, changes):
+        alerts = WatchlistIndex(watches).evaluate(changes, since=RUN_START)
+        assert list(alerts.columns) == ALERT_COLUMNS
+
+        near = alerts[alerts.watch_id == 1].set_index("api14")
+        assert set(near.index) == {"42000000000001", "42000000000002"}
+        assert near.loc["42000000000001", "reason"] == "new"
+        assert near.loc["42000000000002", "reason"] == "changed"
+        # the nearer of shl and bhl
+        assert near.loc["42000000000002", "distance"] < 0.5
+
+        assert not (alerts.watch_id == 2).any()
+        assert (alerts.watch_id == 3).sum() == 2
+        assert (alerts.distance <= 50).all()
+
+    def test_evaluate_ignores_changes_that_do_not_move(self, watches, changes):
+        # 2 changed its operator, 3 was moved (but is nowhere near a watch)
+        changes["located_at"] = [
+            RUN_START,
+            datetime(2020, 1, 1, tzinfo=timezone.utc),
+            RUN_START,
+        ]
+        alerts = WatchlistIndex(watches).evaluate(changes, since=RUN_START)
+        assert "42000000000002" not in set(alerts.api14)
+        assert set(alerts.reason) == {"new"}
+
+        changes.loc[1, "located_at"] = RUN_START
+        alerts = WatchlistIndex(watches).evaluate(changes, since=RUN_START)
+        near = alerts[alerts.watch_id == 1].set_index("api14")
+        assert near.loc["42000000000002", "reason"] == "changed"
+
+    def test_evaluate_without_since(self, watches, changes):
+        alerts = WatchlistIndex(watches).evaluate(changes)
+        assert (alerts.reason == "changed").all()
+
+    def test_evaluate_no_changes(self, watches, changes):
+        assert WatchlistIndex(watches).evaluate(changes.iloc[:0]).empty
+
+    def test_evaluate_empty_watchlist(self, watches, changes):
+        assert WatchlistIndex(watches.iloc[:0]).evaluate(changes).empty
+
+    def test_as_utc(self):
+        assert as_utc("2020-06-01 12:00") == pd.Timestamp(RUN_START)
+        assert as_utc(RUN_START) == pd.Timestamp(RUN_START)
+
+
+class TestCheck:
+    def test_check_evaluates_only_changes(self, watches, changes, mocker):
+        changed_since = mocker.patch(
+            "api.models.FracSchedule.changed_since",
+            return_value=changes.to_dict(orient="records"),
+        )
+        mocker.patch.object(
+            watchlist.watchlist_cache, "get", return_value=WatchlistIndex(watches)
+        )
+        write = mocker.patch.object(watchlist, "write_alerts")
+
+        alerts = watchlist.check(RUN_START)
+
+        changed_since.assert_called_once()
+        write.assert_called_once()
+        assert len(alerts) == 4
+
+    def test_check_no_changes(self, mocker):
+        mocker.patch("api.models.FracSchedule.changed_since", return_value=[])
+        get = mocker.patch.object(watchlist.watchlist_cache, "get")
+        assert watchlist.check(RUN_START).empty
+        get.assert_not_called()
+
+    def test_write_alerts_native_values(self, watches, changes, mocker):
+        core_insert = mocker.patch("api.models.Alert.core_insert")
+        mocker.patch.object(watchlist.conf, "DATABASE_DRIVER", "postgres")
+        alerts = WatchlistIndex(watches).evaluate(changes, since=RUN_START)
+        assert watchlist.write_alerts(alerts) == len(alerts)
+        records = core_insert.call_args[0][0]
+        assert all(type(r["watch_id"]) is int for r in records)
+        assert all(type(r["distance"]) is float for r in records)